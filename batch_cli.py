@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""Batch kalkulacija iz komandne linije (bez Streamlit-a).
+
+Čita CSV ili JSONL poslove, cenu računa kroz engine.price_jobs u blokovima
+(chunk) i rezultate upisuje odmah, pa memorija ne raste sa veličinom fajla.
+Sa --workers N blokovi se računaju paralelno u N procesa.
+
+    python batch_cli.py jobs.csv -o results.csv --workers 4
+
+Kolone posla: template_width_W, template_height_H, quantity i opciono
+num_colors, is_blank, is_uv_varnish, material ili price_per_m2,
+machine_speed_m_min, tool_type, profit_coefficient, client_name, product_name.
+Cene (boja, lak, rad, alati) se čitaju iz baze (--db), ili fallback vrednosti.
+Sa --save-to-db se ispravni poslovi upisuju i u istoriju (write_behind.py).
+"""
+import argparse
+import collections
+import concurrent.futures
+import csv
+import itertools
+import json
+import os
+import sys
+import time
+import engine
+import db
+import write_behind
+
+BOOL_FIELDS = {"is_blank", "is_uv_varnish"}
+TRUE_VALUES = {"1", "true", "yes", "da", "y"}
+
+_worker_settings = None; _worker_materials = None
+
+
+def parse_job(row):
+    """Normalizuje red iz CSV-a (sve su stringovi) ili JSONL-a u posao za engine."""
+    job = {}
+    for key, value in row.items():
+        if key is None: continue
+        if isinstance(value, str): value = value.strip()
+        if key in BOOL_FIELDS and isinstance(value, str): value = value.lower() in TRUE_VALUES
+        job[key] = value
+    return job
+
+
+def read_jobs(path):
+    """Generator poslova iz CSV ili JSONL fajla ('-' je stdin, format po ekstenziji ili JSONL)."""
+    handle = sys.stdin if path == "-" else open(path, newline="", encoding="utf-8")
+    try:
+        if path.lower().endswith(".csv"):
+            for row in csv.DictReader(handle): yield parse_job(row)
+        else:
+            for line in handle:
+                if line.strip(): yield parse_job(json.loads(line))
+    finally:
+        if handle is not sys.stdin: handle.close()
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk: return
+        yield chunk
+
+
+def _init_worker(settings, materials):
+    global _worker_settings, _worker_materials
+    _worker_settings = settings; _worker_materials = materials
+
+
+def _price_chunk(chunk):
+    return engine.price_jobs(chunk, _worker_settings, _worker_materials)
+
+
+class ResultWriter:
+    """Upisuje rezultate inkrementalno u CSV ili JSONL (zaglavlje CSV-a iz prvog bloka)."""
+
+    def __init__(self, path):
+        self.path = path; self.handle = sys.stdout if path == "-" else open(path, "w", newline="", encoding="utf-8")
+        self.is_csv = path.lower().endswith(".csv"); self.csv_writer = None
+
+    def write(self, records):
+        if self.is_csv:
+            if self.csv_writer is None:
+                fieldnames = list(dict.fromkeys(itertools.chain.from_iterable(records)))
+                self.csv_writer = csv.DictWriter(self.handle, fieldnames=fieldnames, extrasaction="ignore"); self.csv_writer.writeheader()
+            self.csv_writer.writerows(records)
+        else:
+            for record in records: self.handle.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.handle.flush()
+
+    def close(self):
+        if self.handle is not sys.stdout: self.handle.close()
+
+
+def run_batch(input_path, output_path, settings=None, materials=None, chunk_size=1000, workers=1, calculation_writer=None):
+    """Strimuje poslove kroz engine. Vraća (broj poslova, broj grešaka). Redosled izlaza prati ulaz.
+    Sa calculation_writer (write_behind.CalculationWriter) se ispravni poslovi čuvaju i u calculations tabelu."""
+    writer = ResultWriter(output_path); total = 0; failed = 0
+    try:
+        chunks = chunked(read_jobs(input_path), chunk_size)
+        if workers <= 1:
+            results = (engine.price_jobs(chunk, settings, materials) for chunk in chunks)
+        else:
+            results = _parallel_results(chunks, settings, materials, workers)
+        for records in results:
+            writer.write(records); total += len(records); failed += sum(1 for r in records if r.get("error"))
+            if calculation_writer is not None:
+                for record in records:
+                    if not record.get("error"): calculation_writer.submit(db.job_record_to_calculation(record, engine.job_to_params(record, settings, materials)))
+    finally:
+        writer.close()
+    return total, failed
+
+
+def _parallel_results(chunks, settings, materials, workers):
+    """Najviše 2 bloka po procesu su u letu, pa se ulaz ne učitava unapred ceo u memoriju."""
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(settings, materials)) as pool:
+        pending = collections.deque()
+        for chunk in chunks:
+            pending.append(pool.submit(_price_chunk, chunk))
+            if len(pending) >= workers * 2: yield pending.popleft().result()
+        while pending: yield pending.popleft().result()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Batch label pricing (CSV/JSONL in, CSV/JSONL out).")
+    parser.add_argument("input", help="Jobs file (.csv or .jsonl), '-' for stdin (JSONL)")
+    parser.add_argument("-o", "--output", default="-", help="Results file (.csv or .jsonl), default stdout (JSONL)")
+    parser.add_argument("--db", default=None, help=f"SQLite database with settings/materials (default {db.DB_FILE})")
+    parser.add_argument("--no-db", action="store_true", help="Use fallback prices only, do not open the database")
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes (0 = all cores)")
+    parser.add_argument("--save-to-db", action="store_true", help="Also save every priced job to the calculations history (batched writes)")
+    args = parser.parse_args(argv)
+    if args.save_to_db and args.no_db: parser.error("--save-to-db needs the database (drop --no-db)")
+    settings = {}; materials = {}; calculation_writer = None
+    if not args.no_db:
+        if args.db: db.DB_FILE = args.db
+        if not os.path.exists(db.DB_FILE): parser.error(f"Database not found: {db.DB_FILE} (use --no-db for fallback prices)")
+        settings = db.load_settings_from_db() or {}; materials = db.load_materials_from_db() or {}
+        if args.save_to_db:
+            if not db.init_db(): parser.error(f"Could not migrate database: {db.DB_FILE}")
+            calculation_writer = write_behind.get_calculation_writer()
+    workers = args.workers if args.workers > 0 else (os.cpu_count() or 1)
+    start = time.perf_counter()
+    failed_before = calculation_writer.failed if calculation_writer is not None else 0
+    total, failed = run_batch(args.input, args.output, settings, materials, chunk_size=max(1, args.chunk_size), workers=workers, calculation_writer=calculation_writer)
+    if calculation_writer is not None:
+        # Blokovi upisani automatski iz submit() mogu da ne uspeju ranije; failed se sabira za sve blokove
+        calculation_writer.drain(); lost = calculation_writer.failed - failed_before
+        if lost: print(f"Error saving calculations to DB: {lost} not saved, last error: {calculation_writer.last_error}", file=sys.stderr); return 1
+    elapsed = time.perf_counter() - start
+    saved = f", {calculation_writer.written} saved in {calculation_writer.batches} transactions" if calculation_writer is not None else ""
+    print(f"Priced {total} jobs ({failed} with errors{saved}) in {elapsed:.2f} s ({total / elapsed if elapsed > 0 else 0:,.0f} jobs/s)", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
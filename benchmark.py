@@ -0,0 +1,446 @@
+# -*- coding: utf-8 -*-
+"""Benchmark suite za vruće putanje: cilindar, kalkulacija, PDF i baza (radi offline).
+
+Svaki benchmark meri vreme po operaciji (medijana i minimum preko više rundi) na
+fiksnim, determinističkim ulazima. Baza se pravi u privremenom direktorijumu, pa
+se print_calculator.db ne dira. Rezultati se upisuju kao JSON; uz --baseline se
+porede sa sačuvanim baseline-om i izlazni kod je 1 ako je neki benchmark sporiji
+od baseline-a za više od --threshold (npr. 0.25 = 25%).
+
+    python benchmark.py --save-baseline benchmark_baseline.json
+    python benchmark.py --baseline benchmark_baseline.json --threshold 0.25
+    python benchmark.py --only pdf --quick
+    python benchmark.py --memory
+    python benchmark.py --startup -o startup.json
+    python benchmark.py --verify
+
+--memory umesto vremena meri memoriju po scenariju (tracemalloc) za istu
+mrežu scenarija čuvanu kao rečnici, CalculationResult ili structured niz.
+
+--startup meri hladan start u novom procesu (medijana STARTUP_ROUNDS pokretanja):
+import engine/db/modula UI-ja i prvi prikaz kalkulacije.py (AppTest, bez servera)
+nad privremenom bazom. Izlazni kod je 1 ako je neko merenje iznad STARTUP_BUDGET_MS
+ili ako se neki od STARTUP_LAZY_MODULES (pandas, ReportLab) učita pre prve upotrebe.
+
+--verify ne meri vreme nego proverava da sve kopije formule (graf faza,
+run_batch_calculation, price_jobs) daju isti rezultat kao run_single_calculation na
+seeded scenarijima (uključujući ivične slučajeve). Izlazni kod je 1 ako se neki
+scenario razlikuje.
+"""
+import argparse
+import datetime
+import fnmatch
+import json
+import math
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import numpy as np
+import engine
+import db
+import write_behind
+import layout_optimizer
+import stage_graph
+
+DEFAULT_THRESHOLD = 0.25
+MEMORY_SCENARIOS = 20000
+SEED = 12345
+BASE_JOB = {"client_name": "Benchmark d.o.o.", "product_name": "Label 50x40", "template_width_W": 50.0, "template_height_H": 40.0, "quantity": 10000, "num_colors": 4, "is_blank": False, "is_uv_varnish": True, "price_per_m2": 49.35, "tool_type": "Rotary", "profit_coefficient": 0.25}
+
+BENCHMARKS = {}
+
+VERIFY_SCENARIOS = 5000
+VERIFY_EDGE_SHARE = 0.15 # Udeo ivičnih vrednosti po parametru
+VERIFY_TOOL_KEYS = engine.TOOL_TYPES + ["Laser"] # "Laser" je nepoznat ključ: računa se kao bez alata
+VERIFY_MAX_REPORTED = 10
+VERIFY_RTOL = 1e-9; VERIFY_ATOL = 1e-9 # NumPy i skalarni Python mogu da se razlikuju u poslednjim bitovima
+STARTUP_ROUNDS = 3
+STARTUP_BUDGET_MS = {"import engine": 250, "import db": 250, "import ui modules": 350, "first render": 1000}
+STARTUP_IMPORTS = {"import engine": "engine", "import db": "db", "import ui modules": "engine, db, diagnostics, bulk_offers, scheduler, layout_optimizer, stage_graph, write_behind, settings_cache"}
+STARTUP_LAZY_MODULES = ("pandas", "reportlab")
+STARTUP_TOP_IMPORTS = 5
+_STARTUP_MARKER = "--- startup probe ---"
+_STARTUP_PROBE = """
+import json, sys, time
+lazy = {lazy!r}
+if {script!r}: from streamlit.testing.v1 import AppTest; app = AppTest.from_file({script!r}, default_timeout=300)
+sys.stderr.write({marker!r} + "\\n"); sys.stderr.flush(); start = time.perf_counter()
+if {script!r}:
+    app.run()
+    errors = [str(element.value) for element in app.exception]
+else: import {modules}; errors = []
+print(json.dumps({{"ms": (time.perf_counter() - start) * 1000.0, "loaded": [name for name in lazy if name in sys.modules], "errors": errors}}))
+"""
+
+
+def benchmark(name, ops=1):
+    """Registruje benchmark. Funkcija prima quick i vraća callable koji izvede `ops` operacija."""
+    def register(setup): BENCHMARKS[name] = (setup, ops); return setup
+    return register
+
+
+def _random_widths(count, rng):
+    return np.round(rng.uniform(10.0, 200.0, count), 2)
+
+
+def _calc_data():
+    """calculation_data_for_db kao u UI-ju, za create_pdf i upis u bazu."""
+    params = engine.job_to_params(BASE_JOB); solution, _, _ = engine.find_cylinder_specifications(params["template_width_W"])
+    lanes = engine.calculate_number_across_width(params["template_height_H"], engine.WORKING_WIDTH, engine.WIDTH_GAP)
+    result = engine.run_single_calculation(best_circumference_solution=solution, number_across_width_y=lanes, **params)
+    return { "client_name": BASE_JOB["client_name"], "product_name": BASE_JOB["product_name"], "template_width_W_input": params["template_width_W"], "template_height_H_input": params["template_height_H"], "quantity_input": params["quantity"], "is_blank": params["is_blank"], "valid_num_colors_for_calc": params["num_colors"], "is_uv_varnish_input": params["is_uv_varnish"], "selected_material": "Thermal Paper", "tool_info_string": params["selected_tool_key"], "machine_speed_m_min": params["machine_speed_m_min"], "best_circumference_solution": solution, "gap_G_circumference_mm": solution["gap_G_circumference_mm"], "number_circumference_x": solution["templates_N_circumference"], "number_across_width_y": lanes, **result }
+
+
+def _offer_data():
+    params = engine.job_to_params(BASE_JOB)
+    specifications = engine.offer_specifications(params["template_width_W"], params["template_height_H"], "Thermal Paper", params["is_blank"], params["num_colors"], params["is_uv_varnish"], params["selected_tool_key"])
+    return {"client_name": BASE_JOB["client_name"], "product_name": BASE_JOB["product_name"], "specifications": specifications, "offer_results": [{"Količina (kom)": qty, "Cena/kom (RSD)": 1.2345, "Ukupno (RSD)": qty * 1.2345} for qty in engine.QUANTITIES_FOR_OFFER]}
+
+
+# --- Cilindar ---
+@benchmark("cylinder.single_width_sweep", ops=500)
+def bench_cylinder_single(quick):
+    widths = _random_widths(500, np.random.default_rng(SEED)).tolist()
+    return lambda: [engine.find_cylinder_specifications(w) for w in widths]
+
+@benchmark("cylinder.batch_10k", ops=10000)
+def bench_cylinder_batch(quick):
+    widths = _random_widths(10000, np.random.default_rng(SEED))
+    return lambda: engine.find_cylinder_specifications_many(widths)
+
+
+# --- Kalkulacija ---
+@benchmark("pricing.single", ops=1000)
+def bench_pricing_single(quick):
+    params = engine.job_to_params(BASE_JOB); solution, _, _ = engine.find_cylinder_specifications(params["template_width_W"])
+    lanes = engine.calculate_number_across_width(params["template_height_H"], engine.WORKING_WIDTH, engine.WIDTH_GAP)
+    return lambda: [engine.run_single_calculation(best_circumference_solution=solution, number_across_width_y=lanes, **params) for _ in range(1000)]
+
+@benchmark("pricing.batch_10k", ops=10000)
+def bench_pricing_batch(quick):
+    rng = np.random.default_rng(SEED); widths = _random_widths(10000, rng)
+    cylinders = engine.find_cylinder_specifications_many(widths); heights = np.round(rng.uniform(10.0, 150.0, widths.size), 2)
+    params = engine.job_to_params(BASE_JOB); params.update(quantity=rng.integers(1000, 100000, widths.size), template_width_W=widths, template_height_H=heights, num_colors=rng.integers(1, 8, widths.size))
+    lanes = engine.calculate_number_across_width_many(heights, engine.WORKING_WIDTH, engine.WIDTH_GAP)
+    return lambda: engine.run_batch_calculation(gap_G_circumference_mm=cylinders["gap_G_circumference_mm"], number_across_width_y=lanes, **params)
+
+@benchmark("pricing.price_jobs_1k", ops=1000)
+def bench_price_jobs(quick):
+    rng = np.random.default_rng(SEED)
+    jobs = [dict(BASE_JOB, template_width_W=float(w), quantity=int(q)) for w, q in zip(_random_widths(1000, rng), rng.integers(1000, 100000, 1000))]
+    return lambda: engine.price_jobs(jobs)
+
+@benchmark("pricing.layout_optimizer", ops=100)
+def bench_layout_optimizer(quick):
+    rng = np.random.default_rng(SEED); params_list = [dict(engine.job_to_params(dict(BASE_JOB, template_width_W=float(w), template_height_H=float(h)))) for w, h in zip(np.round(rng.uniform(10.0, 180.0, 100), 2), np.round(rng.uniform(10.0, 180.0, 100), 2))]
+    return lambda: [layout_optimizer.optimize_layout(params, top=5) for params in params_list]
+
+
+# --- PDF ---
+@benchmark("pdf.calc")
+def bench_pdf_calc(quick):
+    data = _calc_data(); return lambda: engine.create_pdf(data)
+
+@benchmark("pdf.offer")
+def bench_pdf_offer(quick):
+    data = _offer_data(); return lambda: engine.create_offer_pdf(data)
+
+@benchmark("pdf.offer_cached", ops=100)
+def bench_pdf_offer_cached(quick):
+    data = _offer_data(); engine.render_pdf_cached("offer", data)
+    return lambda: [engine.render_pdf_cached("offer", data) for _ in range(100)]
+
+
+# --- Baza (privremeni fajl, ne print_calculator.db) ---
+@benchmark("db.load_settings_materials", ops=100)
+def bench_db_load(quick):
+    return lambda: [(db.load_settings_from_db(), db.load_materials_from_db()) for _ in range(50)]
+
+@benchmark("db.save_calculation", ops=50)
+def bench_db_save(quick):
+    data = _calc_data(); return lambda: [db.save_calculation_to_db(data) for _ in range(50)]
+
+@benchmark("db.save_calculation_write_behind", ops=500)
+def bench_db_save_batched(quick):
+    """Isti upis kao db.save_calculation, ali kroz write_behind red (jedna transakcija po bloku)."""
+    data = _calc_data(); writer = write_behind.CalculationWriter(batch_size=500)
+    def run():
+        for _ in range(500): writer.submit(data)
+        writer.flush()
+    return run
+
+@benchmark("db.history_page", ops=50)
+def bench_db_history(quick):
+    _seed_history(2000 if quick else 20000)
+    def run():
+        cursor = None
+        for _ in range(50): rows, cursor = db.load_history_page(before=cursor, page_size=25)
+    return run
+
+@benchmark("db.read_under_4_writers", ops=200)
+def bench_db_concurrent(quick):
+    """Čitanja podešavanja dok 4 niti istovremeno upisuju kalkulacije (WAL: čitaoci ne čekaju pisce)."""
+    data = _calc_data()
+    def run():
+        stop = threading.Event()
+        def writer():
+            while not stop.is_set(): db.save_calculation_to_db(data)
+        writers = [threading.Thread(target=writer, daemon=True) for _ in range(4)]
+        for thread in writers: thread.start()
+        try:
+            for _ in range(200): db.load_settings_from_db()
+        finally:
+            stop.set()
+            for thread in writers: thread.join()
+    return run
+
+
+def _seed_history(count):
+    rows = db.calculation_to_row(_calc_data())
+    with db.pooled_connection() as conn:
+        conn.executemany(db.SQL_INSERT_CALCULATION, [rows] * count); conn.commit()
+
+
+def run_benchmark(name, quick=False, rounds=None):
+    """Vraća rečnik sa vremenom po operaciji (medijana, minimum) za jedan benchmark."""
+    setup, ops = BENCHMARKS[name]; func = setup(quick); rounds = rounds or (3 if quick else 7)
+    func() # Zagrevanje: keševi, indeks cilindra, stilovi PDF-a, konekcije
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter(); func(); samples.append((time.perf_counter() - start) / ops)
+    return {"per_op_s": statistics.median(samples), "min_per_op_s": min(samples), "ops": ops, "rounds": rounds}
+
+
+def run_suite(patterns=None, quick=False, db_dir=None):
+    """Pokreće sve (ili filtrirane) benchmark-e nad privremenom bazom. Vraća rezultat spreman za JSON."""
+    names = [name for name in BENCHMARKS if not patterns or any(fnmatch.fnmatch(name, p) or p in name for p in patterns)]
+    previous_db = db.DB_FILE; results = {}
+    with tempfile.TemporaryDirectory(dir=db_dir) as tmp:
+        db.DB_FILE = os.path.join(tmp, "benchmark.db")
+        try:
+            if not db.init_db(): raise RuntimeError(f"Could not initialize benchmark database {db.DB_FILE}")
+            for name in names:
+                results[name] = run_benchmark(name, quick); print(f"{name:32s} {_format_seconds(results[name]['per_op_s']):>12s}/op", file=sys.stderr)
+        finally:
+            db.close_all_connections(); db.DB_FILE = previous_db
+    meta = {"created": datetime.datetime.now().isoformat(timespec="seconds"), "python": platform.python_version(), "numpy": np.__version__, "platform": platform.platform(), "processor": platform.processor() or platform.machine(), "cpu_count": os.cpu_count(), "quick": quick}
+    return {"meta": meta, "results": results}
+
+
+def compare(current, baseline, threshold=DEFAULT_THRESHOLD):
+    """Poredi medijane sa baseline-om. Vraća listu (ime, baseline s, trenutno s, odnos, regresija)."""
+    rows = []
+    for name, result in current["results"].items():
+        base = baseline.get("results", {}).get(name)
+        if not base: continue
+        ratio = result["per_op_s"] / base["per_op_s"] if base["per_op_s"] > 0 else float("inf")
+        rows.append((name, base["per_op_s"], result["per_op_s"], ratio, ratio > 1.0 + threshold))
+    return rows
+
+
+def _allocated_bytes(build):
+    """Bajtovi koje zauzima rezultat build() (tracemalloc, rezultat se drži dok se meri)."""
+    tracemalloc.start()
+    try: before = tracemalloc.get_traced_memory()[0]; result = build(); allocated = tracemalloc.get_traced_memory()[0] - before
+    finally: tracemalloc.stop()
+    del result; return allocated
+
+
+def memory_report(count=MEMORY_SCENARIOS):
+    """Bajtovi po scenariju za mrežu od count kalkulacija (različite količine) u tri oblika:
+    rečnik po pozivu (ranije), CalculationResult (__slots__) i RESULT_DTYPE structured niz iz batch-a."""
+    params = engine.job_to_params(BASE_JOB); solution, _, _ = engine.find_cylinder_specifications(params["template_width_W"])
+    lanes = engine.calculate_number_across_width(params["template_height_H"], engine.WORKING_WIDTH, engine.WIDTH_GAP)
+    quantities = [1000 + 7 * i for i in range(count)]; single = dict(params, best_circumference_solution=solution, number_across_width_y=lanes)
+    batch_params = dict(params, quantity=np.array(quantities), gap_G_circumference_mm=solution["gap_G_circumference_mm"], number_across_width_y=lanes)
+    layouts = {
+        "dict": lambda: [engine.run_single_calculation(**dict(single, quantity=q)).to_dict() for q in quantities],
+        "slots": lambda: [engine.run_single_calculation(**dict(single, quantity=q)) for q in quantities],
+        "structured_array": lambda: engine.batch_to_records(engine.run_batch_calculation(**batch_params)),
+    }
+    return {name: {"scenarios": count, "bytes_per_scenario": _allocated_bytes(build) / count} for name, build in layouts.items()}
+
+
+def _verify_scenarios(count, seed=SEED):
+    """Seeded argumenti za run_single_calculation (bez cilindra i traka). Svaki parametar u VERIFY_EDGE_SHARE slučajeva
+    dobija ivičnu vrednost: širinu bez cilindra, visinu bez trake, količinu 0, brzinu 0, negativnu cenu/koeficijent."""
+    rng = np.random.default_rng(seed); scenarios = []
+    def pick(edges, value): return edges[int(rng.integers(len(edges)))] if rng.random() < VERIFY_EDGE_SHARE else value
+    for _ in range(count):
+        scenario = { "quantity": pick([0, 1], int(rng.integers(100, 200000))), "template_width_W": pick([-5.0, 0.0, 0.5, 1000.0], round(float(rng.uniform(5.0, 450.0)), 2)), "template_height_H": pick([-5.0, 0.0, engine.WORKING_WIDTH, 250.0], round(float(rng.uniform(5.0, 200.0)), 2)), "is_blank": bool(rng.random() < 0.1), "num_colors": pick([0], int(rng.integers(0, 9))), "is_uv_varnish": bool(rng.random() < 0.5), "price_per_m2": pick([0.0, -1.0], round(float(rng.uniform(10.0, 120.0)), 2)), "machine_speed_m_min": pick([0.0], float(rng.integers(engine.MACHINE_SPEED_MIN, engine.MACHINE_SPEED_MAX + 1))), "selected_tool_key": VERIFY_TOOL_KEYS[int(rng.integers(len(VERIFY_TOOL_KEYS)))], "existing_tool_info": "", "profit_coefficient": pick([0.0, -0.1], round(float(rng.uniform(0.0, 0.5)), 3)) }
+        for arg, price in engine.prices_from_settings({}).items(): scenario[arg] = pick([0.0, -1.0], price)
+        scenarios.append(scenario)
+    return scenarios
+
+
+def _differences(expected, actual):
+    """Ključevi (sa vrednostima) u kojima se dva rezultata razlikuju; ključ koji postoji samo u jednom je razlika."""
+    return [(key, expected.get(key), actual.get(key)) for key in sorted(set(expected) | set(actual)) if key not in expected or key not in actual or expected[key] != actual[key]]
+
+
+def _batch_expected(expected):
+    """Očekivani red batch rezultata: isto što i run_single_calculation, a za red sa greškom nule (kao u run_batch_calculation)."""
+    if "error" in expected: return {key: False if key == "material_width_exceeded" else 0.0 for key in engine.BATCH_RESULT_KEYS}
+    return {key: expected[key] for key in engine.BATCH_RESULT_KEYS}
+
+
+def _batch_differences(expected, row):
+    """Kao _differences, ali za BATCH_RESULT_KEYS i uz toleranciju VERIFY_RTOL/VERIFY_ATOL."""
+    def close(want, got): return want == got or (not isinstance(want, bool) and not isinstance(got, bool) and math.isclose(want, got, rel_tol=VERIFY_RTOL, abs_tol=VERIFY_ATOL))
+    return [(key, expected[key], row[key]) for key in engine.BATCH_RESULT_KEYS if not close(expected[key], row[key])]
+
+
+def _job(scenario):
+    """Scenario kao posao za price_jobs (cene iz podrazumevanih podešavanja, tool_type umesto selected_tool_key)."""
+    return dict({key: scenario[key] for key in ("quantity", "template_width_W", "template_height_H", "is_blank", "num_colors", "is_uv_varnish", "price_per_m2", "machine_speed_m_min", "profit_coefficient")}, tool_type=scenario["selected_tool_key"])
+
+
+def verify_report(count=VERIFY_SCENARIOS, seed=SEED):
+    """Poredi sa run_single_calculation: calculation_graph() (jedan graf za sve scenarije, pa se proverava i
+    memoizacija), run_batch_calculation (svi scenariji u jednom pozivu, cilindar i trake računa sam) i
+    price_jobs (posao -> job_to_params -> run_single_calculation; neispravan posao mora da dobije 'error').
+    Vraća {"scenarios", "checked": {provera: broj}, "failed": {provera: broj}, "mismatches": {provera: [poruke]}}."""
+    scenarios = _verify_scenarios(count, seed); graph = stage_graph.calculation_graph()
+    batch = engine.run_batch_calculation(**{key: [scenario[key] for scenario in scenarios] for key in scenarios[0]})
+    jobs = [_job(scenario) for scenario in scenarios]; priced = engine.price_jobs(jobs)
+    checked = {"stage_graph": 0, "run_batch_calculation": 0, "price_jobs": 0}; mismatches = {name: [] for name in checked}; failed = {name: 0 for name in checked}
+    def report(check, index, message):
+        failed[check] += 1
+        if len(mismatches[check]) < VERIFY_MAX_REPORTED: mismatches[check].append(f"scenario {index}: {message} ({scenarios[index]})")
+    for index, scenario in enumerate(scenarios):
+        solution, _, _ = engine.find_cylinder_specifications(scenario["template_width_W"]); lanes = engine.calculate_number_across_width(scenario["template_height_H"], engine.WORKING_WIDTH, engine.WIDTH_GAP)
+        expected = engine.run_single_calculation(best_circumference_solution=solution, number_across_width_y=lanes, **scenario).to_dict()
+        values = graph.evaluate(**scenario); checked["stage_graph"] += 1
+        if values["cylinder"][0] != solution or values["lanes"] != lanes: report("stage_graph", index, f"cylinder/lanes {values['cylinder'][0]}/{values['lanes']} != {solution}/{lanes}")
+        elif _differences(expected, values["result"].to_dict()): report("stage_graph", index, ", ".join(f"{key}: {want!r} != {got!r}" for key, want, got in _differences(expected, values["result"].to_dict())[:3]))
+        row = {key: batch[key][index].item() for key in engine.BATCH_RESULT_KEYS}; checked["run_batch_calculation"] += 1
+        if bool(batch["valid"][index]) != ("error" not in expected): report("run_batch_calculation", index, f"valid={bool(batch['valid'][index])} but run_single_calculation error={expected.get('error')!r}")
+        elif _batch_differences(_batch_expected(expected), row): report("run_batch_calculation", index, ", ".join(f"{key}: {want!r} != {got!r}" for key, want, got in _batch_differences(_batch_expected(expected), row)[:3]))
+        checked["price_jobs"] += 1
+        try: params = engine.job_to_params(jobs[index])
+        except ValueError as e: # Npr. nepoznat ključ alata: posao se odbija umesto da se računa bez alata
+            if priced[index]["error"] != str(e): report("price_jobs", index, f"error {priced[index]['error']!r} != {str(e)!r}")
+            continue
+        solution, _, _ = engine.find_cylinder_specifications(params["template_width_W"]); lanes = engine.calculate_number_across_width(params["template_height_H"], engine.WORKING_WIDTH, engine.WIDTH_GAP)
+        job_expected = engine.run_single_calculation(best_circumference_solution=solution, number_across_width_y=lanes, **params).to_dict()
+        if (priced[index]["error"] is None) != ("error" not in job_expected): report("price_jobs", index, f"error {priced[index]['error']!r} but run_single_calculation error={job_expected.get('error')!r}")
+        elif _batch_differences(_batch_expected(job_expected), priced[index]): report("price_jobs", index, ", ".join(f"{key}: {want!r} != {got!r}" for key, want, got in _batch_differences(_batch_expected(job_expected), priced[index])[:3]))
+    return {"scenarios": count, "checked": checked, "failed": failed, "mismatches": mismatches}
+
+
+def _startup_probe(modules=None, script=None, db_path=None):
+    """Jedno merenje u novom procesu: import modules ili prvi prikaz script-a. Vraća (rezultat, stderr)."""
+    code = _STARTUP_PROBE.format(lazy=STARTUP_LAZY_MODULES, script=script, modules=modules or "sys", marker=_STARTUP_MARKER)
+    here = os.path.dirname(os.path.abspath(__file__)); env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [here, os.environ.get("PYTHONPATH")])))
+    if db_path: env["PRINT_CALCULATOR_DB"] = db_path
+    process = subprocess.run([sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True, env=env, cwd=here)
+    if process.returncode != 0: raise RuntimeError(f"Startup probe failed: {process.stderr.strip()[-2000:]}")
+    return json.loads(process.stdout.strip().splitlines()[-1]), process.stderr
+
+
+def _top_imports(importtime_log, count=STARTUP_TOP_IMPORTS):
+    """Najsporiji importi prvog nivoa iz -X importtime izlaza, posle početka merenja: lista (modul, ms kumulativno)."""
+    rows = []
+    for line in importtime_log.partition(_STARTUP_MARKER)[2].splitlines():
+        parts = line.split("|")
+        if len(parts) == 3 and line.startswith("import time:") and not parts[2].startswith("  ") and parts[1].strip().isdigit(): rows.append((parts[2].strip(), int(parts[1]) / 1000.0))
+    return sorted(rows, key=lambda row: -row[1])[:count]
+
+
+def startup_report(rounds=STARTUP_ROUNDS, db_dir=None):
+    """Medijana vremena importa i prvog prikaza UI-ja (ms), učitani lenji moduli i najsporiji importi."""
+    report = {}
+    with tempfile.TemporaryDirectory(dir=db_dir) as tmp:
+        db_path = os.path.join(tmp, "startup.db"); previous_db = db.DB_FILE; db.DB_FILE = db_path
+        try: # Migracije su već urađene, kao pri restartu aplikacije nad postojećom bazom
+            if not db.init_db(): raise RuntimeError(f"Could not initialize startup database {db_path}")
+        finally: db.close_all_connections(); db.DB_FILE = previous_db
+        probes = {name: {"modules": modules} for name, modules in STARTUP_IMPORTS.items()}
+        probes["first render"] = {"script": os.path.join(os.path.dirname(os.path.abspath(__file__)), "kalkulacije.py"), "db_path": db_path}
+        for name, probe in probes.items():
+            samples = []; loaded = set(); errors = []; log = ""
+            for _ in range(rounds):
+                result, log = _startup_probe(**probe); samples.append(result["ms"]); loaded.update(result["loaded"]); errors += result["errors"]
+            report[name] = {"median_ms": statistics.median(samples), "min_ms": min(samples), "budget_ms": STARTUP_BUDGET_MS.get(name), "lazy_loaded": sorted(loaded), "errors": errors, "top_imports": _top_imports(log)}
+    return report
+
+
+def startup_violations(report):
+    """Poruke za merenja iznad budžeta, prerano učitane lenje module i greške pri prikazu."""
+    messages = []
+    for name, row in report.items():
+        if row["budget_ms"] is not None and row["median_ms"] > row["budget_ms"]: messages.append(f"{name}: {row['median_ms']:.0f} ms is over the {row['budget_ms']} ms budget")
+        if row["lazy_loaded"]: messages.append(f"{name}: loads {', '.join(row['lazy_loaded'])} before first use")
+        if row["errors"]: messages.append(f"{name}: {row['errors'][0]}")
+    return messages
+
+
+def _format_seconds(seconds):
+    for unit, scale in (("s", 1.0), ("ms", 1e-3), ("µs", 1e-6)):
+        if seconds >= scale: return f"{seconds / scale:.2f} {unit}"
+    return f"{seconds / 1e-9:.0f} ns"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmarks for cylinder search, pricing, PDF rendering and the database.")
+    parser.add_argument("--only", action="append", help="Run benchmarks whose name contains/matches this pattern (repeatable)")
+    parser.add_argument("--quick", action="store_true", help="Fewer rounds and smaller seeded data (for a fast check)")
+    parser.add_argument("-o", "--output", default=None, help="Write results JSON to this file")
+    parser.add_argument("--save-baseline", metavar="PATH", default=None, help="Write results as the new baseline")
+    parser.add_argument("--baseline", metavar="PATH", default=None, help="Compare against this baseline, exit 1 on regression")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help=f"Allowed slowdown vs baseline (default {DEFAULT_THRESHOLD} = {DEFAULT_THRESHOLD:.0%}%)") # %% jer argparse formatira help
+    parser.add_argument("--list", action="store_true", help="List benchmark names and exit")
+    parser.add_argument("--memory", action="store_true", help="Measure bytes per stored scenario (dict vs slots vs structured array) instead of timings")
+    parser.add_argument("--verify", action="store_true", help="Check that the stage graph and batch pricing match run_single_calculation on seeded scenarios, exit 1 on any mismatch")
+    parser.add_argument("--startup", action="store_true", help="Measure cold import and first UI render in fresh processes, exit 1 if over STARTUP_BUDGET_MS")
+    args = parser.parse_args(argv)
+    if args.list:
+        for name in BENCHMARKS: print(name)
+        return 0
+    if args.memory:
+        report = memory_report(MEMORY_SCENARIOS // 10 if args.quick else MEMORY_SCENARIOS); base = report["dict"]["bytes_per_scenario"]
+        for name, row in report.items(): print(f"{name:20s} {row['bytes_per_scenario']:10,.0f} B/scenario  ({row['bytes_per_scenario'] / base:.0%} of dict)")
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as handle: json.dump({"memory": report}, handle, indent=2); handle.write("\n")
+        return 0
+    if args.verify:
+        report = verify_report(VERIFY_SCENARIOS // 10 if args.quick else VERIFY_SCENARIOS)
+        for name, total in report["checked"].items(): print(f"{name:22s} {total:6d} checked  {report['failed'][name]:6d} mismatched")
+        for name, messages in report["mismatches"].items():
+            for message in messages: print(f"MISMATCH {name}: {message}", file=sys.stderr)
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as handle: json.dump({"verify": report}, handle, indent=2, ensure_ascii=False); handle.write("\n")
+        return 1 if any(report["failed"].values()) else 0
+    if args.startup:
+        report = startup_report(1 if args.quick else STARTUP_ROUNDS)
+        for name, row in report.items():
+            print(f"{name:20s} {row['median_ms']:8.1f} ms  (budget {row['budget_ms']} ms)  slowest: {', '.join(f'{module} {ms:.0f} ms' for module, ms in row['top_imports'][:3])}")
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as handle: json.dump({"startup": report}, handle, indent=2); handle.write("\n")
+        violations = startup_violations(report)
+        for message in violations: print(f"STARTUP REGRESSION: {message}", file=sys.stderr)
+        return 1 if violations else 0
+    current = run_suite(args.only, quick=args.quick)
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w", encoding="utf-8") as handle: json.dump(current, handle, indent=2, ensure_ascii=False); handle.write("\n")
+    if not args.baseline: return 0
+    with open(args.baseline, encoding="utf-8") as handle: baseline = json.load(handle)
+    if baseline.get("meta", {}).get("quick") != current["meta"]["quick"]: print("Warning: baseline and current run differ in --quick, numbers are not directly comparable", file=sys.stderr)
+    rows = compare(current, baseline, args.threshold); regressions = [row for row in rows if row[4]]
+    print(f"\n{'benchmark':32s} {'baseline':>12s} {'current':>12s} {'ratio':>7s}")
+    for name, base_s, current_s, ratio, regressed in rows: print(f"{name:32s} {_format_seconds(base_s):>12s} {_format_seconds(current_s):>12s} {ratio:7.2f}{'  REGRESSION' if regressed else ''}")
+    missing = sorted(set(current["results"]) - {row[0] for row in rows})
+    if missing: print(f"No baseline for: {', '.join(missing)}")
+    if regressions: print(f"\n{len(regressions)} benchmark(s) slower than baseline by more than {args.threshold:.0%}", file=sys.stderr); return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+"""Masovna izrada ponuda (PDF) za ceo katalog proizvoda, spakovanih u jedan ZIP.
+
+Proizvodi dolaze iz CSV/JSONL fajla (kolone kao u batch_cli.py, bez quantity)
+ili iz calculations tabele (poslednja kalkulacija po klijentu i proizvodu).
+Cene za celu lestvicu količina (QUANTITIES_FOR_OFFER) računaju se jednim batch
+prolazom po bloku proizvoda, PDF-ovi se renderuju u N procesa, a svaki gotov
+PDF se odmah upisuje u ZIP, pa je u memoriji najviše 2 PDF-a po procesu.
+Procesi radnici se pokreću preko forkserver-a (ili spawn), a ne fork-om, jer
+UI poziva write_offers_zip iz Streamlit servera koji ima više niti.
+
+    python bulk_offers.py products.csv -o offers.zip --workers 4
+    python bulk_offers.py --from-history -o offers.zip --timings timings.csv
+"""
+import argparse
+import atexit
+import collections
+import concurrent.futures
+import csv
+import io
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+import engine
+import db
+import diagnostics
+import scheduler
+from batch_cli import read_jobs, parse_job, chunked
+
+WORKER_START_METHODS = ("forkserver", "spawn") # Prvi dostupan; fork iz procesa sa nitima može da zaglavi radnika
+TEMP_ZIP_PREFIX = "offers_"
+
+
+def safe_filename_part(text, default):
+    return "".join(c if c.isalnum() else "_" for c in text) if text else default
+
+
+def read_products_csv(text):
+    """Proizvodi iz CSV teksta (npr. fajl otpremljen kroz UI)."""
+    return [parse_job(row) for row in csv.DictReader(io.StringIO(text))]
+
+
+def offer_filename(product, used_names):
+    """Offer_<proizvod>_<klijent>.pdf, sa rednim brojem ako se ime ponavlja."""
+    base = f"Offer_{safe_filename_part(product.get('product_name'), 'product')}_{safe_filename_part(product.get('client_name'), 'client')}"
+    count = used_names[base] = used_names.get(base, 0) + 1
+    return f"{base}.pdf" if count == 1 else f"{base}_{count}.pdf"
+
+
+def price_offer_ladders(products, settings=None, materials=None, quantities=engine.QUANTITIES_FOR_OFFER, board=None):
+    """Računa lestvicu količina za sve proizvode jednim batch pozivom. Sa board-om (scheduler.PressBoard) svaka
+    količina dobija i rok isporuke. Vraća listu (proizvod, offer_pdf_data ili None, greška) istim redom kao products."""
+    coefficients = engine.offer_profit_coefficients(settings, quantities); ladder = len(quantities)
+    jobs = [dict(product, quantity=qty, profit_coefficient=coeff) for product in products for qty, coeff in zip(quantities, coefficients)]
+    records = engine.price_jobs(jobs, settings, materials); output = []
+    for i, product in enumerate(products):
+        rows = records[i * ladder:(i + 1) * ladder]
+        offer_results = [{"Količina (kom)": r["quantity"], "Cena/kom (RSD)": r["selling_price_per_piece_rsd"], "Ukupno (RSD)": r["total_selling_price_rsd"]} for r in rows if not r["error"]]
+        if board is not None:
+            for row, delivery in zip(offer_results, scheduler.delivery_dates(board, [r["total_time_min"] for r in rows if not r["error"]])): row[engine.OFFER_DELIVERY_KEY] = delivery
+        if not offer_results: output.append((product, None, rows[0]["error"] if rows else "Empty quantity ladder")); continue
+        try: num_colors = int(product.get("num_colors") or 1)
+        except (TypeError, ValueError): num_colors = 1
+        material = product.get("material") or f"{float(product.get('price_per_m2') or 0):.2f} RSD/m2"
+        specifications = engine.offer_specifications(float(product["template_width_W"]), float(product["template_height_H"]), material, bool(product.get("is_blank", False)), num_colors, bool(product.get("is_uv_varnish", False)), engine.tool_info_string(product.get("tool_type"), product.get("existing_tool_info")))
+        output.append((product, {"client_name": product.get("client_name") or "", "product_name": product.get("product_name") or "", "specifications": specifications, "offer_results": offer_results}, None))
+    return output
+
+
+def render_offer(task):
+    """Renderuje jednu ponudu (radi i u procesu radniku). Vraća (ime fajla, PDF bajtovi ili None, ms, greška)."""
+    filename, offer_data = task; start = time.perf_counter()
+    try: pdf_bytes = engine.create_offer_pdf(offer_data).getvalue(); error = None
+    except Exception as e: pdf_bytes = None; error = str(e)
+    return filename, pdf_bytes, (time.perf_counter() - start) * 1000.0, error
+
+
+def worker_mp_context():
+    """multiprocessing kontekst za pool procesa (prvi dostupan iz WORKER_START_METHODS); koristi ga i pricing_service."""
+    return multiprocessing.get_context(next(method for method in WORKER_START_METHODS if method in multiprocessing.get_all_start_methods()))
+
+
+def _rendered(tasks, workers):
+    """Rezultati render_offer istim redom kao tasks; najviše 2 PDF-a po procesu su u letu."""
+    if workers <= 1:
+        for task in tasks: yield render_offer(task)
+        return
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=worker_mp_context()) as pool:
+        pending = collections.deque()
+        for task in tasks:
+            pending.append(pool.submit(render_offer, task))
+            if len(pending) >= workers * 2: yield pending.popleft().result()
+        while pending: yield pending.popleft().result()
+
+
+def write_offers_zip(products, output, settings=None, materials=None, workers=1, chunk_size=200, on_progress=None, board=None):
+    """Cena + PDF za svaki proizvod, upisano u ZIP (putanja ili fajl objekat).
+    Vraća izveštaj: documents, failed [(ime, greška)], timings [(ime, ms)], elapsed_s, docs_per_s, pdf_bytes."""
+    report = {"documents": 0, "failed": [], "timings": [], "elapsed_s": 0.0, "docs_per_s": 0.0, "pdf_bytes": 0}
+    used_names = {}; start = time.perf_counter()
+
+    def tasks():
+        for chunk in chunked(products, chunk_size):
+            for product, offer_data, error in price_offer_ladders(chunk, settings, materials, board=board):
+                filename = offer_filename(product, used_names)
+                if offer_data is None: report["failed"].append((filename, error))
+                else: yield filename, offer_data
+
+    with zipfile.ZipFile(output, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for filename, pdf_bytes, elapsed_ms, error in _rendered(tasks(), workers):
+            if pdf_bytes is None: report["failed"].append((filename, error)); continue
+            archive.writestr(filename, pdf_bytes); report["documents"] += 1; report["timings"].append((filename, elapsed_ms)); report["pdf_bytes"] += len(pdf_bytes)
+            if on_progress: on_progress(report["documents"])
+    report["elapsed_s"] = time.perf_counter() - start
+    report["docs_per_s"] = report["documents"] / report["elapsed_s"] if report["elapsed_s"] > 0 else 0.0
+    return report
+
+
+# --- Privremeni ZIP za UI: na disku umesto bajtova u session_state ---
+_temp_zips = set(); _temp_zips_lock = threading.Lock()
+
+def new_temp_zip(previous=None):
+    """Putanja novog privremenog ZIP-a (previous, ZIP iste sesije od ranije, se briše). Svi se brišu pri gašenju procesa."""
+    discard_temp_zip(previous)
+    handle, path = tempfile.mkstemp(prefix=TEMP_ZIP_PREFIX, suffix=".zip"); os.close(handle)
+    with _temp_zips_lock: _temp_zips.add(path)
+    return path
+
+
+def discard_temp_zip(path):
+    if not path: return
+    with _temp_zips_lock: _temp_zips.discard(path)
+    try: os.remove(path)
+    except OSError: pass
+
+
+def read_temp_zip(path):
+    """Sadržaj ZIP-a za preuzimanje (čita se tek na klik), b"" ako je fajl u međuvremenu obrisan."""
+    try:
+        with open(path, "rb") as handle: return handle.read()
+    except (OSError, TypeError): return b""
+
+
+@atexit.register
+def discard_all_temp_zips():
+    with _temp_zips_lock: paths = list(_temp_zips)
+    for path in paths: discard_temp_zip(path)
+
+
+def timing_summary(timings):
+    """p50/p95/max/mean vremena renderovanja (ms) iz liste (ime, ms)."""
+    return diagnostics.summarize([ms for _, ms in timings])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk offer PDFs for a product catalogue, zipped.")
+    parser.add_argument("input", nargs="?", help="Products file (.csv or .jsonl), '-' for stdin (JSONL)")
+    parser.add_argument("--from-history", action="store_true", help="Use the latest saved calculation per client/product")
+    parser.add_argument("--limit", type=int, default=None, help="Max products taken from history")
+    parser.add_argument("-o", "--output", default="offers.zip", help="ZIP file to write (default offers.zip)")
+    parser.add_argument("--db", default=None, help=f"SQLite database with settings/materials (default {db.DB_FILE})")
+    parser.add_argument("--workers", type=int, default=0, help="Render processes (0 = all cores)")
+    parser.add_argument("--chunk-size", type=int, default=200, help="Products priced per batch call")
+    parser.add_argument("--timings", default=None, help="Write per-document render timings to this CSV")
+    parser.add_argument("--no-delivery-dates", action="store_true", help="Print 'As agreed' instead of estimating delivery dates from the press board")
+    args = parser.parse_args(argv)
+    if bool(args.input) == args.from_history: parser.error("Give a products file or --from-history (not both)")
+    if args.db: db.DB_FILE = args.db
+    if not os.path.exists(db.DB_FILE): parser.error(f"Database not found: {db.DB_FILE}")
+    settings = db.load_settings_from_db() or {}; materials = db.load_materials_from_db() or {}
+    if args.from_history:
+        products = db.load_latest_products(args.limit)
+        if products is None: parser.error("Could not read calculations from the database")
+    else: products = read_jobs(args.input)
+    workers = args.workers if args.workers > 0 else (os.cpu_count() or 1)
+    board = None if args.no_delivery_dates or not db.init_db() else scheduler.get_press_board(settings)
+    report = write_offers_zip(products, args.output, settings, materials, workers=workers, chunk_size=max(1, args.chunk_size), board=board)
+    if args.timings:
+        with open(args.timings, "w", newline="", encoding="utf-8") as handle:
+            writer = csv.writer(handle); writer.writerow(["file", "render_ms"]); writer.writerows((name, f"{ms:.2f}") for name, ms in report["timings"])
+    stats = timing_summary(report["timings"])
+    print(f"Wrote {report['documents']} offers to {args.output} in {report['elapsed_s']:.2f} s ({report['docs_per_s']:,.1f} docs/s, {workers} workers)", file=sys.stderr)
+    print(f"Render time per document: mean {stats['mean_ms']:.1f} ms, p50 {stats['p50_ms']:.1f} ms, p95 {stats['p95_ms']:.1f} ms, max {stats['max_ms']:.1f} ms", file=sys.stderr)
+    for filename, error in report["failed"]: print(f"FAILED {filename}: {error}", file=sys.stderr)
+    return 1 if report["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""Prekalkulisani indeks rešenja cilindra (Z, n) za zadatu širinu etikete W.
+
+Za svaki broj zuba Z i broj etiketa po obimu n validne širine W čine interval
+[C/n - GAP_MAX, C/n - GAP_MIN]. Intervali se grade jednom po konfiguraciji
+(PITCH, GAP_MIN, GAP_MAX, Z_MIN, Z_MAX), sortiraju po donjoj granici i zatim
+se pretražuju sa np.searchsorted, za jednu širinu ili za ceo niz širina.
+"""
+import bisect
+import functools
+import math
+import numpy as np
+
+TOLERANCE = 1e-9  # Ista tolerancija kao u originalnoj petlji
+_PREFILTER_MARGIN = 1e-6  # Šira margina za predfilter, tačna provera ide posle
+
+
+class CylinderIndex:
+    """Sortirana tabela intervala (Z, n) -> [W_min, W_max] za jednu konfiguraciju."""
+
+    def __init__(self, pitch, gap_min, gap_max, z_min, z_max):
+        self.pitch = pitch; self.gap_min = gap_min; self.gap_max = gap_max; self.z_min = z_min; self.z_max = z_max
+        z_list = []; n_list = []
+        for z in range(z_min, z_max + 1):
+            n_upper = int(math.floor((z * pitch) / gap_min)) if gap_min > 0 else 0
+            z_list.extend([z] * n_upper); n_list.extend(range(1, n_upper + 1))
+        z_arr = np.asarray(z_list, dtype=np.int64); n_arr = np.asarray(n_list, dtype=np.int64)
+        circumference = z_arr * pitch  # Isti redosled operacija kao z * PITCH
+        pitch_per_n = circumference / n_arr
+        lo = pitch_per_n - gap_max - _PREFILTER_MARGIN; hi = pitch_per_n - gap_min + _PREFILTER_MARGIN
+        keep = hi > 0; order = np.argsort(lo[keep], kind="stable")
+        self.z = z_arr[keep][order]; self.n = n_arr[keep][order]; self.circumference = circumference[keep][order]
+        self.lo = lo[keep][order]; self.hi = hi[keep][order]
+        # Rang rešenja: najmanji Z, pa najveći n (kao sort u find_cylinder_specifications)
+        self.rank = np.lexsort((-self.n, self.z)).argsort()
+        self.max_interval = float((self.hi - self.lo).max()) if self.lo.size else 0.0
+        # Python liste za skalarne upite (jedna širina) - brže od NumPy-a za mali prozor
+        self._lo_list = self.lo.tolist(); self._rows = list(zip(self.z.tolist(), self.circumference.tolist(), self.n.tolist(), self.rank.tolist()))
+
+    def __len__(self):
+        return int(self.lo.size)
+
+    def _candidates(self, widths):
+        """Vraća (širine, red, indeks) za sve validne kandidate, sortirano po širini pa po (Z, -n)."""
+        widths = np.asarray(widths, dtype=np.float64).reshape(-1)
+        start = np.searchsorted(self.lo, widths - self.max_interval, side="left")
+        counts = np.searchsorted(self.lo, widths, side="right") - start
+        # Ravna lista parova (širina, interval) bez popunjavanja do najšireg prozora
+        rows = np.repeat(np.arange(widths.size), counts); offsets = np.cumsum(counts) - counts
+        idx = start[rows] + (np.arange(rows.size) - offsets[rows])
+        w = widths[rows]; circ = self.circumference[idx]; n = self.n[idx]
+        # Tačna provera identična originalnoj petlji (n <= n_max i G u [GAP_MIN, GAP_MAX])
+        with np.errstate(divide="ignore", invalid="ignore"):
+            n_max = np.floor(circ / (w + self.gap_min)); gap = (circ / n) - w
+        valid = (w > 0) & (n <= n_max) & (gap >= self.gap_min - TOLERANCE) & (gap <= self.gap_max + TOLERANCE)
+        rows = rows[valid]; idx = idx[valid]
+        order = np.lexsort((self.rank[idx], rows))
+        return widths, rows[order], idx[order]
+
+    def best_many(self, widths):
+        """Najbolje rešenje za svaku širinu. Vraća rečnik nizova; 'found' je maska pronađenih."""
+        widths = np.asarray(widths, dtype=np.float64).reshape(-1)
+        unique_widths, inverse = np.unique(widths, return_inverse=True)
+        if unique_widths.size < widths.size:  # Kvantitativne lestvice ponavljaju iste širine
+            return {key: column[inverse] for key, column in self.best_many(unique_widths).items()}
+        widths, rows, idx = self._candidates(widths)
+        first = np.ones(rows.size, dtype=bool); first[1:] = rows[1:] != rows[:-1]
+        found = np.zeros(widths.size, dtype=bool); found[rows[first]] = True
+        pick = np.zeros(widths.size, dtype=np.int64); pick[rows[first]] = idx[first]
+        z = np.zeros(widths.size, dtype=np.int64); n = np.zeros(widths.size, dtype=np.int64); circ = np.full(widths.size, np.nan)
+        z[found] = self.z[pick[found]]; n[found] = self.n[pick[found]]; circ[found] = self.circumference[pick[found]]
+        gap = np.full(widths.size, np.nan); gap[found] = (circ[found] / n[found]) - widths[found]
+        return {"found": found, "number_of_teeth_Z": z, "circumference_mm": circ, "templates_N_circumference": n, "gap_G_circumference_mm": gap}
+
+    def all_many(self, widths):
+        """Sva rešenja za niz širina u CSR obliku: 'width_index' pokazuje kojoj širini red pripada.
+        Redovi su sortirani po širini, pa po (Z, -n)."""
+        widths, rows, idx = self._candidates(widths)
+        circ = self.circumference[idx]; n = self.n[idx]
+        return {"width_index": rows, "number_of_teeth_Z": self.z[idx], "circumference_mm": circ, "templates_N_circumference": n, "gap_G_circumference_mm": (circ / n) - widths[rows]}
+
+    def _scalar_candidates(self, template_width_W):
+        """Skalarni upit: (rang, rešenje) za sve validne (Z, n) jedne širine."""
+        if template_width_W <= 0: return []
+        start = bisect.bisect_left(self._lo_list, template_width_W - self.max_interval); stop = bisect.bisect_right(self._lo_list, template_width_W)
+        found = []; limit = template_width_W + self.gap_min
+        for z, circumference_C, n, rank in self._rows[start:stop]:
+            if n > math.floor(circumference_C / limit): continue
+            gap_G_circumference = (circumference_C / n) - template_width_W
+            if (self.gap_min - TOLERANCE) <= gap_G_circumference <= (self.gap_max + TOLERANCE): found.append((rank, {"number_of_teeth_Z": z, "circumference_mm": circumference_C, "templates_N_circumference": n, "gap_G_circumference_mm": gap_G_circumference}))
+        return found
+
+    def solutions(self, template_width_W):
+        """Sva rešenja za jednu širinu kao lista rečnika, sortirana po (Z, -n)."""
+        return [solution for _, solution in sorted(self._scalar_candidates(template_width_W), key=lambda item: item[0])]
+
+    def best(self, template_width_W):
+        """Najbolje rešenje za jednu širinu kao rečnik ili None."""
+        found = self._scalar_candidates(template_width_W)
+        return min(found, key=lambda item: item[0])[1] if found else None
+
+@functools.lru_cache(maxsize=8)
+def get_cylinder_index(pitch, gap_min, gap_max, z_min, z_max):
+    """Vraća (keširan) indeks za datu konfiguraciju cilindra. Gradi se jednom po procesu."""
+    return CylinderIndex(pitch, gap_min, gap_max, z_min, z_max)
@@ -0,0 +1,375 @@
+# -*- coding: utf-8 -*-
+"""Pristup SQLite bazi (materijali, podešavanja, sačuvane kalkulacije) bez UI zavisnosti.
+
+Sve funkcije koriste deljeni pool konekcija po procesu (WAL režim, podešeni PRAGMA-i,
+keš pripremljenih upita po konekciji). Šema se inicijalizuje i migrira jednom po
+procesu preko PRAGMA user_version. Trajanje svakog upita se beleži (query_stats()).
+"""
+import collections
+import contextlib
+import datetime
+import os
+import queue
+import sqlite3
+import threading
+import time
+import diagnostics
+from engine import tool_info_string, FALLBACK_INK_PRICE, FALLBACK_VARNISH_PRICE, FALLBACK_LABOR_PRICE, FALLBACK_TOOL_SEMI_PRICE, FALLBACK_TOOL_ROT_PRICE, FALLBACK_PLATE_PRICE, FALLBACK_MACHINE_SPEED, FALLBACK_SINGLE_PROFIT, FALLBACK_PROFITS
+
+DB_FILE = os.environ.get("PRINT_CALCULATOR_DB", "print_calculator.db")
+BUSY_TIMEOUT_S = 5.0
+POOL_SIZE = 8  # Najviše ovoliko slobodnih konekcija čeka u pool-u, višak se zatvara
+STATEMENT_CACHE_SIZE = 128
+PRAGMAS = ("PRAGMA journal_mode=WAL", "PRAGMA synchronous=NORMAL", "PRAGMA temp_store=MEMORY", "PRAGMA cache_size=-16000")
+QUERY_SAMPLES = 500  # Broj poslednjih merenja koja se čuvaju po upitu
+
+# --- SQL upiti (isti string = isti pripremljeni upit u kešu konekcije) ---
+SQL_LOAD_MATERIALS = "SELECT name, price_per_m2 FROM materials ORDER BY name"
+SQL_LOAD_SETTINGS = "SELECT key, value FROM settings"
+SQL_UPDATE_MATERIAL_PRICE = "UPDATE materials SET price_per_m2 = ? WHERE name = ?"
+SQL_INSERT_MATERIAL = "INSERT INTO materials (name, price_per_m2) VALUES (?, ?)"
+SQL_UPSERT_SETTING = "INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)"
+SQL_LOAD_DATA_VERSION = "SELECT value FROM app_meta WHERE key = 'data_version'"
+SQL_LOAD_PRESS_BOARD_VERSION = "SELECT key, value FROM app_meta WHERE key IN ('data_version', 'press_jobs_version')"
+# Raspored i troškovi iz run_single_calculation (kolone iz migracije v4, ista imena kao ključevi rezultata)
+BREAKDOWN_COLUMNS = {"number_of_teeth_Z": "INTEGER", "templates_N_circumference": "INTEGER", "gap_G_circumference_mm": "REAL", "number_across_width_y": "INTEGER", "price_per_m2": "REAL", "required_material_width_mm": "REAL", "total_production_length_m": "REAL", "total_production_area_m2": "REAL", "waste_length_m": "REAL", "waste_area_m2": "REAL", "total_final_length_m": "REAL", "total_final_area_m2": "REAL", "setup_time_min": "REAL", "production_time_min": "REAL", "cleanup_time_min": "REAL", "total_time_min": "REAL", "ink_cost_rsd": "REAL", "varnish_cost_rsd": "REAL", "plate_cost_rsd": "REAL", "material_cost_rsd": "REAL", "labor_cost_rsd": "REAL", "tool_cost_rsd": "REAL", "total_production_cost_rsd": "REAL", "profit_rsd": "REAL"}
+CALCULATION_COLUMNS = ["client_name", "product_name", "template_width", "template_height", "quantity", "num_colors", "is_blank", "is_uv_varnish", "material_name", "tool_type", "machine_speed", "profit_coefficient", "calculated_total_price", "calculated_price_per_piece"] + list(BREAKDOWN_COLUMNS)
+SQL_INSERT_CALCULATION = f"INSERT INTO calculations ({', '.join(CALCULATION_COLUMNS)}) VALUES ({', '.join('?' * len(CALCULATION_COLUMNS))})"
+SQL_LOAD_PRESS_JOBS = "SELECT id, created, client_name, product_name, quantity, status, priority, duration_min, press FROM press_jobs WHERE status IN ('accepted', 'quoted') ORDER BY id"
+SQL_INSERT_PRESS_JOB = "INSERT INTO press_jobs (client_name, product_name, quantity, status, priority, duration_min, press) VALUES (?, ?, ?, ?, ?, ?, ?)"
+SQL_UPDATE_PRESS_JOB_STATUS = "UPDATE press_jobs SET status = ? WHERE id = ?"
+SQL_LOAD_PRICE_HISTORY = "SELECT id, changed_at, kind, key, value FROM price_history ORDER BY changed_at, id"
+SQL_LOAD_LATEST_PRODUCTS = "SELECT client_name, product_name, template_width, template_height, num_colors, is_blank, is_uv_varnish, material_name, tool_type, machine_speed FROM calculations WHERE id IN (SELECT MAX(id) FROM calculations GROUP BY client_name, product_name) ORDER BY client_name, product_name"
+PRICE_HISTORY_EPOCH = "1970-01-01 00:00:00"  # Cene zatečene pri migraciji v6 važe i unazad (ranije izmene nisu beležene)
+PRICE_HISTORY_TABLES = {"settings": ("setting", "key", "value"), "materials": ("material", "name", "price_per_m2")}
+
+# --- Istorija kalkulacija (stranice po ključu, filteri i agregati u SQL-u) ---
+HISTORY_COLUMNS = "id, timestamp, client_name, product_name, quantity, material_name, calculated_total_price, calculated_price_per_piece, profit_coefficient"
+HISTORY_PAGE_SIZES = (10, 25, 50, 100)
+HISTORY_AGGREGATES = {
+    "Revenue per client": "SELECT client_name AS client, COUNT(*) AS quotes, SUM(calculated_total_price) AS revenue_rsd, AVG(calculated_total_price) AS avg_quote_rsd FROM calculations{where} GROUP BY client_name ORDER BY revenue_rsd DESC",
+    "Avg price per piece per material": "SELECT material_name AS material, COUNT(*) AS quotes, AVG(calculated_price_per_piece) AS avg_price_per_piece_rsd, MIN(calculated_price_per_piece) AS min_price_per_piece_rsd, MAX(calculated_price_per_piece) AS max_price_per_piece_rsd FROM calculations{where} GROUP BY material_name ORDER BY material_name",
+    "Quotes per month": "SELECT substr(timestamp, 1, 7) AS month, COUNT(*) AS quotes, SUM(calculated_total_price) AS revenue_rsd FROM calculations{where} GROUP BY substr(timestamp, 1, 7) ORDER BY month DESC",
+}
+
+_pools = {}; _pools_lock = threading.Lock(); _pool_pid = os.getpid()
+_initialized = set(); _init_lock = threading.Lock()
+_query_stats = collections.defaultdict(lambda: collections.deque(maxlen=QUERY_SAMPLES)); _stats_lock = threading.Lock()
+
+# --- Konekcije ---
+def _open_connection(path):
+    conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT_S, check_same_thread=False, cached_statements=STATEMENT_CACHE_SIZE)
+    conn.row_factory = sqlite3.Row
+    for pragma in PRAGMAS: conn.execute(pragma)
+    return conn
+
+def _reset_after_fork():
+    """Posle fork-a dete ne sme da koristi konekcije roditelja: prazni pool i status inicijalizacije."""
+    global _pool_pid
+    if _pool_pid != os.getpid(): _pools.clear(); _initialized.clear(); _pool_pid = os.getpid()
+
+def _get_pool(path):
+    with _pools_lock:
+        _reset_after_fork()
+        if path not in _pools: _pools[path] = queue.LifoQueue()
+        return _pools[path]
+
+@contextlib.contextmanager
+def pooled_connection():
+    """Pozajmljuje konekciju iz pool-a za tekući DB_FILE i vraća je posle upotrebe.
+    Nezavršena transakcija se poništava pre vraćanja u pool."""
+    path = DB_FILE; pool = _get_pool(path)
+    try: conn = pool.get_nowait()
+    except queue.Empty: conn = _open_connection(path)
+    try:
+        yield conn
+    finally:
+        if conn.in_transaction: conn.rollback()
+        if pool.qsize() < POOL_SIZE: pool.put_nowait(conn)
+        else: conn.close()
+
+def close_all_connections():
+    """Zatvara sve slobodne konekcije u pool-ovima (npr. pri gašenju procesa ili u benchmark-u)."""
+    with _pools_lock:
+        for pool in _pools.values():
+            while True:
+                try: pool.get_nowait().close()
+                except queue.Empty: break
+        _pools.clear()
+
+def get_db_connection():
+    """Uspostavlja novu (nedeljenu) konekciju sa podešenim PRAGMA-ima. Vraća konekciju ili None.
+    Pozivalac je zatvara; za kratke upite koristiti pooled_connection()."""
+    try: return _open_connection(DB_FILE)
+    except sqlite3.Error as e: return None
+
+# --- Merenje trajanja upita ---
+@contextlib.contextmanager
+def timed_query(label):
+    """Meri trajanje bloka i upisuje ga pod datim imenom u query_stats()."""
+    start = time.perf_counter()
+    try: yield
+    finally:
+        elapsed_ms = (time.perf_counter() - start) * 1000.0
+        with _stats_lock: _query_stats[label].append(elapsed_ms)
+        diagnostics.record_event("query", label, elapsed_ms)
+
+def query_stats():
+    """Vraća {upit: {count, mean_ms, p50_ms, p95_ms, max_ms}} za poslednjih QUERY_SAMPLES merenja po upitu."""
+    with _stats_lock: snapshot = {label: list(samples) for label, samples in _query_stats.items() if samples}
+    return {label: diagnostics.summarize(samples) for label, samples in snapshot.items()}
+
+def _fetch_all(label, sql, params=()):
+    with pooled_connection() as conn, timed_query(label): return conn.execute(sql, params).fetchall()
+
+def _write(label, sql, params=()):
+    with pooled_connection() as conn, timed_query(label):
+        with conn: conn.execute(sql, params) # Commit na izlasku, rollback na grešci
+
+# --- Šema i migracije (PRAGMA user_version) ---
+def _migrate_v1(cursor):
+    """Početna šema i podrazumevani podaci (isto kao ranije init_db)."""
+    cursor.execute(""" CREATE TABLE IF NOT EXISTS materials ( id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT UNIQUE NOT NULL, price_per_m2 REAL NOT NULL ) """)
+    cursor.execute(""" CREATE TABLE IF NOT EXISTS settings ( key TEXT PRIMARY KEY NOT NULL, value REAL NOT NULL ) """)
+    cursor.execute(""" CREATE TABLE IF NOT EXISTS calculations ( id INTEGER PRIMARY KEY AUTOINCREMENT, timestamp DATETIME DEFAULT CURRENT_TIMESTAMP, client_name TEXT, product_name TEXT, template_width REAL, template_height REAL, quantity INTEGER, num_colors INTEGER, is_blank BOOLEAN, is_uv_varnish BOOLEAN, material_name TEXT, tool_type TEXT, machine_speed REAL, profit_coefficient REAL, calculated_total_price REAL, calculated_price_per_piece REAL ) """)
+    cursor.execute("SELECT COUNT(*) FROM materials")
+    if cursor.fetchone()[0] == 0: default_materials = {"Paper (chrome)": 39.95, "Plastic (PPW)": 54.05, "Thermal Paper": 49.35}; cursor.executemany(SQL_INSERT_MATERIAL, default_materials.items())
+    default_settings = { "ink_price_per_kg": FALLBACK_INK_PRICE, "varnish_price_per_kg": FALLBACK_VARNISH_PRICE, "machine_labor_price_per_hour": FALLBACK_LABOR_PRICE, "tool_price_semirotary": FALLBACK_TOOL_SEMI_PRICE, "tool_price_rotary": FALLBACK_TOOL_ROT_PRICE, "plate_price_per_color": FALLBACK_PLATE_PRICE, "machine_speed_default": FALLBACK_MACHINE_SPEED, "single_calc_profit_coefficient": FALLBACK_SINGLE_PROFIT }; default_settings.update({f"profit_coeff_{qty}": coeff for qty, coeff in FALLBACK_PROFITS.items()})
+    cursor.executemany("INSERT OR IGNORE INTO settings (key, value) VALUES (?, ?)", default_settings.items())
+
+def _migrate_v2(cursor):
+    """data_version brojač koji triggeri povećavaju pri svakoj izmeni settings/materials tabele,
+    pa svaki proces (UI, CLI) jeftino vidi da li su keširane cene zastarele."""
+    cursor.execute(""" CREATE TABLE IF NOT EXISTS app_meta ( key TEXT PRIMARY KEY NOT NULL, value INTEGER NOT NULL ) """)
+    cursor.execute("INSERT OR IGNORE INTO app_meta (key, value) VALUES ('data_version', 0)")
+    for table in ("settings", "materials"):
+        for event in ("INSERT", "UPDATE", "DELETE"):
+            cursor.execute(f"CREATE TRIGGER IF NOT EXISTS {table}_{event.lower()}_bump_version AFTER {event} ON {table} BEGIN UPDATE app_meta SET value = value + 1 WHERE key = 'data_version'; END")
+
+def _migrate_v3(cursor):
+    """Indeksi za istoriju: stranice po (timestamp, id), filteri po klijentu, proizvodu i materijalu i agregati."""
+    columns = {row[1] for row in cursor.execute("PRAGMA table_info(calculations)")}
+    if "profit_coefficient" not in columns: cursor.execute("ALTER TABLE calculations ADD COLUMN profit_coefficient REAL") # Starije baze
+    cursor.execute("CREATE INDEX IF NOT EXISTS calculations_timestamp_idx ON calculations (timestamp)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS calculations_client_product_idx ON calculations (client_name, product_name)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS calculations_product_idx ON calculations (product_name)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS calculations_material_timestamp_idx ON calculations (material_name, timestamp)")
+    # Pokrivajući indeksi za HISTORY_AGGREGATES: agregat se čita iz indeksa, bez skeniranja tabele
+    cursor.execute("CREATE INDEX IF NOT EXISTS calculations_client_revenue_idx ON calculations (client_name, calculated_total_price)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS calculations_material_price_idx ON calculations (material_name, calculated_price_per_piece)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS calculations_month_revenue_idx ON calculations (substr(timestamp, 1, 7), calculated_total_price)")
+    cursor.execute("ANALYZE calculations")
+
+def _migrate_v4(cursor):
+    """Kolone za pun obračun (BREAKDOWN_COLUMNS), da se istorija analizira bez ponovnog računanja. Stari redovi ostaju NULL."""
+    columns = {row[1] for row in cursor.execute("PRAGMA table_info(calculations)")}
+    for name, sql_type in BREAKDOWN_COLUMNS.items():
+        if name not in columns: cursor.execute(f"ALTER TABLE calculations ADD COLUMN {name} {sql_type}")
+
+def _migrate_v5(cursor):
+    """Red poslova po mašinama (scheduler.py): prihvaćeni i ponuđeni poslovi sa trajanjem u minutima,
+    i podešavanja kapaciteta (broj mašina, početak i dužina radnog dana)."""
+    cursor.execute(""" CREATE TABLE IF NOT EXISTS press_jobs ( id INTEGER PRIMARY KEY AUTOINCREMENT, created DATETIME DEFAULT CURRENT_TIMESTAMP, client_name TEXT, product_name TEXT, quantity INTEGER, status TEXT NOT NULL DEFAULT 'quoted', priority INTEGER NOT NULL DEFAULT 0, duration_min REAL NOT NULL, press INTEGER ) """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS press_jobs_status_idx ON press_jobs (status, priority, id)")
+    cursor.executemany("INSERT OR IGNORE INTO settings (key, value) VALUES (?, ?)", [("press_count", 1), ("shift_start_hour", 6), ("shift_hours_per_day", 16)])
+
+def _migrate_v6(cursor):
+    """Istorija cena (price_history): triggeri beleže svaku promenu vrednosti u settings/materials tabeli sa
+    vremenom promene (UTC, kao calculations.timestamp), pa se cene važeće u bilo kom trenutku mogu rekonstruisati
+    (requote.py). Brisanje se beleži kao NULL. Zatečene cene se upisuju sa PRICE_HISTORY_EPOCH."""
+    cursor.execute(""" CREATE TABLE IF NOT EXISTS price_history ( id INTEGER PRIMARY KEY AUTOINCREMENT, changed_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP, kind TEXT NOT NULL, key TEXT NOT NULL, value REAL ) """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS price_history_key_idx ON price_history (kind, key, id)")
+    for table, (kind, key, value) in PRICE_HISTORY_TABLES.items():
+        cursor.execute(f"INSERT INTO price_history (changed_at, kind, key, value) SELECT ?, '{kind}', {key}, {value} FROM {table}", (PRICE_HISTORY_EPOCH,))
+        # INSERT OR REPLACE sa istom vrednošću (npr. čuvanje svih podešavanja iz UI-ja) ne pravi novi red
+        last_value = f"(SELECT value FROM price_history WHERE kind = '{kind}' AND key = NEW.{key} ORDER BY id DESC LIMIT 1)"
+        cursor.execute(f"CREATE TRIGGER IF NOT EXISTS {table}_insert_history AFTER INSERT ON {table} WHEN NEW.{value} IS NOT {last_value} BEGIN INSERT INTO price_history (kind, key, value) VALUES ('{kind}', NEW.{key}, NEW.{value}); END")
+        cursor.execute(f"CREATE TRIGGER IF NOT EXISTS {table}_update_history AFTER UPDATE ON {table} BEGIN INSERT INTO price_history (kind, key, value) SELECT '{kind}', OLD.{key}, NULL WHERE OLD.{key} IS NOT NEW.{key}; INSERT INTO price_history (kind, key, value) SELECT '{kind}', NEW.{key}, NEW.{value} WHERE NEW.{value} IS NOT {last_value}; END")
+        cursor.execute(f"CREATE TRIGGER IF NOT EXISTS {table}_delete_history AFTER DELETE ON {table} BEGIN INSERT INTO price_history (kind, key, value) VALUES ('{kind}', OLD.{key}, NULL); END")
+
+def _migrate_v7(cursor):
+    """press_jobs_version brojač (kao data_version, ali za press_jobs tabelu), da proces zna kada mu je
+    keširani raspored (scheduler.get_press_board) zastareo. Odvojen je da izmena reda ne bi obarala keš cena."""
+    cursor.execute("INSERT OR IGNORE INTO app_meta (key, value) VALUES ('press_jobs_version', 0)")
+    for event in ("INSERT", "UPDATE", "DELETE"):
+        cursor.execute(f"CREATE TRIGGER IF NOT EXISTS press_jobs_{event.lower()}_bump_version AFTER {event} ON press_jobs BEGIN UPDATE app_meta SET value = value + 1 WHERE key = 'press_jobs_version'; END")
+
+# Nova migracija se dodaje na kraj liste; verzija baze = broj primenjenih migracija
+MIGRATIONS = [_migrate_v1, _migrate_v2, _migrate_v3, _migrate_v4, _migrate_v5, _migrate_v6, _migrate_v7]
+
+def init_db():
+    """Inicijalizuje i migrira bazu jednom po procesu (i po putanji baze). Vraća True ako uspe, False ako ne."""
+    path = DB_FILE; _reset_after_fork()
+    if path in _initialized: return True
+    with _init_lock:
+        if path in _initialized: return True
+        try:
+            with pooled_connection() as conn, timed_query("init_db"):
+                # BEGIN IMMEDIATE: samo jedan proces migrira, ostali čekaju pa vide novu verziju
+                conn.execute("BEGIN IMMEDIATE")
+                version = conn.execute("PRAGMA user_version").fetchone()[0]
+                cursor = conn.cursor()
+                for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+                    migration(cursor); cursor.execute(f"PRAGMA user_version = {number}")
+                conn.commit()
+        except sqlite3.Error as e:
+            return False
+        _initialized.add(path)
+    return True
+
+# --- Funkcije za rad sa bazom podataka (OČIŠĆENE od print/st.write za greške) ---
+def load_materials_from_db():
+    """Učitava materijale. Vraća rečnik ili None ako ne uspe."""
+    try: return {row['name']: row['price_per_m2'] for row in _fetch_all("load_materials", SQL_LOAD_MATERIALS)}
+    except sqlite3.Error as e: return None # Greška, vrati None
+
+def load_settings_from_db():
+    """Učitava podešavanja. Vraća rečnik ili None ako ne uspe."""
+    try: return {row['key']: row['value'] for row in _fetch_all("load_settings", SQL_LOAD_SETTINGS)}
+    except sqlite3.Error as e: return None # Greška, vrati None
+
+def calculation_row_to_job(row):
+    """Pretvara red iz calculations tabele u posao za engine (tool_type 'Existing: X' postaje postojeći alat X)."""
+    tool = row['tool_type'] or "None"; existing = ""
+    if tool.startswith("Existing: "): existing = tool[len("Existing: "):]; tool = "None"
+    return {"client_name": row['client_name'], "product_name": row['product_name'], "template_width_W": row['template_width'], "template_height_H": row['template_height'], "num_colors": row['num_colors'], "is_blank": bool(row['is_blank']), "is_uv_varnish": bool(row['is_uv_varnish']), "material": row['material_name'], "tool_type": tool, "existing_tool_info": existing, "machine_speed_m_min": row['machine_speed']}
+
+def load_latest_products(limit=None):
+    """Poslednja sačuvana kalkulacija za svaki par (klijent, proizvod), kao poslovi za engine. Vraća listu ili None ako ne uspe."""
+    sql = SQL_LOAD_LATEST_PRODUCTS + (" LIMIT ?" if limit else ""); params = (int(limit),) if limit else ()
+    try: return [calculation_row_to_job(row) for row in _fetch_all("load_latest_products", sql, params)]
+    except sqlite3.Error as e: return None
+
+def history_filter_sql(client=None, product=None, material=None, date_from=None, date_to=None):
+    """Vraća (lista WHERE uslova, parametri). client/product su prefiksi (opseg po indeksu, ne LIKE '%...%'),
+    material je tačan naziv, date_from/date_to su datetime.date uključivo (timestamp je u UTC-u)."""
+    clauses = []; params = []
+    for column, prefix in (("client_name", client), ("product_name", product)):
+        if prefix: clauses.append(f"{column} >= ? AND {column} < ?"); params += [prefix, prefix + "\U0010ffff"]
+    if material: clauses.append("material_name = ?"); params.append(material)
+    if date_from: clauses.append("timestamp >= ?"); params.append(date_from.isoformat())
+    if date_to: clauses.append("timestamp < ?"); params.append((date_to + datetime.timedelta(days=1)).isoformat())
+    return clauses, params
+
+def _where(clauses):
+    return " WHERE " + " AND ".join(clauses) if clauses else ""
+
+def load_history_page(filters=None, before=None, page_size=10):
+    """Jedna stranica istorije, od najnovijih. before je kursor (timestamp, id) poslednjeg reda prethodne stranice.
+    Vraća (lista rečnika, kursor sledeće stranice ili None) ili None ako ne uspe."""
+    clauses, params = history_filter_sql(**(filters or {}))
+    if before: clauses.append("(timestamp, id) < (?, ?)"); params += list(before)
+    sql = f"SELECT {HISTORY_COLUMNS} FROM calculations{_where(clauses)} ORDER BY timestamp DESC, id DESC LIMIT ?"
+    try: rows = _fetch_all("history_page", sql, params + [page_size + 1])
+    except sqlite3.Error as e: return None
+    has_more = len(rows) > page_size; rows = [dict(row) for row in rows[:page_size]]
+    return rows, ((rows[-1]['timestamp'], rows[-1]['id']) if has_more else None)
+
+def load_history_aggregate(name, filters=None):
+    """Agregat iz HISTORY_AGGREGATES nad filtriranom istorijom. Vraća listu rečnika ili None ako ne uspe."""
+    clauses, params = history_filter_sql(**(filters or {}))
+    try: return [dict(row) for row in _fetch_all(f"history_aggregate:{name}", HISTORY_AGGREGATES[name].format(where=_where(clauses)), params)]
+    except sqlite3.Error as e: return None
+
+def load_calculations_after(after_id=0, limit=1000, filters=None):
+    """Sledeći blok sačuvanih kalkulacija (svi stupci) sa id > after_id, po id-u (keyset, za strimovanje cele tabele).
+    filters kao kod history_filter_sql. Vraća listu rečnika ili None ako ne uspe."""
+    clauses, params = history_filter_sql(**(filters or {})); clauses.append("id > ?")
+    sql = f"SELECT id, timestamp, {', '.join(CALCULATION_COLUMNS)} FROM calculations{_where(clauses)} ORDER BY id LIMIT ?"
+    try: return [dict(row) for row in _fetch_all("calculations_after", sql, params + [int(after_id), int(limit)])]
+    except sqlite3.Error as e: return None
+
+def load_price_history():
+    """Sve promene cena (price_history) po vremenu: lista rečnika id, changed_at, kind ('setting'/'material'), key, value
+    (None = obrisano), ili None ako ne uspe."""
+    try: return [dict(row) for row in _fetch_all("load_price_history", SQL_LOAD_PRICE_HISTORY)]
+    except sqlite3.Error as e: return None
+
+# --- Red poslova po mašinama (scheduler.py) ---
+PRESS_JOB_STATUSES = ("accepted", "quoted", "done", "cancelled")
+
+def load_press_jobs():
+    """Prihvaćeni i ponuđeni poslovi (bez završenih/otkazanih) kao lista rečnika, ili None ako ne uspe."""
+    try: return [dict(row) for row in _fetch_all("load_press_jobs", SQL_LOAD_PRESS_JOBS)]
+    except sqlite3.Error as e: return None
+
+def load_press_board_version():
+    """(data_version, press_jobs_version): menja se pri svakoj izmeni settings/materials ili press_jobs tabele. None ako ne uspe."""
+    try: versions = {row['key']: row['value'] for row in _fetch_all("load_press_board_version", SQL_LOAD_PRESS_BOARD_VERSION)}; return versions.get('data_version', 0), versions.get('press_jobs_version', 0)
+    except sqlite3.Error as e: return None
+
+def add_press_job(client_name, product_name, quantity, duration_min, status="quoted", priority=0, press=None, on_error=None):
+    """Dodaje posao u red. Vraća id novog posla ili None ako ne uspe."""
+    if status not in PRESS_JOB_STATUSES: raise ValueError(f"Unknown press job status: {status!r}")
+    try:
+        with pooled_connection() as conn, timed_query("add_press_job"):
+            with conn: return conn.execute(SQL_INSERT_PRESS_JOB, (client_name, product_name, quantity, status, int(priority), float(duration_min), press)).lastrowid
+    except sqlite3.Error as e:
+        if on_error: on_error(e)
+        return None
+
+def update_press_job_status(job_id, status):
+    """accepted / quoted / done / cancelled. Vraća True ako uspe, False ako ne."""
+    if status not in PRESS_JOB_STATUSES: raise ValueError(f"Unknown press job status: {status!r}")
+    try: _write("update_press_job_status", SQL_UPDATE_PRESS_JOB_STATUS, (status, int(job_id))); return True
+    except sqlite3.Error as e: return False
+
+def update_material_price_in_db(name, price):
+    """Vraća True ako uspe, False ako ne."""
+    try: _write("update_material_price", SQL_UPDATE_MATERIAL_PRICE, (price, name)); return True
+    except sqlite3.Error as e: return False
+
+def add_material_to_db(name, price):
+    """Dodaje novi materijal. Podiže sqlite3.IntegrityError ako već postoji (UI prikazuje poruku)."""
+    _write("insert_material", SQL_INSERT_MATERIAL, (name, price))
+
+def load_data_version():
+    """Vraća trenutni data_version (menja se pri svakoj izmeni cena) ili None ako ne uspe."""
+    try: rows = _fetch_all("load_data_version", SQL_LOAD_DATA_VERSION); return rows[0]['value'] if rows else 0
+    except sqlite3.Error as e: return None
+
+def save_prices_batch(settings_items, material_items, on_error=None):
+    """Upisuje više podešavanja i cena materijala u jednoj transakciji. Vraća True ako uspe, False ako ne."""
+    try:
+        with pooled_connection() as conn, timed_query("save_prices_batch"):
+            with conn: conn.executemany(SQL_UPSERT_SETTING, list(settings_items)); conn.executemany(SQL_UPDATE_MATERIAL_PRICE, [(price, name) for name, price in material_items])
+        return True
+    except sqlite3.Error as e:
+        if on_error: on_error(e)
+        return False
+
+def update_setting_in_db(key, value):
+    """Vraća True ako uspe, False ako ne."""
+    try: _write("update_setting", SQL_UPSERT_SETTING, (key, value)); return True
+    except sqlite3.Error as e: return False
+
+def calculation_to_row(calc_data):
+    """Pretvara calculation_data_for_db u red za SQL_INSERT_CALCULATION."""
+    solution = calc_data.get('best_circumference_solution') or {}
+    breakdown = dict(calc_data, number_of_teeth_Z=calc_data.get('number_of_teeth_Z', solution.get('number_of_teeth_Z')), templates_N_circumference=calc_data.get('templates_N_circumference', calc_data.get('number_circumference_x')))
+    return (calc_data.get('client_name'), calc_data.get('product_name'), calc_data.get('template_width_W_input'), calc_data.get('template_height_H_input'), calc_data.get('quantity_input'), calc_data.get('valid_num_colors_for_calc'), calc_data.get('is_blank'), calc_data.get('is_uv_varnish_input'), calc_data.get('selected_material'), calc_data.get('tool_info_string'), calc_data.get('machine_speed_m_min'), calc_data.get('profit_coefficient_used'), calc_data.get('total_selling_price_rsd'), calc_data.get('selling_price_per_piece_rsd')) + tuple(breakdown.get(name) for name in BREAKDOWN_COLUMNS)
+
+def job_record_to_calculation(record, params=None):
+    """Pretvara zapis iz engine.price_jobs (posao + rezultati) u calculation_data_for_db; params su iz engine.job_to_params."""
+    params = params or {}
+    return dict(record, template_width_W_input=record.get('template_width_W'), template_height_H_input=record.get('template_height_H'), quantity_input=record.get('quantity'), valid_num_colors_for_calc=params.get('num_colors', record.get('num_colors')), is_blank=bool(record.get('is_blank', False)), is_uv_varnish_input=bool(record.get('is_uv_varnish', False)), selected_material=record.get('material'), tool_info_string=tool_info_string(record.get('tool_type'), record.get('existing_tool_info')), machine_speed_m_min=params.get('machine_speed_m_min', record.get('machine_speed_m_min')), price_per_m2=params.get('price_per_m2', record.get('price_per_m2')))
+
+# Ažurirano: Funkcija za čuvanje BEZ technology_code
+def save_calculation_to_db(calc_data, on_error=None):
+    """Vraća True ako uspe, False ako ne. on_error(e) se poziva sa greškom (UI je prikazuje korisniku)."""
+    try: _write("save_calculation", SQL_INSERT_CALCULATION, calculation_to_row(calc_data)); return True
+    except sqlite3.Error as e:
+        if on_error: on_error(e) # UI prikazuje grešku jer je to akcija korisnika
+        return False
+
+def save_calculations_batch(calculations, on_error=None):
+    """Upisuje više kalkulacija jednim executemany u jednoj transakciji (jedan commit). Vraća True ako uspe, False ako ne."""
+    try:
+        rows = [calculation_to_row(calc_data) for calc_data in calculations]
+        if not rows: return True
+        with pooled_connection() as conn, timed_query("save_calculations_batch"):
+            with conn: conn.executemany(SQL_INSERT_CALCULATION, rows)
+        return True
+    except (sqlite3.Error, TypeError, ValueError, AttributeError) as e: # I neispravan calc_data (red se ne može napraviti)
+        if on_error: on_error(e)
+        return False
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""Merenje trajanja faza jednog rerun-a skripte, klizni percentili i opcioni cProfile.
+
+Bez Streamlit zavisnosti. UI na početku rerun-a zove begin_rerun(), posle svake
+veće celine checkpoint("ime") (vreme od prethodnog checkpoint-a), a na kraju
+end_rerun(). Manje celine se mere sa `with timed_stage("ime"):`, a upiti iz
+db.timed_query se upisuju u tekući rerun preko record_event(). Poslednjih
+STAGE_SAMPLES merenja po fazi drže se u memoriji (stage_stats()). Ako je
+postavljen PRINT_CALCULATOR_METRICS_LOG, svaki završen rerun se dopisuje kao
+jedan JSON red u taj fajl. Rerun prekinut sa st.rerun()/st.stop() se ne beleži.
+"""
+import cProfile
+import collections
+import contextlib
+import datetime
+import io
+import json
+import marshal
+import os
+import pstats
+import threading
+import time
+
+STAGE_SAMPLES = 500  # Broj poslednjih merenja koja se čuvaju po fazi
+RECENT_RERUNS = 50
+METRICS_LOG = os.environ.get("PRINT_CALCULATOR_METRICS_LOG")
+
+_stage_samples = collections.defaultdict(lambda: collections.deque(maxlen=STAGE_SAMPLES)); _recent_reruns = collections.deque(maxlen=RECENT_RERUNS)
+_lock = threading.Lock(); _current = threading.local()  # Streamlit izvršava svaki rerun u svojoj niti
+
+
+def summarize(samples):
+    """{count, mean_ms, p50_ms, p95_ms, max_ms} za listu merenja u ms."""
+    samples = sorted(samples); count = len(samples)
+    if not count: return {"count": 0, "mean_ms": 0.0, "p50_ms": 0.0, "p95_ms": 0.0, "max_ms": 0.0}
+    return {"count": count, "mean_ms": sum(samples) / count, "p50_ms": samples[int(0.50 * (count - 1))], "p95_ms": samples[int(0.95 * (count - 1))], "max_ms": samples[-1]}
+
+
+def _record(label, elapsed_ms):
+    with _lock: _stage_samples[label].append(elapsed_ms)
+    record_event("stage", label, elapsed_ms)
+
+
+def begin_rerun():
+    """Počinje merenje rerun-a u tekućoj niti (nedovršen prethodni se odbacuje)."""
+    now = time.perf_counter()
+    _current.rerun = {"started": datetime.datetime.now().isoformat(timespec="milliseconds"), "start": now, "last_checkpoint": now, "stages": [], "queries": []}
+
+
+def record_event(kind, label, elapsed_ms):
+    """Upisuje fazu ('stage') ili upit ('query') u tekući rerun; van rerun-a ne radi ništa."""
+    rerun = getattr(_current, "rerun", None)
+    if rerun is not None: rerun["stages" if kind == "stage" else "queries"].append((label, round(elapsed_ms, 3)))
+
+
+def checkpoint(label):
+    """Vreme od prethodnog checkpoint-a (ili početka rerun-a) upisuje kao fazu `label`."""
+    rerun = getattr(_current, "rerun", None)
+    if rerun is None: return
+    now = time.perf_counter(); elapsed_ms = (now - rerun["last_checkpoint"]) * 1000.0; rerun["last_checkpoint"] = now
+    _record(label, elapsed_ms)
+
+
+@contextlib.contextmanager
+def timed_stage(label):
+    """Meri trajanje bloka kao fazu `label` (radi i van rerun-a, npr. PDF iz download dugmeta)."""
+    start = time.perf_counter()
+    try: yield
+    finally: _record(label, (time.perf_counter() - start) * 1000.0)
+
+
+def end_rerun(**extra):
+    """Završava rerun: ukupno vreme ide u fazu 'rerun_total'. Vraća zapis rerun-a ili None."""
+    rerun = getattr(_current, "rerun", None)
+    if rerun is None: return None
+    _current.rerun = None
+    total_ms = (time.perf_counter() - rerun["start"]) * 1000.0
+    with _lock: _stage_samples["rerun_total"].append(total_ms)
+    record = {"started": rerun["started"], "total_ms": round(total_ms, 3), "stages": rerun["stages"], "queries": rerun["queries"], **extra}
+    with _lock: _recent_reruns.append(record)
+    if METRICS_LOG:
+        try:
+            with open(METRICS_LOG, "a", encoding="utf-8") as handle: handle.write(json.dumps(record, ensure_ascii=False) + "\n")
+        except OSError: pass # Log je pomoćni, ne sme da obori aplikaciju
+    return record
+
+
+def stage_stats():
+    """Vraća {faza: summarize(...)} za poslednjih STAGE_SAMPLES merenja po fazi."""
+    with _lock: snapshot = {label: list(samples) for label, samples in _stage_samples.items() if samples}
+    return {label: summarize(samples) for label, samples in snapshot.items()}
+
+
+def recent_reruns():
+    with _lock: return list(_recent_reruns)
+
+
+def metrics_snapshot(query_stats=None):
+    """Sve metrike kao rečnik spreman za JSON (faze, upiti, poslednji rerun-ovi)."""
+    return {"created": datetime.datetime.now().isoformat(timespec="seconds"), "pid": os.getpid(), "stages": stage_stats(), "queries": query_stats or {}, "recent_reruns": recent_reruns()}
+
+
+def start_profile():
+    profiler = cProfile.Profile(); profiler.enable(); return profiler
+
+
+def stop_profile(profiler, limit=40):
+    """Zaustavlja profiler (može i iz druge niti, posle rerun-a koji se završio ranije). Vraća (.prof bajtovi za
+    pstats/snakeviz, tekstualni izveštaj po cumulative vremenu)."""
+    profiler.disable(); profiler.create_stats(); data = marshal.dumps(profiler.stats) # Pre pstats.Stats, koji isprazni profiler.stats
+    text = io.StringIO(); pstats.Stats(profiler, stream=text).sort_stats("cumulative").print_stats(limit)
+    return data, text.getvalue()
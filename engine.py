@@ -0,0 +1,416 @@
+# -*- coding: utf-8 -*-
+"""Kalkulacioni engine bez UI zavisnosti: cilindar, širina, troškovi i PDF.
+
+Može da se importuje iz workera, cron posla ili batch CLI-ja (batch_cli.py)
+bez pokretanja Streamlit-a. kalkulacije.py je samo UI sloj iznad ovog modula.
+"""
+import collections
+import collections.abc
+import math
+import datetime
+import functools
+import hashlib
+import io
+import json
+import threading
+import numpy as np
+from cylinder_index import get_cylinder_index
+
+# --- Konstante i podrazumevane vrednosti ---
+PITCH = 3.175; GAP_MIN = 2.5; GAP_MAX = 4.0; Z_MIN = 70; Z_MAX = 140
+TOTAL_CYLINDER_WIDTH = 200; WORKING_WIDTH = 190; WIDTH_GAP = 5
+WIDTH_WASTE = 10; MAX_MATERIAL_WIDTH = 200
+BASE_WASTE_LENGTH = 50.0; WASTE_LENGTH_PER_COLOR = 50.0
+SETUP_TIME_PER_COLOR_OR_BASE = 30; CLEANUP_TIME_MIN = 30
+MACHINE_SPEED_MIN = 10; MACHINE_SPEED_MAX = 120
+GRAMS_INK_PER_M2 = 3.0; GRAMS_VARNISH_PER_M2 = 4.0
+
+FALLBACK_INK_PRICE = 2350.0
+FALLBACK_VARNISH_PRICE = 1800.0
+FALLBACK_LABOR_PRICE = 3000.0
+FALLBACK_TOOL_SEMI_PRICE = 6000.0
+FALLBACK_TOOL_ROT_PRICE = 8000.0
+FALLBACK_PLATE_PRICE = 2000.0
+FALLBACK_SINGLE_PROFIT = 0.25 # Fallback za pojedinačnu kalkulaciju
+FALLBACK_MACHINE_SPEED = 30
+
+FALLBACK_PROFITS = { 1000: 0.30, 10000: 0.25, 20000: 0.22, 50000: 0.20, 100000: 0.18 }
+QUANTITIES_FOR_OFFER = list(FALLBACK_PROFITS.keys())
+
+
+# --- Calculation Functions ---
+def find_cylinder_specifications(template_width_W):
+    # Pretraga ide kroz prekalkulisani indeks (gradi se jednom po konfiguraciji cilindra)
+    if template_width_W <= 0: return None, [], "Error: Template width must be > 0."
+    valid_solutions = get_cylinder_index(PITCH, GAP_MIN, GAP_MAX, Z_MIN, Z_MAX).solutions(template_width_W)
+    if not valid_solutions: message = f"No cylinder found ({Z_MIN}-{Z_MAX} teeth) for W={template_width_W:.3f}mm with G={GAP_MIN:.1f}-{GAP_MAX:.1f}mm."; return None, [], message
+    return valid_solutions[0], valid_solutions, "Circumference calculation OK."
+
+def find_cylinder_specifications_many(template_widths):
+    """Batch verzija: najbolje rešenje za ceo niz širina u jednom pozivu (rečnik NumPy nizova)."""
+    return get_cylinder_index(PITCH, GAP_MIN, GAP_MAX, Z_MIN, Z_MAX).best_many(template_widths)
+
+def calculate_number_across_width(template_height_H, working_width, width_gap):
+    if template_height_H <= 0: return 0;
+    if template_height_H > working_width: return 0
+    if template_height_H <= working_width and (template_height_H * 2 + width_gap) > working_width: return 1
+    denominator = template_height_H + width_gap;
+    if denominator <= 1e-9: return 0
+    return int(math.floor((working_width + width_gap) / denominator))
+
+def calculate_material_width(number_across_width_y, template_height_H, width_gap, width_waste):
+    if number_across_width_y <= 0: return 0
+    total_template_width = number_across_width_y * template_height_H; total_gap_width = max(0, number_across_width_y - 1) * width_gap
+    return total_template_width + total_gap_width + width_waste
+
+def format_time(total_minutes):
+    if total_minutes < 0: return "N/A"
+    total_minutes = round(total_minutes)
+    if total_minutes == 0: return "0 min"
+    if total_minutes < 60: return f"{total_minutes} min"
+    hours, minutes = divmod(total_minutes, 60); hours = int(hours); minutes = int(minutes)
+    if minutes == 0: return f"{hours} h"
+    return f"{hours} h {minutes} min"
+
+# --- Rezultati: kompaktan zapis umesto rečnika po pozivu ---
+# Redosled ključeva je isti kao redosled upisa u run_single_calculation
+BATCH_RESULT_KEYS = ['required_material_width_mm', 'material_width_exceeded', 'total_production_length_m', 'total_production_area_m2', 'waste_length_m', 'waste_area_m2', 'total_final_length_m', 'total_final_area_m2', 'total_time_min', 'ink_cost_rsd', 'varnish_cost_rsd', 'plate_cost_rsd', 'material_cost_rsd', 'labor_cost_rsd', 'tool_cost_rsd', 'total_production_cost_rsd', 'profit_rsd', 'profit_coefficient_used', 'total_selling_price_rsd', 'selling_price_per_piece_rsd', 'setup_time_min', 'production_time_min', 'cleanup_time_min']
+RESULT_DTYPE = np.dtype([(key, np.bool_ if key == 'material_width_exceeded' else np.float64) for key in BATCH_RESULT_KEYS] + [('valid', np.bool_)])
+
+class CalculationResult(collections.abc.Mapping):
+    """Rezultat run_single_calculation u __slots__ (bez rečnika po objektu). Ponaša se kao rečnik samo za čitanje
+    (r['ključ'], r.get, 'error' in r, {**r}), pa se u dict pretvara tek na granici UI/PDF/baze (to_dict)."""
+    __slots__ = tuple(BATCH_RESULT_KEYS) + ('error',)
+    _KEYS = frozenset(__slots__)
+
+    def __getitem__(self, key):
+        if key not in CalculationResult._KEYS: raise KeyError(key)
+        try: return getattr(self, key)
+        except AttributeError: raise KeyError(key) from None
+
+    def __iter__(self): return (key for key in self.__slots__ if hasattr(self, key))
+
+    def __len__(self): return sum(1 for _ in self)
+
+    def __repr__(self): return f"CalculationResult({dict(self)!r})"
+
+    def to_dict(self): return dict(self)
+
+# --- Faze jedne kalkulacije: run_single_calculation ih sastavlja, a stage_graph.py memoizuje svaku posebno ---
+# Faza dobija None od prethodne kada nema cilindra/traka (grana sa greškom) i tada i sama vraća None
+def calculate_geometry(best_circumference_solution, number_across_width_y, template_width_W, template_height_H, quantity):
+    if not best_circumference_solution or number_across_width_y <= 0: return None
+    required_material_width_mm = calculate_material_width(number_across_width_y, template_height_H, WIDTH_GAP, WIDTH_WASTE)
+    total_production_length_m = (quantity / number_across_width_y) * (template_width_W + best_circumference_solution['gap_G_circumference_mm']) / 1000
+    total_production_area_m2 = total_production_length_m * (required_material_width_mm / 1000) if required_material_width_mm > 0 else 0.0
+    return {"required_material_width_mm": required_material_width_mm, "material_width_exceeded": required_material_width_mm > MAX_MATERIAL_WIDTH, "total_production_length_m": total_production_length_m, "total_production_area_m2": total_production_area_m2}
+
+def calculate_consumption(geometry, is_blank, num_colors):
+    if geometry is None: return None
+    waste_length_m = BASE_WASTE_LENGTH + (0 if is_blank else (num_colors * WASTE_LENGTH_PER_COLOR)); required_material_width_mm = geometry["required_material_width_mm"]
+    waste_area_m2 = waste_length_m * (required_material_width_mm / 1000) if required_material_width_mm > 0 else 0.0
+    return {"waste_length_m": waste_length_m, "waste_area_m2": waste_area_m2, "total_final_length_m": geometry["total_production_length_m"] + waste_length_m, "total_final_area_m2": geometry["total_production_area_m2"] + waste_area_m2}
+
+def calculate_time(geometry, is_blank, num_colors, machine_speed_m_min):
+    if geometry is None: return None
+    setup_time_min = (1 if is_blank else num_colors) * SETUP_TIME_PER_COLOR_OR_BASE
+    production_time_min = (geometry["total_production_length_m"] / machine_speed_m_min) if machine_speed_m_min > 0 else 0.0
+    return {"setup_time_min": setup_time_min, "production_time_min": production_time_min, "cleanup_time_min": CLEANUP_TIME_MIN, "total_time_min": setup_time_min + production_time_min + CLEANUP_TIME_MIN}
+
+def calculate_ink_varnish_cost(geometry, is_blank, num_colors, is_uv_varnish, ink_price_kg, varnish_price_kg):
+    if geometry is None: return None
+    total_production_area_m2 = geometry["total_production_area_m2"]; ink_cost_rsd = 0.0; varnish_cost_rsd = 0.0
+    if not is_blank and num_colors > 0 and total_production_area_m2 > 0: ink_cost_rsd = ((total_production_area_m2 * num_colors * GRAMS_INK_PER_M2) / 1000.0) * ink_price_kg
+    if is_uv_varnish and total_production_area_m2 > 0: varnish_cost_rsd = ((total_production_area_m2 * GRAMS_VARNISH_PER_M2) / 1000.0) * varnish_price_kg
+    return {"ink_cost_rsd": ink_cost_rsd, "varnish_cost_rsd": varnish_cost_rsd}
+
+def calculate_plate_cost(is_blank, num_colors, plate_price_color):
+    return (num_colors * plate_price_color) if not is_blank and num_colors > 0 else 0.0
+
+def calculate_material_cost(consumption, price_per_m2):
+    if consumption is None: return None
+    return consumption["total_final_area_m2"] * price_per_m2 if consumption["total_final_area_m2"] > 0 and price_per_m2 >= 0 else 0.0
+
+def calculate_labor_cost(timing, labor_price_hour):
+    if timing is None: return None
+    return (timing["total_time_min"] / 60.0) * labor_price_hour if timing["total_time_min"] > 0 and labor_price_hour >= 0 else 0.0
+
+def calculate_tool_cost(selected_tool_key, tool_price_semi, tool_price_rot):
+    return tool_price_semi if selected_tool_key == "Semirotary" else (tool_price_rot if selected_tool_key == "Rotary" else 0.0)
+
+def calculate_production_cost(ink_varnish, plate_cost, material_cost, labor_cost, tool_cost):
+    if ink_varnish is None: return None
+    return (ink_varnish["ink_cost_rsd"] + ink_varnish["varnish_cost_rsd"]) + plate_cost + material_cost + labor_cost + tool_cost
+
+def calculate_profit(material_cost, production_cost, profit_coefficient, quantity):
+    if production_cost is None: return None
+    profit_rsd = material_cost * profit_coefficient if material_cost > 0 and profit_coefficient > 0 else 0.0; total_selling_price_rsd = production_cost + profit_rsd
+    return {"profit_rsd": profit_rsd, "profit_coefficient_used": profit_coefficient, "total_selling_price_rsd": total_selling_price_rsd, "selling_price_per_piece_rsd": (total_selling_price_rsd / quantity) if quantity > 0 else 0.0}
+
+def build_calculation_result(geometry, consumption, timing, ink_varnish, plate_cost, material_cost, labor_cost, tool_cost, production_cost, profit):
+    results = CalculationResult()
+    if geometry is None: results.error = "Invalid cylinder/width."; results.total_selling_price_rsd = 0.0; results.selling_price_per_piece_rsd = 0.0; return results
+    for part in (geometry, consumption, timing, ink_varnish, profit):
+        for key, value in part.items(): setattr(results, key, value)
+    results.plate_cost_rsd = plate_cost; results.material_cost_rsd = material_cost; results.labor_cost_rsd = labor_cost; results.tool_cost_rsd = tool_cost; results.total_production_cost_rsd = production_cost
+    return results
+
+# --- Funkcija za jednu kalkulaciju (AŽURIRANA: Uklonjen technology_code) ---
+def run_single_calculation( quantity: int, template_width_W: float, template_height_H: float, best_circumference_solution: dict, number_across_width_y: int, is_blank: bool, num_colors: int, is_uv_varnish: bool, price_per_m2: float, machine_speed_m_min: float, selected_tool_key: str, existing_tool_info: str, profit_coefficient: float, ink_price_kg: float, varnish_price_kg: float, plate_price_color: float, labor_price_hour: float, tool_price_semi: float, tool_price_rot: float ) -> CalculationResult: # Nema technology_code
+    geometry = calculate_geometry(best_circumference_solution, number_across_width_y, template_width_W, template_height_H, quantity)
+    if geometry is None: return build_calculation_result(None, None, None, None, None, None, None, None, None, None)
+    consumption = calculate_consumption(geometry, is_blank, num_colors); timing = calculate_time(geometry, is_blank, num_colors, machine_speed_m_min)
+    ink_varnish = calculate_ink_varnish_cost(geometry, is_blank, num_colors, is_uv_varnish, ink_price_kg, varnish_price_kg); plate_cost = calculate_plate_cost(is_blank, num_colors, plate_price_color)
+    material_cost = calculate_material_cost(consumption, price_per_m2); labor_cost = calculate_labor_cost(timing, labor_price_hour); tool_cost = calculate_tool_cost(selected_tool_key, tool_price_semi, tool_price_rot)
+    production_cost = calculate_production_cost(ink_varnish, plate_cost, material_cost, labor_cost, tool_cost)
+    return build_calculation_result(geometry, consumption, timing, ink_varnish, plate_cost, material_cost, labor_cost, tool_cost, production_cost, calculate_profit(material_cost, production_cost, profit_coefficient, quantity))
+
+# --- Batch (NumPy) kalkulacija: ista formula kao run_single_calculation, ali za nizove (jednakost proverava benchmark.py --verify) ---
+
+def calculate_number_across_width_many(template_heights_H, working_width, width_gap):
+    """Vektorska verzija calculate_number_across_width."""
+    h = np.asarray(template_heights_H, dtype=np.float64); denominator = h + width_gap
+    with np.errstate(divide="ignore", invalid="ignore"): many = np.floor((working_width + width_gap) / denominator)
+    y = np.where((h * 2 + width_gap) > working_width, 1, np.where(denominator <= 1e-9, 0, many))
+    return np.where((h <= 0) | (h > working_width), 0, y).astype(np.int64)
+
+def run_batch_calculation(quantity, template_width_W, template_height_H, is_blank, num_colors, is_uv_varnish, price_per_m2, machine_speed_m_min, selected_tool_key, profit_coefficient, ink_price_kg, varnish_price_kg, plate_price_color, labor_price_hour, tool_price_semi, tool_price_rot, gap_G_circumference_mm=None, number_across_width_y=None, **_ignored) -> dict:
+    """Računa hiljade scenarija u jednom prolazu. Svaki argument je skalar ili niz; nizovi se broadcast-uju
+    (npr. količine[:, None, None] × cene materijala[None, :, None] × boje[None, None, :]) i rezultat je ravan.
+    Ako gap/y nisu dati, računaju se iz W/H (indeks cilindra + broj traka). Može i run_batch_calculation(**df);
+    suvišni ključevi (best_circumference_solution, existing_tool_info) se ignorišu.
+    Vraća rečnik nizova sa istim ključevima kao run_single_calculation + 'valid' masku."""
+    if gap_G_circumference_mm is None: gap_G_circumference_mm = find_cylinder_specifications_many(np.atleast_1d(np.asarray(template_width_W, dtype=np.float64)).reshape(-1))["gap_G_circumference_mm"].reshape(np.shape(template_width_W))
+    if number_across_width_y is None: number_across_width_y = calculate_number_across_width_many(template_height_H, WORKING_WIDTH, WIDTH_GAP)
+    arrays = np.broadcast_arrays(*[np.asarray(v) for v in (quantity, template_width_W, template_height_H, is_blank, num_colors, is_uv_varnish, price_per_m2, machine_speed_m_min, selected_tool_key, profit_coefficient, ink_price_kg, varnish_price_kg, plate_price_color, labor_price_hour, tool_price_semi, tool_price_rot, gap_G_circumference_mm, number_across_width_y)])
+    q, W, H, blank, nc, uv, price_m2, speed, tool, coeff, ink_p, varnish_p, plate_p, labor_p, semi_p, rot_p, gap, y = [a.reshape(-1) for a in arrays]
+    q = q.astype(np.float64); W = W.astype(np.float64); H = H.astype(np.float64); blank = blank.astype(bool); nc = nc.astype(np.int64); uv = uv.astype(bool); y = y.astype(np.int64); gap = gap.astype(np.float64)
+    price_m2, speed, coeff, ink_p, varnish_p, plate_p, labor_p, semi_p, rot_p = [a.astype(np.float64) for a in (price_m2, speed, coeff, ink_p, varnish_p, plate_p, labor_p, semi_p, rot_p)]
+    valid = ~np.isnan(gap) & (y > 0); y_safe = np.where(valid, y, 1); gap = np.where(valid, gap, 0.0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        req_w = (y_safe * H + np.maximum(0, y_safe - 1) * WIDTH_GAP) + WIDTH_WASTE
+        prod_len = (q / y_safe) * (W + gap) / 1000
+        prod_area = np.where(req_w > 0, prod_len * (req_w / 1000), 0.0)
+        waste_len = BASE_WASTE_LENGTH + np.where(blank, 0, nc * WASTE_LENGTH_PER_COLOR)
+        waste_area = np.where(req_w > 0, waste_len * (req_w / 1000), 0.0)
+        final_len = prod_len + waste_len; final_area = prod_area + waste_area
+        setup_t = np.where(blank, 1, nc) * SETUP_TIME_PER_COLOR_OR_BASE
+        prod_t = np.where(speed > 0, prod_len / speed, 0.0)
+        total_t = setup_t + prod_t + CLEANUP_TIME_MIN
+        ink = np.where(~blank & (nc > 0) & (prod_area > 0), ((prod_area * nc * GRAMS_INK_PER_M2) / 1000.0) * ink_p, 0.0)
+        varnish = np.where(uv & (prod_area > 0), ((prod_area * GRAMS_VARNISH_PER_M2) / 1000.0) * varnish_p, 0.0)
+        plate = np.where(~blank & (nc > 0), nc * plate_p, 0.0)
+        material = np.where((final_area > 0) & (price_m2 >= 0), final_area * price_m2, 0.0)
+        labor = np.where((total_t > 0) & (labor_p >= 0), (total_t / 60.0) * labor_p, 0.0)
+        tool_cost = np.where(tool == "Semirotary", semi_p, np.where(tool == "Rotary", rot_p, 0.0))
+        total_prod = (ink + varnish) + plate + material + labor + tool_cost
+        profit = np.where((material > 0) & (coeff > 0), material * coeff, 0.0)
+        total_sell = total_prod + profit
+        per_piece = np.where(q > 0, total_sell / q, 0.0)
+    columns = dict(zip(BATCH_RESULT_KEYS, (req_w, req_w > MAX_MATERIAL_WIDTH, prod_len, prod_area, waste_len, waste_area, final_len, final_area, total_t, ink, varnish, plate, material, labor, tool_cost, total_prod, profit, coeff, total_sell, per_piece, setup_t.astype(np.float64), prod_t, np.full(q.shape, float(CLEANUP_TIME_MIN)))))
+    # Nevalidni redovi (nema cilindra / y=0) dobijaju nule, kao 'error' grana u run_single_calculation
+    for key, column in columns.items(): columns[key] = np.where(valid, column, False if column.dtype == bool else 0.0)
+    columns['valid'] = valid
+    return columns
+
+def batch_to_records(batch):
+    """Rezultat run_batch_calculation kao jedan structured niz (RESULT_DTYPE): red po scenariju, bez Python objekata.
+    Za velike what-if mreže koje se drže u memoriji; u rečnike/DataFrame se pretvara tek za prikaz."""
+    records = np.empty(len(batch['valid']), dtype=RESULT_DTYPE)
+    for key in RESULT_DTYPE.names: records[key] = batch[key]
+    return records
+
+def records_to_dicts(records):
+    """Generator rečnika (isti ključevi kao run_single_calculation + 'valid') za redove structured niza."""
+    names = RESULT_DTYPE.names
+    for row in records.tolist(): yield dict(zip(names, row))
+
+def records_to_frame(records):
+    """structured niz -> pandas DataFrame (pandas se uvozi tek ovde, samo za UI)."""
+    import pandas as pd
+    return pd.DataFrame.from_records(records)
+
+# --- PDF Generation Functions ---
+# ReportLab (platypus, ~150 ms) se uvozi u PDF funkcijama, pri prvom PDF-u, a ne pri importu engine-a (UI, CLI, workeri)
+@functools.lru_cache(maxsize=1)
+def get_pdf_styles():
+    """Stilovi paragrafa i tabela i argumenti za SimpleDocTemplate ('doc') se grade jednom po procesu i dele između svih PDF-ova (samo se čitaju)."""
+    from reportlab.lib.pagesizes import A4
+    from reportlab.platypus import TableStyle
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.lib.units import mm
+    from reportlab.lib import colors
+    from reportlab.lib.enums import TA_CENTER
+    styles = getSampleStyleSheet()
+    return {
+        'sheet': styles,
+        'doc': dict(pagesize=A4, leftMargin=20*mm, rightMargin=20*mm, topMargin=20*mm, bottomMargin=20*mm),
+        'offer_title': ParagraphStyle(name='OfferTitle', parent=styles['h1'], alignment=TA_CENTER, spaceAfter=10*mm),
+        'offer_heading': ParagraphStyle(name='OfferHeading', parent=styles['h2'], spaceBefore=6*mm, spaceAfter=4*mm),
+        'offer_italic': ParagraphStyle(name='ItalicText', parent=styles['Normal'], fontName='Helvetica-Oblique', fontSize=9),
+        'params': TableStyle([('BACKGROUND', (0, 0), (-1, 0), colors.grey), ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke), ('ALIGN', (0, 0), (-1, -1), 'LEFT'), ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'), ('BOTTOMPADDING', (0, 0), (-1, 0), 12), ('BACKGROUND', (0, 1), (-1, -1), colors.beige), ('GRID', (0, 0), (-1, -1), 1, colors.black)]),
+        'config': TableStyle([('BACKGROUND', (0, 0), (-1, 0), colors.darkblue), ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke), ('ALIGN', (0, 0), (-1, -1), 'LEFT'), ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'), ('BOTTOMPADDING', (0, 0), (-1, 0), 12), ('GRID', (0, 0), (-1, -1), 1, colors.black)]),
+        'consumption': TableStyle([('BACKGROUND', (0, 0), (-1, 0), colors.darkblue), ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke), ('ALIGN', (0, 0), (-1, -1), 'CENTER'), ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'), ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'), ('BOTTOMPADDING', (0, 0), (-1, 0), 12), ('GRID', (0, 0), (-1, -1), 1, colors.black)]),
+        'time': TableStyle([('ALIGN', (0, 0), (-1, -1), 'LEFT'), ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'), ('GRID', (0, 0), (-1, -1), 1, colors.black)]),
+        'cost': TableStyle([('BACKGROUND', (0, 0), (-1, 0), colors.darkgreen), ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke), ('ALIGN', (0, 0), (-1, -1), 'LEFT'), ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'), ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'), ('BOTTOMPADDING', (0, 0), (-1, 0), 12), ('BACKGROUND', (0, 1), (-1, -2), colors.lightgreen), ('BACKGROUND', (0, 6), (-1, 6), colors.darkseagreen), ('GRID', (0, 0), (-1, -1), 1, colors.black)]),
+        'final_price': TableStyle([('BACKGROUND', (0, 0), (-1, 0), colors.darkred), ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke), ('ALIGN', (0, 0), (-1, -1), 'LEFT'), ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'), ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'), ('BOTTOMPADDING', (0, 0), (-1, 0), 12), ('BACKGROUND', (0, 1), (-1, -1), colors.antiquewhite), ('BACKGROUND', (0, 3), (-1, 3), colors.lightcoral), ('GRID', (0, 0), (-1, -1), 1, colors.black)]),
+        'offer_spec': TableStyle([('ALIGN', (0, 0), (-1, -1), 'LEFT'), ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'), ('GRID', (0, 0), (-1, -1), 0.5, colors.grey), ('BOTTOMPADDING', (0, 0), (-1, -1), 3*mm), ('TOPPADDING', (0, 0), (-1, -1), 3*mm)]),
+        'offer_prices': TableStyle([('BACKGROUND', (0, 0), (-1, 0), colors.darkgrey), ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke), ('ALIGN', (0, 0), (-1, 0), 'CENTER'), ('ALIGN', (0, 1), (0, -1), 'RIGHT'), ('ALIGN', (1, 1), (-1, -1), 'RIGHT'), ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'), ('BOTTOMPADDING', (0, 0), (-1, -1), 3*mm), ('TOPPADDING', (0, 0), (-1, -1), 3*mm), ('GRID', (0, 0), (-1, -1), 1, colors.black)]),
+    }
+
+# (create_pdf - AŽURIRAN: Uklonjena Technology iz parametara)
+def create_pdf(data):
+    """Gradi PDF izveštaj kalkulacije. Vraća BytesIO; greške ReportLab-a propušta pozivaocu."""
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table
+    from reportlab.lib.units import mm
+    pdf_styles = get_pdf_styles(); buffer = io.BytesIO(); styles = pdf_styles['sheet']; doc = SimpleDocTemplate(buffer, **pdf_styles['doc'])
+    story = []; styleN = styles['Normal']
+    def bold_paragraph(text): return Paragraph(f"<b>{text}</b>", styleN)
+    story.append(Paragraph("Print Calculation Report", styles['h1'])); story.append(Spacer(1, 6*mm))
+    story.append(Paragraph(f"<b>Client:</b> {data.get('client_name', 'N/A')}", styleN)); story.append(Paragraph(f"<b>Product/Label:</b> {data.get('product_name', 'N/A')}", styleN)); story.append(Paragraph(f"<b>Date Generated:</b> {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", styleN)); story.append(Spacer(1, 6*mm))
+    story.append(Paragraph("Input Parameters Summary", styles['h2']))
+    # Uklonjena Technology
+    params_data = [['Parameter', 'Value'], ['Template Width (W)', f"{data.get('template_width_W_input', 'N/A'):.3f} mm"], ['Template Height (H)', f"{data.get('template_height_H_input', 'N/A'):.3f} mm"], ['Desired Quantity', f"{data.get('quantity_input', 'N/A'):,}"], ['Colors', 'Blank' if data.get('is_blank') else f"{data.get('valid_num_colors_for_calc', 'N/A')}"], ['UV Varnish', 'Yes' if data.get('is_uv_varnish_input') else 'No'], ['Material', f"{data.get('selected_material', 'N/A')}"], ['Tool', f"{data.get('tool_info_string', 'N/A')}"], ['Machine Speed', f"{data.get('machine_speed_m_min', 'N/A')} m/min"], ['Profit Coefficient (Used)', f"{data.get('profit_coefficient_used', 'N/A'):.3f}"]]
+    params_table = Table(params_data, colWidths=[80*mm, 80*mm]); params_table.setStyle(pdf_styles['params']); story.append(params_table); story.append(Spacer(1, 6*mm))
+    story.append(Paragraph("Calculation Results", styles['h2'])); story.append(Paragraph("1. Cylinder and Template Configuration", styles['h3']))
+    bc_sol = data.get('best_circumference_solution', {}); config_data = [['Item', 'Value'], ['Number of Teeth (Z)', f"{bc_sol.get('number_of_teeth_Z', 'N/A')}"], ['Cylinder Circumference', f"{bc_sol.get('circumference_mm', 0.0):.3f} mm"], ['Circumference Gap (G)', f"{data.get('gap_G_circumference_mm', 0.0):.3f} mm"], ['Templates Circumference (x)', f"{data.get('number_circumference_x', 'N/A')}"], ['Templates Width (y)', f"{data.get('number_across_width_y', 'N/A')}"], ['Format (y × x)', f"{data.get('number_across_width_y', 'N/A')} × {data.get('number_circumference_x', 'N/A')}"]]
+    config_table = Table(config_data, colWidths=[80*mm, 80*mm]); config_table.setStyle(pdf_styles['config']); story.append(config_table); story.append(Spacer(1, 4*mm))
+    story.append(Paragraph("2. Material Width", styles['h3'])); mat_width_status = f"OK (≤ {MAX_MATERIAL_WIDTH} mm)" if not data.get('material_width_exceeded') else f"⚠️ EXCEEDED! (> {MAX_MATERIAL_WIDTH} mm)"; story.append(Paragraph(f"Required Material Width: {data.get('required_material_width_mm', 0.0):.2f} mm ({mat_width_status})", styleN)); story.append(Spacer(1, 4*mm))
+    story.append(Paragraph("3. Material Consumption", styles['h3'])); consumption_data_styled = [['Category', 'Length (m)', 'Area (m²)'], ['Production', f"{data.get('total_production_length_m', 0.0):,.2f}", f"{data.get('total_production_area_m2', 0.0):,.2f}"], ['Waste (Setup)', f"{data.get('waste_length_m', 0.0):,.2f}", f"{data.get('waste_area_m2', 0.0):,.2f}"], [bold_paragraph('TOTAL'), bold_paragraph(f"{data.get('total_final_length_m', 0.0):,.2f}"), bold_paragraph(f"{data.get('total_final_area_m2', 0.0):,.2f}")]]
+    consumption_table = Table(consumption_data_styled, colWidths=[50*mm, 55*mm, 55*mm]); consumption_table.setStyle(pdf_styles['consumption']); story.append(consumption_table); story.append(Spacer(1, 4*mm))
+    story.append(Paragraph("4. Estimated Production Time", styles['h3'])); time_data_styled = [['Setup Time', format_time(data.get('setup_time_min', 0.0))], ['Production Time', format_time(data.get('production_time_min', 0.0))], ['Cleanup Time', format_time(data.get('cleanup_time_min', 0.0))], [bold_paragraph('TOTAL Work Time'), bold_paragraph(format_time(data.get('total_time_min', 0.0)))]]
+    time_table = Table(time_data_styled, colWidths=[80*mm, 80*mm]); time_table.setStyle(pdf_styles['time']); story.append(time_table); story.append(Spacer(1, 6*mm))
+    story.append(Paragraph("Cost Calculation", styles['h2'])); cost_data_styled = [['Cost Item', 'Amount (RSD)'], ['Ink + Varnish', f"{data.get('total_ink_varnish_cost_rsd', 0.0):,.2f}"], ['Plates', f"{data.get('plate_cost_rsd', 0.0):,.2f}"], ['Material', f"{data.get('material_cost_rsd', 0.0):,.2f}"], ['Tool', f"{data.get('tool_cost_rsd', 0.0):,.2f}"], ['Machine Labor', f"{data.get('labor_cost_rsd', 0.0):,.2f}"], [bold_paragraph('Total Production Cost'), bold_paragraph(f"{data.get('total_production_cost_rsd', 0.0):,.2f}")]]
+    cost_table = Table(cost_data_styled, colWidths=[80*mm, 80*mm]); cost_table.setStyle(pdf_styles['cost']); story.append(cost_table); story.append(Spacer(1, 6*mm))
+    story.append(Paragraph("Final Price Summary", styles['h2'])); final_price_data_styled = [['Item', 'Amount (RSD)'], ['Total Production Cost', f"{data.get('total_production_cost_rsd', 0.0):,.2f}"], ['Profit', f"{data.get('profit_rsd', 0.0):,.2f} ({data.get('profit_coefficient_used', 0.0)*100:.1f}%)"], [bold_paragraph('TOTAL PRICE (Selling)'), bold_paragraph(f"{data.get('total_selling_price_rsd', 0.0):,.2f}")], ['Selling Price per Piece', f"{data.get('selling_price_per_piece_rsd', 0.0):.4f}"]]
+    final_price_table = Table(final_price_data_styled, colWidths=[80*mm, 80*mm]); final_price_table.setStyle(pdf_styles['final_price']); story.append(final_price_table)
+    doc.build(story); buffer.seek(0); return buffer
+
+# (PDF Ponude - AŽURIRAN: Uklonjena Šifra Tehnologije iz specifikacije)
+OFFER_DELIVERY_KEY = "Rok isporuke"  # Opciona kolona u offer_results (datum kao tekst)
+
+def create_offer_pdf(data):
+    """Gradi PDF ponude. Vraća BytesIO; greške ReportLab-a propušta pozivaocu."""
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table
+    from reportlab.lib.units import mm
+    pdf_styles = get_pdf_styles(); buffer = io.BytesIO(); doc = SimpleDocTemplate(buffer, **pdf_styles['doc'])
+    styles = pdf_styles['sheet']; story = []; styleNormal = styles['Normal']
+    styleH1_Offer = pdf_styles['offer_title']; styleH2_Offer = pdf_styles['offer_heading']; styleItalic = pdf_styles['offer_italic']
+    def bold_paragraph(text): return Paragraph(f"<b>{text}</b>", styleNormal)
+    story.append(Paragraph("PONUDA / OFFER", styleH1_Offer)); offer_date = datetime.datetime.now().strftime('%d.%m.%Y')
+    story.append(Paragraph(f"<b>Datum / Date:</b> {offer_date}", styleNormal)); story.append(Paragraph(f"<b>Za / To:</b> {data.get('client_name', 'N/A')}", styleNormal)); story.append(Spacer(1, 6*mm))
+    story.append(Paragraph(f"<b>Predmet / Subject:</b> Ponuda za izradu samolepljivih etiketa / Offer for self-adhesive label production", styleNormal)); story.append(Paragraph(f"<b>Proizvod / Product:</b> {data.get('product_name', 'N/A')}", styleNormal)); story.append(Spacer(1, 6*mm))
+    story.append(Paragraph("Specifikacija / Specification:", styleH2_Offer)); spec_list_data = data.get('specifications', {});
+    # Uklonjena Šifra Tehnologije iz specifikacije za PDF ponude
+    spec_table_data = [ [bold_paragraph(k), v] for k, v in spec_list_data.items() if k != "Šifra Tehnologije" ]
+    spec_table = Table(spec_table_data, colWidths=[50*mm, 110*mm]); spec_table.setStyle(pdf_styles['offer_spec']); story.append(spec_table); story.append(Spacer(1, 8*mm))
+    story.append(Paragraph("Cene / Prices:", styleH2_Offer)); offer_results = data.get('offer_results', []); price_table_data = [[bold_paragraph("Količina (kom)"), bold_paragraph("Cena/kom (RSD)"), bold_paragraph("Ukupno (RSD)")]]
+    # Rok isporuke po količini (scheduler.py) ako je procenjen, inače "Po dogovoru"
+    has_delivery = any(row.get(OFFER_DELIVERY_KEY) for row in offer_results)
+    if has_delivery: price_table_data[0].append(bold_paragraph("Rok isporuke"))
+    for row in offer_results: price_table_data.append([ f"{row.get('Količina (kom)', 0):,}", f"{row.get('Cena/kom (RSD)', 0.0):.4f}", f"{row.get('Ukupno (RSD)', 0.0):,.2f}" ] + ([row.get(OFFER_DELIVERY_KEY) or "Po dogovoru"] if has_delivery else []))
+    if len(price_table_data) > 1:
+        price_table = Table(price_table_data, colWidths=[35*mm, 40*mm, 45*mm, 40*mm] if has_delivery else [50*mm, 55*mm, 55*mm])
+        price_table.setStyle(pdf_styles['offer_prices']); story.append(price_table); story.append(Spacer(1, 4*mm))
+        story.append(Paragraph("<i>Napomena: U cene nije uključen PDV. Cena alata je uključena u ukupnu cenu (ako je primenjivo).</i>", styleItalic)); story.append(Paragraph("<i>Note: VAT is not included. Tool cost is included in the total price (if applicable).</i>", styleItalic))
+    else: story.append(Paragraph("Nema dostupnih cena za prikaz.", styleNormal))
+    story.append(Spacer(1, 10*mm)); story.append(Paragraph("<b>Rok isporuke / Delivery Time:</b> " + ("prema tabeli cena, procena po trenutnom opterećenju mašina / see price table, estimate based on current press load" if has_delivery else "Po dogovoru / As agreed"), styleNormal)); story.append(Paragraph("<b>Paritet / Incoterms:</b> FCO magacin Kupca / FCO Buyer's warehouse", styleNormal)); story.append(Paragraph("<b>Validnost ponude / Offer Validity:</b> 15 dana / 15 days", styleNormal))
+    doc.build(story); buffer.seek(0); return buffer
+
+# --- Keš renderovanih PDF-ova (ključ = hash ulaznih podataka) ---
+PDF_CACHE_MAX_ENTRIES = 64
+PDF_CACHE_MAX_BYTES = 32 * 1024 * 1024
+PDF_BUILDERS = {"calc": create_pdf, "offer": create_offer_pdf}
+_pdf_cache = collections.OrderedDict(); _pdf_cache_lock = threading.Lock()
+_pdf_cache_stats = {"hits": 0, "misses": 0, "bytes": 0}
+
+def pdf_cache_key(kind, data):
+    """SHA-256 kanonskog JSON-a ulaznih podataka. Današnji datum je deo ključa jer ga PDF ispisuje."""
+    payload = json.dumps({"kind": kind, "date": datetime.date.today().isoformat(), "data": data}, sort_keys=True, default=str, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def render_pdf_cached(kind, data):
+    """Vraća bajtove PDF-a ('calc' ili 'offer') iz LRU keša, a renderuje samo na promašaj.
+    Keš je ograničen brojem stavki i ukupnom veličinom; greške ReportLab-a propušta pozivaocu."""
+    key = pdf_cache_key(kind, data)
+    with _pdf_cache_lock:
+        if key in _pdf_cache: _pdf_cache.move_to_end(key); _pdf_cache_stats["hits"] += 1; return _pdf_cache[key]
+        _pdf_cache_stats["misses"] += 1
+    pdf_bytes = PDF_BUILDERS[kind](data).getvalue()
+    with _pdf_cache_lock:
+        if key not in _pdf_cache: _pdf_cache[key] = pdf_bytes; _pdf_cache_stats["bytes"] += len(pdf_bytes)
+        while _pdf_cache and (len(_pdf_cache) > PDF_CACHE_MAX_ENTRIES or _pdf_cache_stats["bytes"] > PDF_CACHE_MAX_BYTES):
+            _, evicted = _pdf_cache.popitem(last=False); _pdf_cache_stats["bytes"] -= len(evicted)
+    return pdf_bytes
+
+def pdf_cache_info():
+    with _pdf_cache_lock: return dict(_pdf_cache_stats, entries=len(_pdf_cache))
+
+# --- Poslovi (jobs) za headless i batch upotrebu ---
+# Ključ u settings tabeli i fallback vrednost za svaki cenovni argument run_single_calculation
+PRICE_SETTINGS = { "ink_price_kg": ("ink_price_per_kg", FALLBACK_INK_PRICE), "varnish_price_kg": ("varnish_price_per_kg", FALLBACK_VARNISH_PRICE), "plate_price_color": ("plate_price_per_color", FALLBACK_PLATE_PRICE), "labor_price_hour": ("machine_labor_price_per_hour", FALLBACK_LABOR_PRICE), "tool_price_semi": ("tool_price_semirotary", FALLBACK_TOOL_SEMI_PRICE), "tool_price_rot": ("tool_price_rotary", FALLBACK_TOOL_ROT_PRICE) }
+TOOL_TYPES = ["None", "Semirotary", "Rotary"]
+JOB_RESULT_KEYS = ['number_of_teeth_Z', 'templates_N_circumference', 'gap_G_circumference_mm', 'number_across_width_y'] + BATCH_RESULT_KEYS + ['error']
+
+def prices_from_settings(settings):
+    """Pretvara rečnik iz settings tabele u cenovne argumente za kalkulaciju (sa fallback vrednostima)."""
+    settings = settings or {}
+    return {arg: float(settings.get(key, fallback)) for arg, (key, fallback) in PRICE_SETTINGS.items()}
+
+def job_to_params(job, settings=None, materials=None):
+    """Pretvara jedan posao (rečnik) u argumente za run_batch_calculation. Podiže ValueError za neispravan posao.
+    Posao: template_width_W, template_height_H, quantity, num_colors, is_blank, is_uv_varnish, material ili
+    price_per_m2, machine_speed_m_min, tool_type, profit_coefficient (sve osim dimenzija i količine je opciono)."""
+    settings = settings or {}; materials = materials or {}
+    try: width = float(job["template_width_W"]); height = float(job["template_height_H"]); quantity = int(job["quantity"])
+    except (KeyError, TypeError, ValueError) as e: raise ValueError(f"Missing or invalid dimensions/quantity: {e}")
+    if job.get("price_per_m2") not in (None, ""): price_per_m2 = float(job["price_per_m2"])
+    elif job.get("material") in materials: price_per_m2 = float(materials[job["material"]])
+    else: raise ValueError(f"Unknown material: {job.get('material')!r}")
+    tool_type = job.get("tool_type") or "None"
+    if tool_type not in TOOL_TYPES: raise ValueError(f"Unknown tool type: {tool_type!r}")
+    is_blank = bool(job.get("is_blank", False)); num_colors = int(job.get("num_colors") or 1)
+    speed = job.get("machine_speed_m_min"); coeff = job.get("profit_coefficient")
+    params = { "quantity": quantity, "template_width_W": width, "template_height_H": height, "is_blank": is_blank, "num_colors": 0 if is_blank else (num_colors if num_colors >= 1 else 1), "is_uv_varnish": bool(job.get("is_uv_varnish", False)), "price_per_m2": price_per_m2, "machine_speed_m_min": float(speed) if speed not in (None, "") else float(settings.get("machine_speed_default", FALLBACK_MACHINE_SPEED)), "selected_tool_key": tool_type, "existing_tool_info": job.get("existing_tool_info") or "", "profit_coefficient": float(coeff) if coeff not in (None, "") else float(settings.get("single_calc_profit_coefficient", FALLBACK_SINGLE_PROFIT)) }
+    params.update(prices_from_settings(settings))
+    return params
+
+def price_jobs(jobs, settings=None, materials=None):
+    """Cenu za listu poslova računa jednim batch prolazom. Vraća listu rečnika (posao + JOB_RESULT_KEYS) istim redom.
+    Neispravni poslovi i poslovi bez cilindra dobijaju poruku u 'error' i nule u rezultatima."""
+    params_list = []; errors = []
+    for job in jobs:
+        try: params_list.append(job_to_params(job, settings, materials)); errors.append(None)
+        except ValueError as e: params_list.append(None); errors.append(str(e))
+    ok = [p for p in params_list if p is not None]; output = []
+    if ok:
+        columns = {key: [p[key] for p in ok] for key in ok[0]}
+        cylinders = find_cylinder_specifications_many(columns["template_width_W"]); lanes = calculate_number_across_width_many(columns["template_height_H"], WORKING_WIDTH, WIDTH_GAP)
+        batch = run_batch_calculation(gap_G_circumference_mm=cylinders["gap_G_circumference_mm"], number_across_width_y=lanes, **columns)
+    row = 0
+    for job, params, error in zip(jobs, params_list, errors):
+        record = dict(job)
+        if params is None: record.update({key: None for key in JOB_RESULT_KEYS}); record["error"] = error; output.append(record); continue
+        record.update({ "number_of_teeth_Z": int(cylinders["number_of_teeth_Z"][row]), "templates_N_circumference": int(cylinders["templates_N_circumference"][row]), "gap_G_circumference_mm": float(cylinders["gap_G_circumference_mm"][row]) if cylinders["found"][row] else None, "number_across_width_y": int(lanes[row]) })
+        record.update({key: batch[key][row].item() for key in BATCH_RESULT_KEYS})
+        if not cylinders["found"][row]: record["error"] = f"No cylinder found ({Z_MIN}-{Z_MAX} teeth) for W={params['template_width_W']:.3f}mm with G={GAP_MIN:.1f}-{GAP_MAX:.1f}mm."
+        elif not batch["valid"][row]: record["error"] = "Invalid cylinder/width."
+        else: record["error"] = None
+        output.append(record); row += 1
+    return output
+
+# --- Ponude: specifikacija i lestvica količina (zajedničko za UI i bulk_offers) ---
+def offer_profit_coefficients(settings=None, quantities=QUANTITIES_FOR_OFFER):
+    """Koeficijenti profita za lestvicu količina (settings ključ profit_coeff_<qty>, inače FALLBACK_PROFITS)."""
+    settings = settings or {}
+    return [float(settings.get(f'profit_coeff_{qty}', FALLBACK_PROFITS.get(qty, 0.20))) for qty in quantities]
+
+def tool_info_string(tool_type, existing_tool_info=""):
+    """Opis alata kao u UI-ju: 'Existing: ...' za postojeći alat, inače tip alata."""
+    tool_type = tool_type or "None"
+    return f"Existing: {existing_tool_info}" if tool_type == "None" and existing_tool_info else tool_type
+
+def offer_specifications(template_width_W, template_height_H, material, is_blank, num_colors, is_uv_varnish, tool_info):
+    """Tabela specifikacije za ponudu (bez Šifre Tehnologije)."""
+    num_colors_display = 0 if is_blank else (num_colors if num_colors >= 1 else 1)
+    return {"Dimenzija (mm)": f"{template_width_W:.2f} x {template_height_H:.2f}", "Materijal": material, "Broj boja": "Blank" if is_blank else num_colors_display, "UV Lak": "Da" if is_uv_varnish else "Ne", "Alat": tool_info }
@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+"""Planer zajedničkih tiraža (gang run): više poslova na istoj traci materijala.
+
+Poslovi iste porodice (materijal, broj boja, blank, UV lak) mogu da dele jedan
+tiraž: jedna priprema (boje × SETUP_TIME_PER_COLOR_OR_BASE), jedno pranje
+(CLEANUP_TIME_MIN) i jedan početni otpad, umesto po jednom za svaki posao.
+Tiraž je niz slotova; slot je jedan ili više poslova jedan pored drugog
+(trake) na istom cilindru Z, u okviru WORKING_WIDTH. Svi slotovi tiraža idu
+na istoj širini materijala (najširi slot), a između slotova je izmena
+ploča/alata (CHANGEOVER_TIME_MIN, CHANGEOVER_WASTE_LENGTH). Slot traje dok
+najduži posao u njemu ne bude gotov, pa se trake raspoređuju tako da se
+dužine poslova izjednače.
+
+Pretraga je heuristička (lokalna pretraga sa vremenskim budžetom): kreće od
+jednog tiraža po porodici (svaki posao u svom slotu, najbolji samostalni
+raspored), pa spaja slotove u trake, premešta slotove između tiraža i spaja
+tiraže dok god to smanjuje trošak materijala, rada, boje i laka. Ploče i
+alati su po poslu i ne menjaju se. Upoređuje se sa cenom svakog posla zasebno,
+izračunatom kao u UI-ju (podrazumevani cilindar iz find_cylinder_specifications,
+najveći broj traka i run_single_calculation).
+
+    python gang_planner.py jobs.csv -o plan.json --time-budget 2
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import engine
+import db
+from batch_cli import read_jobs
+from cylinder_index import get_cylinder_index
+
+CHANGEOVER_TIME_MIN = 15.0  # Izmena ploča/alata između slotova istog tiraža (boje i materijal ostaju)
+CHANGEOVER_WASTE_LENGTH = 15.0  # m otpada pri izmeni
+Z_CANDIDATES = 4  # Koliko zajedničkih Z se proba pri spajanju slotova
+DEFAULT_TIME_BUDGET_S = 2.0
+_EPS = 1e-6
+
+
+class _Family:
+    """Poslovi jedne porodice i cenovni parametri zajednički za njihove tiraže."""
+
+    def __init__(self, key, params):
+        self.key = key; self.params = params
+        first = params[0]; self.is_blank = first['is_blank']; self.num_colors = first['num_colors']; self.is_uv_varnish = first['is_uv_varnish']
+        self.price_per_m2 = first['price_per_m2']; self.labor_price_hour = first['labor_price_hour']; self.ink_price_kg = first['ink_price_kg']; self.varnish_price_kg = first['varnish_price_kg']
+        self._slot_cache = {}
+
+
+def _z_options(params):
+    """Z -> (n, C) sa najkraćim segmentom C/n za širinu posla."""
+    options = {}
+    for solution in get_cylinder_index(engine.PITCH, engine.GAP_MIN, engine.GAP_MAX, engine.Z_MIN, engine.Z_MAX).solutions(params['template_width_W']):
+        z = solution['number_of_teeth_Z']
+        if z not in options or solution['templates_N_circumference'] > options[z][0]: options[z] = (solution['templates_N_circumference'], solution['circumference_mm'])
+    return options
+
+
+def _lanes_width(heights_and_lanes):
+    """Širina trake materijala za listu (H, y), kao calculate_material_width za više poslova."""
+    lanes = sum(y for _, y in heights_and_lanes); printed = sum(h * y for h, y in heights_and_lanes)
+    return printed + max(0, lanes - 1) * engine.WIDTH_GAP + engine.WIDTH_WASTE if lanes > 0 else 0.0
+
+
+def run_metrics(family, slots):
+    """Materijal, vreme i trošak jednog tiraža (lista slotova). Za jedan posao u jednom slotu daje iste
+    dužine, površine i vreme kao run_single_calculation."""
+    width = max(slot['width_mm'] for slot in slots); prod_len = sum(slot['length_m'] for slot in slots); changes = len(slots) - 1
+    speed = min(min(family.params[i]['machine_speed_m_min'] for i in slot['jobs']) for slot in slots)
+    waste_len = engine.BASE_WASTE_LENGTH + (0 if family.is_blank else family.num_colors * engine.WASTE_LENGTH_PER_COLOR) + changes * CHANGEOVER_WASTE_LENGTH
+    prod_area = prod_len * (width / 1000); final_area = (prod_len + waste_len) * (width / 1000)
+    time_min = (1 if family.is_blank else family.num_colors) * engine.SETUP_TIME_PER_COLOR_OR_BASE + (prod_len / speed if speed > 0 else 0.0) + engine.CLEANUP_TIME_MIN + changes * CHANGEOVER_TIME_MIN
+    ink = (prod_area * family.num_colors * engine.GRAMS_INK_PER_M2 / 1000.0) * family.ink_price_kg if not family.is_blank and family.num_colors > 0 else 0.0
+    varnish = (prod_area * engine.GRAMS_VARNISH_PER_M2 / 1000.0) * family.varnish_price_kg if family.is_uv_varnish else 0.0
+    cost = final_area * family.price_per_m2 + (time_min / 60.0) * family.labor_price_hour + ink + varnish
+    return {"width_mm": width, "production_length_m": prod_len, "waste_length_m": waste_len, "total_area_m2": final_area, "time_min": time_min, "cost_rsd": cost}
+
+
+def ui_metrics(params):
+    """Površina, vreme i trošak (materijal + rad + boja + lak) posla štampanog zasebno, kako ga računa UI."""
+    solution, _, _ = engine.find_cylinder_specifications(params['template_width_W'])
+    lanes = engine.calculate_number_across_width(params['template_height_H'], engine.WORKING_WIDTH, engine.WIDTH_GAP)
+    result = engine.run_single_calculation(best_circumference_solution=solution, number_across_width_y=lanes, **{key: value for key, value in params.items() if not key.startswith('_')})
+    return {"total_area_m2": result['total_final_area_m2'], "time_min": result['total_time_min'], "cost_rsd": result['material_cost_rsd'] + result['labor_cost_rsd'] + result['ink_cost_rsd'] + result['varnish_cost_rsd']}
+
+
+def _make_slot(family, jobs, z, lanes):
+    params = family.params; options = [params[i]['_z_options'][z] for i in jobs]
+    lengths = [params[i]['quantity'] / y * (c / n) / 1000 for i, (n, c), y in zip(jobs, options, lanes)]
+    return {"jobs": tuple(jobs), "z": z, "n": tuple(n for n, _ in options), "circumference_mm": options[0][1], "lanes": tuple(lanes), "length_m": max(lengths), "width_mm": _lanes_width([(params[i]['template_height_H'], y) for i, y in zip(jobs, lanes)])}
+
+
+def best_slot(family, jobs):
+    """Najjeftiniji slot za dati skup poslova (zajednički Z + raspodela traka) ili None ako ne staju zajedno."""
+    jobs = tuple(sorted(jobs))
+    if jobs in family._slot_cache: return family._slot_cache[jobs]
+    params = family.params; result = None
+    common = set.intersection(*(set(params[i]['_z_options']) for i in jobs))
+    if common and _lanes_width([(params[i]['template_height_H'], 1) for i in jobs]) - engine.WIDTH_WASTE <= engine.WORKING_WIDTH:
+        # Z koji daje najkraću ukupnu dužinu štampe (q × segment) je najbolji kandidat
+        ranked = sorted(common, key=lambda z: (sum(params[i]['quantity'] * params[i]['_z_options'][z][1] / params[i]['_z_options'][z][0] for i in jobs), z))
+        for z in ranked[:Z_CANDIDATES]:
+            lanes = [1] * len(jobs); slot = _make_slot(family, jobs, z, lanes); best = (run_metrics(family, [slot])['cost_rsd'], slot)
+            while True:
+                # Još jedna traka poslu koji najduže traje, dok god staje u radnu širinu
+                slowest = max(range(len(jobs)), key=lambda k: params[jobs[k]]['quantity'] * params[jobs[k]]['_z_options'][z][1] / params[jobs[k]]['_z_options'][z][0] / lanes[k])
+                lanes[slowest] += 1
+                if _lanes_width([(params[i]['template_height_H'], y) for i, y in zip(jobs, lanes)]) - engine.WIDTH_WASTE > engine.WORKING_WIDTH: break
+                slot = _make_slot(family, jobs, z, list(lanes)); cost = run_metrics(family, [slot])['cost_rsd']
+                if cost < best[0]: best = (cost, slot)
+            if result is None or best[0] < result[0]: result = best
+    family._slot_cache[jobs] = result[1] if result else None
+    return family._slot_cache[jobs]
+
+
+def _run_cost(family, run):
+    return run_metrics(family, run)['cost_rsd'] if run else 0.0
+
+
+def _run_of(runs, slot):
+    return next(r for r, run in enumerate(runs) if any(s is slot for s in run))
+
+
+def _merge_lanes(family, runs, deadline):
+    """Spaja parove slotova u jedan slot sa više traka (i iz različitih tiraža). Vraća (poboljšano, istekao budžet)."""
+    improved = False; timed_out = False; order = sorted((slot for run in runs for slot in run), key=lambda slot: slot['length_m']); i = 0
+    while i < len(order):
+        a = order[i]; merged_b = None
+        for b in order[i + 1:]:
+            if time.perf_counter() > deadline: timed_out = True; break # Provera po paru: jedan prolaz kroz order je O(n) best_slot poziva
+            merged = best_slot(family, a['jobs'] + b['jobs'])
+            if merged is None: continue
+            ra = _run_of(runs, a); rb = _run_of(runs, b)
+            new_a = [merged if slot is a else slot for slot in runs[ra] if slot is not b]; new_b = [slot for slot in runs[rb] if slot is not b] if ra != rb else None
+            delta = _run_cost(family, new_a) - _run_cost(family, runs[ra]) + ((_run_cost(family, new_b) - _run_cost(family, runs[rb])) if ra != rb else 0.0)
+            if delta < -_EPS:
+                runs[ra] = new_a
+                if ra != rb: runs[rb] = new_b
+                order[i] = merged; merged_b = b; improved = True; break
+        if timed_out: break
+        if merged_b is None: i += 1
+        else: order = [slot for slot in order if slot is not merged_b] # Isti (spojeni) slot pokušava dalje spajanje
+    runs[:] = [run for run in runs if run] # I pri isteku budžeta: spajanje je možda ispraznilo neki tiraž
+    return improved, timed_out
+
+
+def _move_slots(family, runs, deadline):
+    """Premešta slot u drugi tiraž ili u novi (npr. uski slot iz tiraža sa širokim materijalom)."""
+    improved = False; timed_out = False
+    for slot in sorted((slot for run in runs for slot in run), key=lambda slot: slot['width_mm']):
+        a = _run_of(runs, slot); rest = [s for s in runs[a] if s is not slot]; saved = _run_cost(family, runs[a]) - _run_cost(family, rest)
+        best = (-_EPS, None)
+        for b in [None] + [b for b in range(len(runs)) if b != a and runs[b]]:
+            if time.perf_counter() > deadline: timed_out = True; break
+            added = _run_cost(family, [slot]) if b is None else _run_cost(family, runs[b] + [slot]) - _run_cost(family, runs[b])
+            if added - saved < best[0]: best = (added - saved, b)
+        if timed_out: break
+        if best[0] < -_EPS and (best[1] is not None or rest):
+            runs[a] = rest
+            if best[1] is None: runs.append([slot])
+            else: runs[best[1]] = runs[best[1]] + [slot]
+            improved = True
+    runs[:] = [run for run in runs if run]
+    return improved, timed_out
+
+
+def _merge_runs(family, runs, deadline):
+    """Spaja dva tiraža u niz (jedna priprema, pranje i početni otpad)."""
+    improved = False; a = 0
+    while a < len(runs):
+        for b in range(a + 1, len(runs)):
+            if time.perf_counter() > deadline: return improved, True
+            if _run_cost(family, runs[a] + runs[b]) - _run_cost(family, runs[a]) - _run_cost(family, runs[b]) < -_EPS: runs[a] = runs[a] + runs[b]; del runs[b]; improved = True; break
+        else: a += 1
+    return improved, False
+
+
+def _plan_family(family, deadline):
+    """Lokalna pretraga nad tiražima jedne porodice. Vraća (tiraži, da li je pretraga prekinuta budžetom).
+    Početno rešenje je jedan tiraž sa svim poslovima u nizu (najveća ušteda pripreme odmah), pa se
+    naizmenično spajaju trake, premeštaju slotovi i spajaju tiraži dok ima poboljšanja ili vremena."""
+    runs = [[best_slot(family, (i,)) for i in range(len(family.params))]]
+    if _run_cost(family, runs[0]) > sum(_run_cost(family, [slot]) for slot in runs[0]): runs = [[slot] for slot in runs[0]]
+    improved = True
+    while improved:
+        improved = False
+        for step in (_merge_lanes, _move_slots, _merge_runs):
+            step_improved, timed_out = step(family, runs, deadline); improved |= step_improved
+            if timed_out: return runs, True
+    return runs, False
+
+
+def plan_gang_runs(jobs, settings=None, materials=None, time_budget_s=DEFAULT_TIME_BUDGET_S):
+    """Grupiše poslove (kao za engine.price_jobs) u zajedničke tiraže. Vraća rečnik: runs (tiraži sa slotovima
+    i trakama), unplanned [(indeks, greška)], standalone (svaki posao zasebno, kao u UI-ju: ui_metrics) i planned zbirovi
+    (površina, vreme, trošak), savings_rsd (standalone - planned), elapsed_s i timed_out. Trošak je materijal + rad +
+    boja + lak; ploče i alati se ne menjaju. time_budget_s je ukupno vreme, uključujući cenu svakog posla zasebno."""
+    start = time.perf_counter(); deadline = start + time_budget_s
+    families = {}; unplanned = []
+    for index, job in enumerate(jobs):
+        try: params = engine.job_to_params(job, settings, materials)
+        except ValueError as e: unplanned.append((index, str(e))); continue
+        params['_z_options'] = _z_options(params); params['_index'] = index
+        if not params['_z_options']: unplanned.append((index, f"No cylinder found ({engine.Z_MIN}-{engine.Z_MAX} teeth) for W={params['template_width_W']:.3f}mm")); continue
+        if params['template_height_H'] > engine.WORKING_WIDTH: unplanned.append((index, "Template height exceeds working width")); continue
+        key = (job.get("material") or "", params['price_per_m2'], params['num_colors'], params['is_blank'], params['is_uv_varnish'])
+        families.setdefault(key, []).append(params)
+    plan = {"runs": [], "unplanned": unplanned, "standalone": {"total_area_m2": 0.0, "time_min": 0.0, "cost_rsd": 0.0}, "planned": {"total_area_m2": 0.0, "time_min": 0.0, "cost_rsd": 0.0}, "timed_out": False}
+    # Poređenje je sa cenom iz UI-ja, ne sa najboljim samostalnim rasporedom iz best_slot (on je samo početno rešenje pretrage)
+    family_list = [_Family(key, params_list) for key, params_list in sorted(families.items(), key=lambda item: len(item[1]))]
+    for family in family_list:
+        for params in family.params:
+            metrics = ui_metrics(params)
+            for total in ("total_area_m2", "time_min", "cost_rsd"): plan["standalone"][total] += metrics[total]
+    # Ostatak budžeta se deli srazmerno broju poslova; manje porodice prve, neiskorišćeno vreme prelazi na sledeće
+    remaining_jobs = sum(len(family.params) for family in family_list)
+    for family in family_list:
+        now = time.perf_counter(); family_deadline = now + max(0.0, deadline - now) * len(family.params) / remaining_jobs; remaining_jobs -= len(family.params)
+        runs, timed_out = _plan_family(family, family_deadline); plan["timed_out"] |= timed_out
+        for run in runs:
+            metrics = run_metrics(family, run)
+            for total in ("total_area_m2", "time_min", "cost_rsd"): plan["planned"][total] += metrics[total]
+            plan["runs"].append(_describe_run(family, run, metrics))
+    plan["savings_rsd"] = plan["standalone"]["cost_rsd"] - plan["planned"]["cost_rsd"]; plan["elapsed_s"] = time.perf_counter() - start
+    return plan
+
+
+def _describe_run(family, run, metrics):
+    material, price_per_m2, num_colors, is_blank, is_uv_varnish = family.key
+    slots = []
+    for slot in run:
+        lanes = []
+        for i, n, y in zip(slot['jobs'], slot['n'], slot['lanes']):
+            params = family.params[i]; segment_m = slot['circumference_mm'] / n / 1000
+            lanes.append({"job_index": params['_index'], "template_width_W": params['template_width_W'], "template_height_H": params['template_height_H'], "quantity": params['quantity'], "templates_N_circumference": n, "number_across_width_y": y, "produced_quantity": int(slot['length_m'] / segment_m * y + 1e-9)})
+        slots.append({"number_of_teeth_Z": slot['z'], "circumference_mm": slot['circumference_mm'], "length_m": slot['length_m'], "width_mm": slot['width_mm'], "lanes": lanes})
+    return {"material": material, "price_per_m2": price_per_m2, "num_colors": num_colors, "is_blank": is_blank, "is_uv_varnish": is_uv_varnish, **metrics, "slots": slots}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Plan gang runs: combine queued jobs that share material and colors.")
+    parser.add_argument("input", help="Jobs file (.csv or .jsonl), '-' for stdin (JSONL)")
+    parser.add_argument("-o", "--output", default=None, help="Write the plan as JSON to this file")
+    parser.add_argument("--db", default=None, help=f"SQLite database with settings/materials (default {db.DB_FILE})")
+    parser.add_argument("--no-db", action="store_true", help="Use fallback prices only, do not open the database")
+    parser.add_argument("--time-budget", type=float, default=DEFAULT_TIME_BUDGET_S, help=f"Total time budget in seconds, including pricing each job on its own as the UI does (default {DEFAULT_TIME_BUDGET_S})")
+    args = parser.parse_args(argv)
+    settings = {}; materials = {}
+    if not args.no_db:
+        if args.db: db.DB_FILE = args.db
+        if not os.path.exists(db.DB_FILE): parser.error(f"Database not found: {db.DB_FILE} (use --no-db for fallback prices)")
+        settings = db.load_settings_from_db() or {}; materials = db.load_materials_from_db() or {}
+    jobs = list(read_jobs(args.input))
+    plan = plan_gang_runs(jobs, settings, materials, time_budget_s=args.time_budget)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as handle: json.dump(plan, handle, indent=2, ensure_ascii=False); handle.write("\n")
+    standalone = plan["standalone"]; planned = plan["planned"]
+    print(f"{len(jobs)} jobs -> {len(plan['runs'])} runs ({len(plan['unplanned'])} not plannable) in {plan['elapsed_s']:.2f} s{' (time budget reached)' if plan['timed_out'] else ''}", file=sys.stderr)
+    print(f"Each job on its own (UI pricing) -> gang runs: Material: {standalone['total_area_m2']:,.1f} -> {planned['total_area_m2']:,.1f} m2 | Machine time: {standalone['time_min'] / 60:,.1f} -> {planned['time_min'] / 60:,.1f} h | Cost: {standalone['cost_rsd']:,.0f} -> {planned['cost_rsd']:,.0f} RSD (saves {plan['savings_rsd']:,.0f})", file=sys.stderr)
+    for index, error in plan["unplanned"]: print(f"Job {index}: {error}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
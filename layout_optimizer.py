@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""Optimizacija rasporeda: orijentacija etikete, cilindar (Z, n) i broj traka y.
+
+Kalkulacija zavisi od cilindra samo preko dužine segmenta W + G = C / n
+(dužina proizvodnje je količina / y * segment), pa je za istu orijentaciju i
+isto y svaki cilindar sa dužim segmentom dominiran. Zato se za svaku
+orijentaciju zadržava samo cilindar sa najkraćim segmentom (pri jednakom
+segmentu najmanji Z), a zatim se isprobavaju sve trake y koje staju u
+WORKING_WIDTH i MAX_MATERIAL_WIDTH. Preostalih nekoliko desetina rasporeda
+računa se jednim run_batch_calculation pozivom i rangira po ceni proizvodnje.
+"""
+import math
+import numpy as np
+import engine
+from cylinder_index import get_cylinder_index
+
+LAYOUT_KEYS = ['rotated', 'template_width_W', 'template_height_H', 'number_of_teeth_Z', 'circumference_mm', 'templates_N_circumference', 'gap_G_circumference_mm', 'number_across_width_y', 'required_material_width_mm', 'total_production_cost_rsd', 'total_selling_price_rsd', 'selling_price_per_piece_rsd', 'total_final_area_m2', 'total_time_min', 'is_current', 'savings_vs_current_rsd']
+
+
+def _shortest_segment(solutions):
+    """Cilindar sa najkraćim segmentom C/n (pri jednakom segmentu najmanji Z, pa najveći n)."""
+    return min(solutions, key=lambda s: (s['circumference_mm'] / s['templates_N_circumference'], s['number_of_teeth_Z'], -s['templates_N_circumference']))
+
+
+def layout_candidates(template_width_W, template_height_H, allow_rotation=True):
+    """Nedominirani rasporedi kao lista (rotated, W, H, cilindar, y) i trenutni raspored iz UI-ja (ili None)
+    (unesena orijentacija, prvo rešenje iz find_cylinder_specifications, najveći y)."""
+    index = get_cylinder_index(engine.PITCH, engine.GAP_MIN, engine.GAP_MAX, engine.Z_MIN, engine.Z_MAX)
+    orientations = [(False, template_width_W, template_height_H)]
+    if allow_rotation and not math.isclose(template_width_W, template_height_H): orientations.append((True, template_height_H, template_width_W))
+    candidates = []; current = None
+    for rotated, width, height in orientations:
+        solutions = index.solutions(width) if width > 0 else []
+        y_max = engine.calculate_number_across_width(height, engine.WORKING_WIDTH, engine.WIDTH_GAP)
+        if not solutions or y_max <= 0: continue
+        if not rotated: current = (False, width, height, solutions[0], y_max)
+        cylinder = _shortest_segment(solutions)
+        for y in range(1, y_max + 1):
+            if engine.calculate_material_width(y, height, engine.WIDTH_GAP, engine.WIDTH_WASTE) > engine.MAX_MATERIAL_WIDTH: break
+            candidates.append((rotated, width, height, cylinder, y))
+    return candidates, current
+
+
+def optimize_layout(params, top=10, allow_rotation=True):
+    """Rangirani najjeftiniji rasporedi za argumente run_single_calculation (best_circumference_solution i
+    number_across_width_y se ignorišu). Vraća listu rečnika sa LAYOUT_KEYS, od najjeftinijeg; is_current
+    označava raspored koji UI trenutno računa, a savings_vs_current_rsd uštedu u odnosu na njega."""
+    candidates, current = layout_candidates(float(params['template_width_W']), float(params['template_height_H']), allow_rotation)
+    if not candidates: return []
+    rows = candidates + ([current] if current is not None else [])
+    base = {key: value for key, value in params.items() if key not in ('best_circumference_solution', 'number_across_width_y', 'template_width_W', 'template_height_H')}
+    batch = engine.run_batch_calculation(template_width_W=np.array([r[1] for r in rows], dtype=np.float64), template_height_H=np.array([r[2] for r in rows], dtype=np.float64), gap_G_circumference_mm=np.array([r[3]['gap_G_circumference_mm'] for r in rows], dtype=np.float64), number_across_width_y=np.array([r[4] for r in rows], dtype=np.int64), **base)
+    current_cost = float(batch['total_production_cost_rsd'][-1]) if current is not None else None
+    layouts = []
+    for i, (rotated, width, height, cylinder, y) in enumerate(candidates):
+        if not batch['valid'][i]: continue
+        is_current = current is not None and not rotated and y == current[4] and math.isclose(cylinder['circumference_mm'] / cylinder['templates_N_circumference'], current[3]['circumference_mm'] / current[3]['templates_N_circumference'])
+        cost = float(batch['total_production_cost_rsd'][i])
+        layouts.append({ "rotated": rotated, "template_width_W": width, "template_height_H": height, "number_of_teeth_Z": cylinder['number_of_teeth_Z'], "circumference_mm": cylinder['circumference_mm'], "templates_N_circumference": cylinder['templates_N_circumference'], "gap_G_circumference_mm": cylinder['gap_G_circumference_mm'], "number_across_width_y": y, "required_material_width_mm": float(batch['required_material_width_mm'][i]), "total_production_cost_rsd": cost, "total_selling_price_rsd": float(batch['total_selling_price_rsd'][i]), "selling_price_per_piece_rsd": float(batch['selling_price_per_piece_rsd'][i]), "total_final_area_m2": float(batch['total_final_area_m2'][i]), "total_time_min": float(batch['total_time_min'][i]), "is_current": is_current, "savings_vs_current_rsd": (current_cost - cost) if current_cost is not None else None })
+    layouts.sort(key=lambda layout: (layout['total_production_cost_rsd'], layout['total_selling_price_rsd'], layout['required_material_width_mm']))
+    return layouts[:top]
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""Test opterećenja za pricing_service.py: održivi broj zahteva u sekundi i latencije.
+
+N klijenata (keep-alive veze) šalje zahteve bez pauze tokom --duration sekundi.
+Mešavina: --repeat udeo zahteva bira posao iz malog skupa "popularnih" (keš i
+coalescing), ostali su jedinstveni (puna kalkulacija), a --pdf udeo ide na
+/offer/pdf. Bez --url servis se pokreće kao podproces na slobodnom portu.
+
+    python load_test.py --concurrency 32 --duration 10
+    python load_test.py --url http://127.0.0.1:8765 --pdf 0.05 -o load.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import signal
+import subprocess
+import sys
+import time
+import urllib.parse
+import diagnostics
+
+POPULAR_JOBS = 50
+STOP_TIMEOUT_S = 10.0
+MATERIAL = "Thermal Paper"
+
+
+def percentile(samples, fraction):
+    samples = sorted(samples)
+    return samples[int(fraction * (len(samples) - 1))] if samples else 0.0
+
+
+def make_request(rng, repeat, pdf):
+    """(putanja, telo) za jedan zahtev."""
+    if rng.random() < repeat: rng = random.Random(rng.randrange(POPULAR_JOBS)) # Popularan posao: isti seed daje isti posao
+    job = {"template_width_W": round(rng.uniform(20, 150), 1), "template_height_H": round(rng.uniform(15, 120), 1), "quantity": rng.choice([1000, 2500, 5000, 10000, 20000]), "num_colors": rng.randint(1, 6), "material": MATERIAL, "tool_type": rng.choice(["None", "Semirotary", "Rotary"]), "client_name": "Load", "product_name": f"P{rng.randrange(10 ** 6)}"}
+    if rng.random() < pdf: job.pop("quantity"); return "/offer/pdf", job
+    return "/price", job
+
+
+async def _client(host, port, deadline, rng, repeat, pdf, latencies, statuses):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while time.perf_counter() < deadline:
+            path, job = make_request(rng, repeat, pdf); body = json.dumps(job).encode("utf-8")
+            start = time.perf_counter()
+            writer.write(f"POST {path} HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n".encode("latin-1") + body)
+            status = int((await reader.readline()).split()[1]); length = 0
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b""): break
+                if line.lower().startswith(b"content-length:"): length = int(line.split(b":", 1)[1])
+            await reader.readexactly(length)
+            latencies[path].append((time.perf_counter() - start) * 1000.0); statuses[status] = statuses.get(status, 0) + 1
+    finally: writer.close()
+
+
+async def run_load(host, port, concurrency, duration_s, repeat, pdf, seed=0):
+    """Vraća izveštaj: requests, elapsed_s, requests_per_s, statuses, latency {putanja: summarize + p99_ms}."""
+    latencies = {"/price": [], "/offer/pdf": []}; statuses = {}
+    start = time.perf_counter(); deadline = start + duration_s
+    await asyncio.gather(*(_client(host, port, deadline, random.Random(seed * 100003 + i), repeat, pdf, latencies, statuses) for i in range(concurrency)))
+    elapsed = time.perf_counter() - start; every = [ms for samples in latencies.values() for ms in samples]
+    latency = {path: dict(diagnostics.summarize(samples), p99_ms=percentile(samples, 0.99)) for path, samples in list(latencies.items()) + [("all", every)] if samples}
+    return {"concurrency": concurrency, "duration_s": duration_s, "repeat": repeat, "pdf": pdf, "requests": len(every), "elapsed_s": elapsed, "requests_per_s": len(every) / elapsed if elapsed > 0 else 0.0, "statuses": statuses, "latency": latency}
+
+
+def spawn_service(db_path=None, pdf_workers=0):
+    """Pokreće pricing_service.py na slobodnom portu. Vraća (proces, port)."""
+    command = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "pricing_service.py"), "--port", "0", "--pdf-workers", str(pdf_workers)] + (["--db", db_path] if db_path else [])
+    process = subprocess.Popen(command, stderr=subprocess.PIPE, text=True)
+    line = process.stderr.readline(); match = re.search(r":(\d+) \(", line)
+    if not match: process.kill(); raise RuntimeError(f"Pricing service did not start: {line.strip() or process.stderr.read().strip()}")
+    return process, int(match.group(1))
+
+
+def stop_service(process, timeout_s=STOP_TIMEOUT_S):
+    """SIGINT (kao Ctrl+C, servis gasi i PDF workere), pa kill ako se ne ugasi za timeout_s."""
+    process.send_signal(signal.SIGINT)
+    try: process.wait(timeout=timeout_s)
+    except subprocess.TimeoutExpired: process.kill(); process.wait()
+    process.stderr.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test for pricing_service.py.")
+    parser.add_argument("--url", default=None, help="Running service (default: start one on a free port)")
+    parser.add_argument("--db", default=None, help="Database for the started service")
+    parser.add_argument("--pdf-workers", type=int, default=0, help="PDF workers for the started service (0 = all cores)")
+    parser.add_argument("--concurrency", type=int, default=32, help="Concurrent keep-alive clients (default 32)")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds of load (default 10)")
+    parser.add_argument("--repeat", type=float, default=0.5, help=f"Share of requests for one of {POPULAR_JOBS} popular jobs (default 0.5)")
+    parser.add_argument("--pdf", type=float, default=0.0, help="Share of requests for /offer/pdf (default 0)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", default=None, help="Write the report as JSON")
+    args = parser.parse_args(argv)
+    process = None
+    if args.url: parsed = urllib.parse.urlsplit(args.url); host = parsed.hostname or "127.0.0.1"; port = parsed.port or 80
+    else: process, port = spawn_service(args.db, args.pdf_workers); host = "127.0.0.1"
+    try: report = asyncio.run(run_load(host, port, max(1, args.concurrency), args.duration, args.repeat, args.pdf, args.seed))
+    finally:
+        if process is not None: stop_service(process)
+    print(f"{report['requests']:,} requests in {report['elapsed_s']:.1f} s: {report['requests_per_s']:,.0f} req/s with {report['concurrency']} clients, statuses {report['statuses']}")
+    for path, stats in report["latency"].items(): print(f"  {path:<11} n={stats['count']:>7,}  p50 {stats['p50_ms']:7.2f} ms  p95 {stats['p95_ms']:7.2f} ms  p99 {stats['p99_ms']:7.2f} ms  max {stats['max_ms']:7.2f} ms")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as handle: json.dump(report, handle, indent=2)
+    return 0 if set(report["statuses"]) <= {200} else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+"""Lokalni HTTP/JSON servis za cene (ERP, web shop) bez Streamlit-a.
+
+Jedan asyncio proces sa minimalnim HTTP/1.1 serverom (keep-alive, samo stdlib).
+Isti zahtev koji je već u obradi se ne računa ponovo: kasniji pozivaoci čekaju
+isti Future (coalescing). Gotovi rezultati se čuvaju u LRU kešu čiji ključ je
+putanja + kanonski JSON tela + verzija podešavanja/cena iz SettingsCache, pa
+izmena cene u bazi automatski poništava stare rezultate. Kalkulacije idu u
+pool niti, a renderovanje PDF-a u pool procesa (forkserver/spawn, kao bulk_offers,
+jer proces već ima niti). Ako se zahtev koji računa otkaže (klijent ode, SIGTERM),
+zahtevi koji su čekali njegov rezultat računaju sami umesto da čekaju zauvek.
+
+    python pricing_service.py --port 8765 --pdf-workers 2
+
+    POST /cylinder   {"template_width_W": 50}
+    POST /price      {posao kao u batch_cli.py} ili {"jobs": [...]}
+    POST /offer      {proizvod kao u bulk_offers.py} -> lestvica količina
+    POST /offer/pdf  isto, odgovor je application/pdf
+    GET  /health, GET /stats
+"""
+import argparse
+import asyncio
+import collections
+import concurrent.futures
+import datetime
+import json
+import os
+import signal
+import sys
+import time
+import engine
+import db
+import diagnostics
+import bulk_offers
+from settings_cache import get_settings_cache
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+CACHE_MAX_ENTRIES = 10000
+MAX_BODY_BYTES = 1024 * 1024
+MAX_JOBS_PER_REQUEST = 10000
+LATENCY_SAMPLES = 5000  # Broj poslednjih merenja koja se čuvaju po putanji
+KEEP_ALIVE_TIMEOUT_S = 30.0
+STATUS_TEXT = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 413: "Payload Too Large", 500: "Internal Server Error"}
+
+
+class RequestError(Exception):
+    """Greška u zahtevu klijenta; status ide u HTTP odgovor."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message); self.status = status
+
+
+def _as_object(body):
+    if not isinstance(body, dict): raise RequestError("Request body must be a JSON object")
+    return body
+
+
+def cylinder_response(body, settings, materials):
+    try: width = float(_as_object(body)["template_width_W"])
+    except (KeyError, TypeError, ValueError): raise RequestError("template_width_W must be a number")
+    best, solutions, message = engine.find_cylinder_specifications(width)
+    return {"best": best, "solutions": solutions, "message": message}
+
+
+def price_response(body, settings, materials):
+    """Jedan posao ili {"jobs": [...]}; odgovor su zapisi iz engine.price_jobs."""
+    body = _as_object(body); jobs = body.get("jobs") if "jobs" in body else [body]
+    if not isinstance(jobs, list) or not all(isinstance(job, dict) for job in jobs): raise RequestError("jobs must be a list of objects")
+    if len(jobs) > MAX_JOBS_PER_REQUEST: raise RequestError(f"At most {MAX_JOBS_PER_REQUEST} jobs per request", 413)
+    records = engine.price_jobs(jobs, settings, materials)
+    return {"results": records} if "jobs" in body else records[0]
+
+
+def offer_response(body, settings, materials):
+    """Lestvica količina i specifikacija za jedan proizvod (offer_pdf_data kao u UI-ju)."""
+    product, offer_data, error = bulk_offers.price_offer_ladders([_as_object(body)], settings, materials)[0]
+    if offer_data is None: raise RequestError(error or "Could not price the offer")
+    return offer_data
+
+
+ROUTES = {"/cylinder": cylinder_response, "/price": price_response, "/offer": offer_response}
+
+
+class _LeaderCancelled(Exception):
+    """Zahtev koji je računao rezultat za ostale (coalescing) je otkazan pre kraja."""
+
+
+class PricingService:
+    """Coalescing + LRU keš oko engine funkcija. Sve metode se zovu iz jedne event loop niti."""
+
+    def __init__(self, pdf_workers=1, cache_max_entries=CACHE_MAX_ENTRIES):
+        self.cache_max_entries = cache_max_entries; self._cache = collections.OrderedDict(); self._in_flight = {}
+        self._pdf_pool = concurrent.futures.ProcessPoolExecutor(max_workers=pdf_workers, mp_context=bulk_offers.worker_mp_context()) if pdf_workers > 0 else None
+        self.stats = collections.Counter(); self._latency = collections.defaultdict(lambda: collections.deque(maxlen=LATENCY_SAMPLES))
+
+    def close(self):
+        if self._pdf_pool is not None: self._pdf_pool.shutdown(wait=True, cancel_futures=True)
+
+    async def _snapshot(self):
+        # Provera data_version ide u bazu najviše jednom u CHECK_INTERVAL_S, pa ne blokira loop duže od jednog upita
+        return await asyncio.get_running_loop().run_in_executor(None, get_settings_cache().snapshot)
+
+    async def _coalesced(self, key, compute):
+        """Rezultat iz keša, iz zahteva koji je već u obradi, ili novim pozivom compute()."""
+        if key in self._cache: self._cache.move_to_end(key); self.stats["cache_hits"] += 1; return self._cache[key]
+        if key in self._in_flight:
+            self.stats["coalesced"] += 1
+            try: return await asyncio.shield(self._in_flight[key])
+            except _LeaderCancelled: return await self._coalesced(key, compute) # Prvi od čekalaca postaje novi računar
+        self.stats["computed"] += 1
+        future = self._in_flight[key] = asyncio.get_running_loop().create_future()
+        try: result = await compute()
+        except BaseException as e: # I CancelledError: čekaoci se uvek oslobađaju
+            future.set_exception(e if isinstance(e, Exception) else _LeaderCancelled()); future.exception() # Greška se ne kešira; označena kao preuzeta i bez čekalaca
+            raise
+        finally: self._in_flight.pop(key, None)
+        future.set_result(result); self._cache[key] = result
+        while len(self._cache) > self.cache_max_entries: self._cache.popitem(last=False)
+        return result
+
+    async def handle(self, method, path, body):
+        """Vraća (status, content_type, bajtovi odgovora)."""
+        if path == "/health": return 200, "application/json", b'{"status":"ok"}'
+        if path == "/stats": return 200, "application/json", json.dumps(self.snapshot_stats(), default=str).encode("utf-8")
+        is_pdf = path == "/offer/pdf"; handler = ROUTES.get("/offer" if is_pdf else path)
+        if handler is None: raise RequestError(f"Unknown path: {path}", 404)
+        if method != "POST": raise RequestError("Use POST with a JSON body", 405)
+        try: payload = json.loads(body or b"null")
+        except ValueError as e: raise RequestError(f"Invalid JSON: {e}")
+        version, settings, materials = await self._snapshot()
+        canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+        loop = asyncio.get_running_loop()
+
+        async def compute_json():
+            result = await loop.run_in_executor(None, handler, payload, settings, materials)
+            return json.dumps(result, default=str).encode("utf-8")
+
+        if not is_pdf: return 200, "application/json", await self._coalesced((path, canonical, version), compute_json)
+
+        async def compute_pdf():
+            offer_data = json.loads(await self._coalesced(("/offer", canonical, version), compute_json))
+            task = (bulk_offers.offer_filename(offer_data, {}), offer_data)
+            if self._pdf_pool is None: _, pdf_bytes, _, error = await loop.run_in_executor(None, bulk_offers.render_offer, task)
+            else: _, pdf_bytes, _, error = await asyncio.wrap_future(self._pdf_pool.submit(bulk_offers.render_offer, task))
+            if pdf_bytes is None: raise RuntimeError(f"PDF rendering failed: {error}")
+            return pdf_bytes
+
+        # Datum je deo ključa jer ga PDF ispisuje (isto kao engine.pdf_cache_key)
+        return 200, "application/pdf", await self._coalesced((path, canonical, version, datetime.date.today().isoformat()), compute_pdf)
+
+    def record_latency(self, path, elapsed_ms):
+        self._latency[path if path in ROUTES or path == "/offer/pdf" else "other"].append(elapsed_ms)
+
+    def snapshot_stats(self):
+        return {"cache_entries": len(self._cache), "in_flight": len(self._in_flight), **self.stats, "latency": {path: diagnostics.summarize(samples) for path, samples in self._latency.items()}, "queries": db.query_stats()}
+
+
+async def _read_request(reader):
+    """(method, path, keep_alive, body) ili None kad klijent zatvori vezu."""
+    request_line = await reader.readline()
+    if not request_line.strip(): return None
+    try: method, target, version = request_line.decode("latin-1").split()
+    except ValueError: raise RequestError("Malformed request line")
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""): break
+        name, _, value = line.decode("latin-1").partition(":"); headers[name.strip().lower()] = value.strip()
+    try: length = int(headers.get("content-length", 0))
+    except ValueError: raise RequestError("Invalid Content-Length")
+    if length > MAX_BODY_BYTES: raise RequestError(f"Body larger than {MAX_BODY_BYTES} bytes", 413)
+    body = await reader.readexactly(length) if length else b""
+    keep_alive = headers.get("connection", "").lower() != "close" and version.upper() == "HTTP/1.1"
+    return method.upper(), target.split("?", 1)[0], keep_alive, body
+
+
+def _response(status, content_type, payload, keep_alive):
+    head = f"HTTP/1.1 {status} {STATUS_TEXT.get(status, 'Error')}\r\nContent-Type: {content_type}\r\nContent-Length: {len(payload)}\r\nConnection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+    return head.encode("latin-1") + payload
+
+
+async def serve_connection(service, reader, writer):
+    """Obrađuje zahteve jedne keep-alive veze redom, dok je klijent ne zatvori."""
+    try:
+        while True:
+            try: request = await asyncio.wait_for(_read_request(reader), KEEP_ALIVE_TIMEOUT_S)
+            except RequestError as e: writer.write(_response(e.status, "application/json", json.dumps({"error": str(e)}).encode("utf-8"), False)); break
+            if request is None: break
+            method, path, keep_alive, body = request; start = time.perf_counter()
+            try: status, content_type, payload = await service.handle(method, path, body)
+            except RequestError as e: status, content_type, payload = e.status, "application/json", json.dumps({"error": str(e)}).encode("utf-8")
+            except Exception as e: status, content_type, payload = 500, "application/json", json.dumps({"error": str(e)}).encode("utf-8")
+            writer.write(_response(status, content_type, payload, keep_alive)); await writer.drain()
+            service.record_latency(path, (time.perf_counter() - start) * 1000.0)
+            if not keep_alive: break
+    except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError): pass
+    finally:
+        writer.close()
+        try: await writer.wait_closed()
+        except ConnectionError: pass
+
+
+async def run_server(host=DEFAULT_HOST, port=DEFAULT_PORT, pdf_workers=1, ready=None):
+    """Pokreće servis dok se task ne otkaže (i na SIGTERM). ready(port) se poziva kad server sluša (port 0 = slobodan port).
+    Pri gašenju se gasi i pool procesa za PDF, pa workeri ne ostaju da rade posle servisa."""
+    service = PricingService(pdf_workers=pdf_workers); loop = asyncio.get_running_loop()
+    try: loop.add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    except (NotImplementedError, RuntimeError, ValueError): pass # Windows ili loop van glavne niti: samo otkazivanje taska
+    server = await asyncio.start_server(lambda reader, writer: serve_connection(service, reader, writer), host, port)
+    try:
+        async with server:
+            if ready: ready(server.sockets[0].getsockname()[1])
+            await server.serve_forever()
+    finally: service.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local HTTP/JSON pricing service.")
+    parser.add_argument("--host", default=DEFAULT_HOST, help=f"Address to bind (default {DEFAULT_HOST}, localhost only)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"Port (default {DEFAULT_PORT}, 0 = any free port)")
+    parser.add_argument("--db", default=None, help=f"SQLite database with settings/materials (default {db.DB_FILE})")
+    parser.add_argument("--pdf-workers", type=int, default=0, help="PDF render processes (0 = all cores)")
+    args = parser.parse_args(argv)
+    if args.db: db.DB_FILE = args.db
+    if not os.path.exists(db.DB_FILE): parser.error(f"Database not found: {db.DB_FILE}")
+    db.init_db()
+    pdf_workers = args.pdf_workers if args.pdf_workers > 0 else (os.cpu_count() or 1)
+    ready = lambda port: print(f"Pricing service on http://{args.host}:{port} ({pdf_workers} PDF workers)", file=sys.stderr, flush=True)
+    try: asyncio.run(run_server(args.host, args.port, pdf_workers, ready))
+    except (KeyboardInterrupt, asyncio.CancelledError): pass # Ctrl+C ili SIGTERM; pool je već ugašen u run_server
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+"""Ponovni obračun sačuvane istorije po današnjim cenama i izveštaj o odstupanju (drift).
+
+calculations tabela se čita u blokovima po id-u (keyset, bez jedne duge transakcije). Svaki red se vraća u posao
+za engine i računa se jednim batch prolazom po bloku dva puta: po današnjim cenama i po cenama koje su važile u
+trenutku kalkulacije (price_history, migracija v6). Sa --workers N blokovi idu u N procesa (najviše 2 bloka po
+procesu u letu), a izveštaj se upisuje blok po blok u CSV/JSONL, pa memorija ne zavisi od veličine istorije.
+
+U izveštaju (DRIFT_COLUMNS) margin_at_old_price_pct je marža koju bi stara ponuda imala sa današnjim troškom,
+a reproduced_price_per_piece je cena ponovo izračunata po istorijskim cenama (provera da je snapshot tačan).
+
+    python requote.py -o drift.csv --workers 4
+    python requote.py --material "Thermal Paper" --since 2024-01-01 -o drift.jsonl
+    python requote.py --snapshot "2024-06-01 12:00:00"
+"""
+import argparse
+import bisect
+import collections
+import concurrent.futures
+import datetime
+import heapq
+import json
+import os
+import sys
+import time
+import engine
+import db
+from batch_cli import ResultWriter
+
+DRIFT_COLUMNS = ["id", "timestamp", "client_name", "product_name", "quantity", "material_name", "old_price_per_piece", "new_price_per_piece", "price_drift_pct", "reproduced_price_per_piece", "old_cost", "new_cost", "old_margin_pct", "margin_at_old_price_pct", "margin_change_pct", "error"]
+REPRODUCED_TOLERANCE_RSD = 0.01  # Stara ukupna cena je reprodukovana ako se razlikuje najviše ovoliko
+WORST_ROWS = 10
+
+_worker_state = None
+
+
+class PriceTimeline:
+    """Cene kroz vreme iz db.load_price_history(). snapshot_at(timestamp) vraća (settings, materials) kakvi su tada važili."""
+
+    def __init__(self, changes):
+        self._changes = list(changes); self._times = [change["changed_at"] for change in self._changes]
+        self._snapshots = {}; self._cursor = (0, {}, {})
+
+    def index_at(self, timestamp):
+        """Broj promena koje su važile u trenutku timestamp (tekst kao calculations.timestamp, UTC)."""
+        return bisect.bisect_right(self._times, timestamp or "")
+
+    def snapshot(self, index):
+        if index not in self._snapshots:
+            # Redovi idu po id-u, pa skoro uvek po vremenu: snapshot se gradi dalje od poslednjeg, a ne od početka
+            start, settings, materials = self._cursor if self._cursor[0] <= index else (0, {}, {})
+            settings = dict(settings); materials = dict(materials)
+            for change in self._changes[start:index]:
+                target = settings if change["kind"] == "setting" else materials
+                if change["value"] is None: target.pop(change["key"], None)
+                else: target[change["key"]] = change["value"]
+            self._snapshots[index] = self._cursor = (index, settings, materials)
+        return self._snapshots[index][1:]
+
+    def snapshot_at(self, timestamp):
+        return self.snapshot(self.index_at(timestamp))
+
+
+def row_to_job(row):
+    """Red iz calculations tabele kao posao za engine, sa sačuvanom količinom i koeficijentom profita."""
+    return dict(db.calculation_row_to_job(row), quantity=row["quantity"], profit_coefficient=row["profit_coefficient"])
+
+
+def _pct(part, whole):
+    return part / whole * 100.0 if part is not None and whole else None
+
+
+def drift_record(row, new, old):
+    """Jedan red izveštaja iz sačuvanog reda, obračuna po današnjim (new) i po istorijskim cenama (old)."""
+    old_total = row["calculated_total_price"]; old_pp = row["calculated_price_per_piece"]
+    new_pp = None if new["error"] else new["selling_price_per_piece_rsd"]; new_cost = None if new["error"] else new["total_production_cost_rsd"]
+    old_cost = row["total_production_cost_rsd"] if row["total_production_cost_rsd"] is not None else (None if old["error"] else old["total_production_cost_rsd"])
+    old_margin = _pct(old_total - old_cost, old_total) if old_total is not None and old_cost is not None else None
+    margin_at_old_price = _pct(old_total - new_cost, old_total) if old_total is not None and new_cost is not None else None
+    return {"id": row["id"], "timestamp": row["timestamp"], "client_name": row["client_name"], "product_name": row["product_name"], "quantity": row["quantity"], "material_name": row["material_name"],
+            "old_price_per_piece": old_pp, "new_price_per_piece": new_pp, "price_drift_pct": _pct(new_pp - old_pp, old_pp) if new_pp is not None and old_pp is not None else None,
+            "reproduced_price_per_piece": None if old["error"] else old["selling_price_per_piece_rsd"], "old_cost": old_cost, "new_cost": new_cost,
+            "old_margin_pct": old_margin, "margin_at_old_price_pct": margin_at_old_price, "margin_change_pct": margin_at_old_price - old_margin if old_margin is not None and margin_at_old_price is not None else None,
+            "error": new["error"], "_old_total": old_total, "_new_total": None if new["error"] else new["total_selling_price_rsd"], "_reproduced_total": None if old["error"] else old["total_selling_price_rsd"]}
+
+
+def requote_rows(rows, settings, materials, timeline):
+    """Drift zapisi za blok redova. Današnje cene su jedan batch; istorijske po jedan batch za svaki snapshot u bloku."""
+    jobs = [row_to_job(row) for row in rows]; current = engine.price_jobs(jobs, settings, materials)
+    groups = collections.defaultdict(list); historical = [None] * len(rows)
+    for i, row in enumerate(rows): groups[timeline.index_at(row["timestamp"])].append(i)
+    for index, positions in groups.items():
+        old_settings, old_materials = timeline.snapshot(index)
+        # Sačuvana cena po m2 (od migracije v4) je tačnija od cene materijala iz snapshot-a
+        old_jobs = [dict(jobs[i], price_per_m2=rows[i]["price_per_m2"]) if rows[i]["price_per_m2"] is not None else jobs[i] for i in positions]
+        for i, record in zip(positions, engine.price_jobs(old_jobs, old_settings, old_materials)): historical[i] = record
+    return [drift_record(row, new, old) for row, new, old in zip(rows, current, historical)]
+
+
+def _init_worker(settings, materials, timeline):
+    global _worker_state
+    _worker_state = (settings, materials, timeline)
+
+
+def _requote_chunk(rows):
+    return requote_rows(rows, *_worker_state)
+
+
+def iter_calculation_chunks(chunk_size=1000, filters=None):
+    """Generator blokova sačuvanih kalkulacija po id-u. Podiže RuntimeError ako baza nije dostupna."""
+    after_id = 0
+    while True:
+        rows = db.load_calculations_after(after_id, chunk_size, filters)
+        if rows is None: raise RuntimeError(f"Could not read calculations from {db.DB_FILE}")
+        if not rows: return
+        yield rows; after_id = rows[-1]["id"]
+
+
+class DriftSummary:
+    """Zbirni pokazatelji u konstantnoj memoriji: ukupno, po materijalu i WORST_ROWS najvećih odstupanja."""
+
+    def __init__(self):
+        self.rows = 0; self.errors = 0; self.reproduced = 0; self.compared = 0; self.old_revenue = 0.0; self.new_revenue = 0.0
+        self.by_material = collections.defaultdict(lambda: [0, 0.0, 0.0]); self.worst = []
+
+    def add(self, records):
+        for record in records:
+            self.rows += 1
+            old_total = record["_old_total"]; new_total = record["_new_total"]
+            if record["_reproduced_total"] is not None and old_total is not None: self.compared += 1; self.reproduced += abs(record["_reproduced_total"] - old_total) <= REPRODUCED_TOLERANCE_RSD
+            if old_total is None or new_total is None: self.errors += 1; continue
+            self.old_revenue += old_total; self.new_revenue += new_total
+            material = self.by_material[record["material_name"]]; material[0] += 1; material[1] += old_total; material[2] += new_total
+            if record["price_drift_pct"] is None: continue
+            item = (abs(record["price_drift_pct"]), record["id"], record["price_drift_pct"], record["client_name"], record["product_name"])
+            if len(self.worst) < WORST_ROWS: heapq.heappush(self.worst, item)
+            elif item > self.worst[0]: heapq.heapreplace(self.worst, item)
+
+    def lines(self):
+        drift = _pct(self.new_revenue - self.old_revenue, self.old_revenue)
+        lines = [f"{self.rows} saved quotes, {self.errors} could not be re-priced; {self.reproduced}/{self.compared} reproduced from price history",
+                 f"Total {self.old_revenue:,.2f} RSD then vs {self.new_revenue:,.2f} RSD today" + (f" ({drift:+.2f} %)" if drift is not None else "")]
+        lines += [f"  {name or '-':<24} n={count:>7,}  {_pct(new - old, old) or 0.0:+7.2f} %" for name, (count, old, new) in sorted(self.by_material.items(), key=lambda item: str(item[0]))]
+        lines += [f"  #{row_id:<7} {pct:+8.2f} %  {client or ''} / {product or ''}" for _, row_id, pct, client, product in sorted(self.worst, reverse=True)]
+        return lines
+
+
+def run_requote(output_path, settings=None, materials=None, timeline=None, chunk_size=1000, workers=1, filters=None):
+    """Strimuje istoriju kroz engine i upisuje izveštaj. Vraća DriftSummary."""
+    timeline = timeline if timeline is not None else PriceTimeline([]); summary = DriftSummary(); writer = ResultWriter(output_path)
+    try:
+        chunks = iter_calculation_chunks(chunk_size, filters)
+        if workers <= 1: results = (requote_rows(rows, settings, materials, timeline) for rows in chunks)
+        else: results = _parallel_results(chunks, settings, materials, timeline, workers)
+        for records in results:
+            summary.add(records); writer.write([{key: record[key] for key in DRIFT_COLUMNS} for record in records])
+    finally:
+        writer.close()
+    return summary
+
+
+def _parallel_results(chunks, settings, materials, timeline, workers):
+    """Kao batch_cli: najviše 2 bloka po procesu su u letu, redosled izlaza prati id."""
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(settings, materials, timeline)) as pool:
+        pending = collections.deque()
+        for rows in chunks:
+            pending.append(pool.submit(_requote_chunk, rows))
+            if len(pending) >= workers * 2: yield pending.popleft().result()
+        while pending: yield pending.popleft().result()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Re-price saved quotes at today's prices and report the drift.")
+    parser.add_argument("-o", "--output", default="-", help="Drift report (.csv or .jsonl), default stdout (JSONL)")
+    parser.add_argument("--db", default=None, help=f"SQLite database (default {db.DB_FILE})")
+    parser.add_argument("--client", default=None, help="Only clients starting with this text")
+    parser.add_argument("--product", default=None, help="Only products starting with this text")
+    parser.add_argument("--material", default=None, help="Only this material")
+    parser.add_argument("--since", type=datetime.date.fromisoformat, default=None, metavar="YYYY-MM-DD")
+    parser.add_argument("--until", type=datetime.date.fromisoformat, default=None, metavar="YYYY-MM-DD")
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes (0 = all cores)")
+    parser.add_argument("--snapshot", default=None, metavar="TIMESTAMP", help="Only print the settings and material prices valid at this UTC time (YYYY-MM-DD HH:MM:SS)")
+    args = parser.parse_args(argv)
+    if args.db: db.DB_FILE = args.db
+    if not os.path.exists(db.DB_FILE): parser.error(f"Database not found: {db.DB_FILE}")
+    if not db.init_db(): parser.error(f"Could not migrate database: {db.DB_FILE}")
+    changes = db.load_price_history()
+    if changes is None: parser.error("Could not read price_history from the database")
+    timeline = PriceTimeline(changes)
+    if args.snapshot:
+        settings, materials = timeline.snapshot_at(args.snapshot)
+        print(json.dumps({"timestamp": args.snapshot, "settings": settings, "materials": materials}, indent=2, ensure_ascii=False)); return 0
+    settings = db.load_settings_from_db() or {}; materials = db.load_materials_from_db() or {}
+    filters = {"client": args.client, "product": args.product, "material": args.material, "date_from": args.since, "date_to": args.until}
+    workers = args.workers if args.workers > 0 else (os.cpu_count() or 1)
+    start = time.perf_counter()
+    try: summary = run_requote(args.output, settings, materials, timeline, chunk_size=max(1, args.chunk_size), workers=workers, filters=filters)
+    except RuntimeError as e: print(f"Error: {e}", file=sys.stderr); return 1
+    elapsed = time.perf_counter() - start
+    for line in summary.lines(): print(line, file=sys.stderr)
+    print(f"Re-priced {summary.rows} quotes in {elapsed:.2f} s ({summary.rows / elapsed if elapsed > 0 else 0:,.0f} quotes/s)", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+"""Kapacitet mašina: red prihvaćenih i ponuđenih poslova i procena roka isporuke.
+
+Vreme se računa u radnim minutima (samo smene radnim danima), a WorkCalendar
+ih pretvara u datum i vreme preko kumulativne tabele smena (bisect, tabela se
+produžava po potrebi). PressBoard simulira red: poslovi idu redom prioriteta
+(prihvaćeni pre ponuđenih, pa manji priority, pa redosled unosa) i svaki dobija
+mašinu koja se najranije oslobađa (heap po mašinama). Trajanje posla je
+total_time_min iz kalkulacije (priprema + proizvodnja + pranje).
+
+Nova ponuda ide iza svih poslova u redu, pa je procena samo najranije
+slobodna mašina iz heap-a (bez ponovne simulacije). Dodavanje posla sa nižim
+prioritetom od svih se takođe upisuje odmah; samo posao koji preskače druge
+(npr. prihvaćen posao dok ima ponuđenih) označava raspored za ponovnu
+simulaciju, koja se radi lenjo pri sledećem čitanju.
+
+get_press_board() drži jedan PressBoard po procesu (i putanji baze) i gradi ga
+ponovo samo kada se promeni verzija press_jobs/settings tabela u bazi (triggeri
+u db.py), kapacitet iz podešavanja ili kada raspored zastari (BOARD_MAX_AGE_S,
+jer se radni minuti broje od trenutka izgradnje). add_job() upisuje posao u bazu
+i u isti PressBoard, pa sledeći rerun ne učitava i ne simulira red ispočetka.
+
+    python scheduler.py --quote 480 --quote 960
+    python scheduler.py --board
+"""
+import argparse
+import bisect
+import datetime
+import heapq
+import sys
+import threading
+import time
+import db
+
+SHIFT_START_HOUR = 6
+SHIFT_HOURS_PER_DAY = 16  # Dve smene
+WORKDAYS = (0, 1, 2, 3, 4)  # Ponedeljak-petak
+PRESS_COUNT = 1
+DISPATCH_WORKDAYS = 1  # Isporuka je sledeći radni dan posle završetka proizvodnje
+STATUS_ORDER = {"accepted": 0, "quoted": 1}
+CALENDAR_CHUNK_DAYS = 366
+DATE_FORMAT = "%d.%m.%Y"
+BOARD_MAX_AGE_S = 300.0
+CAPACITY_SETTINGS = {"press_count": PRESS_COUNT, "shift_start_hour": SHIFT_START_HOUR, "shift_hours_per_day": SHIFT_HOURS_PER_DAY}
+
+
+class WorkCalendar:
+    """Radni minuti od trenutka start <-> datum i vreme, za smenu od shift_start_hour u trajanju shift_hours."""
+
+    def __init__(self, start, shift_start_hour=SHIFT_START_HOUR, shift_hours=SHIFT_HOURS_PER_DAY, workdays=WORKDAYS):
+        if not 0 < shift_hours <= 24 or not workdays: raise ValueError("Shift must be 0-24 h long on at least one weekday")
+        self.start = start; self.shift_start_hour = shift_start_hour; self.shift_minutes = shift_hours * 60.0; self.workdays = frozenset(workdays)
+        self._window_starts = []; self._cumulative = [0.0]; self._next_day = start.date()
+        self._extend(CALENDAR_CHUNK_DAYS)
+
+    def _extend(self, days):
+        for _ in range(days):
+            day = self._next_day; self._next_day += datetime.timedelta(days=1)
+            if day.weekday() not in self.workdays: continue
+            window_start = datetime.datetime.combine(day, datetime.time()) + datetime.timedelta(hours=self.shift_start_hour)
+            window_end = window_start + datetime.timedelta(minutes=self.shift_minutes)
+            if window_end <= self.start: continue
+            window_start = max(window_start, self.start)
+            self._window_starts.append(window_start); self._cumulative.append(self._cumulative[-1] + (window_end - window_start).total_seconds() / 60.0)
+
+    def to_datetime(self, minutes, is_end=False):
+        """Datum i vreme posle `minutes` radnih minuta. Kraj posla na granici smene ostaje u toj smeni (is_end)."""
+        while self._cumulative[-1] < minutes or (not is_end and self._cumulative[-1] == minutes): self._extend(CALENDAR_CHUNK_DAYS)
+        index = (bisect.bisect_left if is_end else bisect.bisect_right)(self._cumulative, minutes) - 1
+        index = min(max(index, 0), len(self._window_starts) - 1)
+        return self._window_starts[index] + datetime.timedelta(minutes=minutes - self._cumulative[index])
+
+    def delivery_date(self, minutes):
+        """Datum isporuke: DISPATCH_WORKDAYS radnih dana posle dana kada se posao završi."""
+        day = self.to_datetime(minutes, is_end=True).date(); remaining = DISPATCH_WORKDAYS
+        while remaining > 0:
+            day += datetime.timedelta(days=1)
+            if day.weekday() in self.workdays: remaining -= 1
+        return day
+
+
+class PressBoard:
+    """Raspored poslova na mašinama. jobs su rečnici kao iz db.load_press_jobs() (duration_min, status, priority, press).
+    Deli se između sesija (get_press_board), pa javne metode rade pod lock-om."""
+
+    def __init__(self, jobs=(), presses=PRESS_COUNT, calendar=None, now=None):
+        self.presses = max(1, int(presses)); self.calendar = calendar or WorkCalendar(now or datetime.datetime.now())
+        self.jobs = [dict(job) for job in jobs]; self._sequence = len(self.jobs); self._dirty = True
+        self._free_at = []; self._tail_key = None; self._lock = threading.RLock()
+
+    @staticmethod
+    def _order_key(job, sequence):
+        return (STATUS_ORDER.get(job.get("status"), len(STATUS_ORDER)), int(job.get("priority") or 0), sequence)
+
+    def _simulate(self):
+        """Cela simulacija: heap poslova po prioritetu, svaki na mašinu koja se najranije oslobađa."""
+        queue = [(self._order_key(job, i), i) for i, job in enumerate(self.jobs)]; heapq.heapify(queue)
+        free_at = [0.0] * self.presses; presses = [(0.0, press) for press in range(self.presses)]; self._tail_key = None
+        while queue:
+            key, i = heapq.heappop(queue); job = self.jobs[i]
+            pinned = job.get("press")
+            if pinned is not None and 0 <= int(pinned) < self.presses: press = int(pinned); start = free_at[press]
+            else:
+                while presses[0][0] != free_at[presses[0][1]]: heapq.heappop(presses) # Zastareli unosi posle fiksiranih poslova
+                start, press = heapq.heappop(presses)
+            job["_press"] = press; job["_start_min"] = start; job["_end_min"] = free_at[press] = start + float(job["duration_min"])
+            heapq.heappush(presses, (free_at[press], press)); self._tail_key = key
+        self._free_at = free_at; self._dirty = False
+
+    def _ensure(self):
+        if self._dirty: self._simulate()
+
+    def earliest_slot(self, duration_min):
+        """(mašina, početak, kraj u radnim minutima) za novu ponudu iza svih poslova u redu, bez izmene reda."""
+        with self._lock: self._ensure(); press = min(range(self.presses), key=lambda p: (self._free_at[p], p)); start = self._free_at[press]
+        return press, start, start + float(duration_min)
+
+    def quote(self, duration_min):
+        """Procena za novu ponudu: rečnik sa press, start, end (datetime) i delivery_date (date)."""
+        press, start, end = self.earliest_slot(duration_min)
+        return {"press": press, "start": self.calendar.to_datetime(start), "end": self.calendar.to_datetime(end, is_end=True), "delivery_date": self.calendar.delivery_date(end)}
+
+    def add(self, job):
+        """Dodaje posao u red. Ako ide iza svih (najniži prioritet), upisuje se odmah; inače se raspored lenjo ponovo simulira."""
+        with self._lock:
+            self._ensure(); job = dict(job); key = self._order_key(job, self._sequence); self._sequence += 1; self.jobs.append(job)
+            pinned = job.get("press")
+            if (self._tail_key is not None and key < self._tail_key) or (pinned is not None and not 0 <= int(pinned) < self.presses): self._dirty = True; return job
+            press = int(pinned) if pinned is not None else min(range(self.presses), key=lambda p: (self._free_at[p], p))
+            job["_press"] = press; job["_start_min"] = self._free_at[press]; job["_end_min"] = self._free_at[press] = self._free_at[press] + float(job["duration_min"]); self._tail_key = key
+            return job
+
+    def schedule(self):
+        """Svi poslovi sa press, start, end (datetime) i delivery_date, po vremenu početka."""
+        with self._lock: self._ensure(); jobs = [dict(job) for job in self.jobs]
+        rows = [dict({key: value for key, value in job.items() if not key.startswith("_")}, press=job["_press"], start=self.calendar.to_datetime(job["_start_min"]), end=self.calendar.to_datetime(job["_end_min"], is_end=True), delivery_date=self.calendar.delivery_date(job["_end_min"])) for job in jobs]
+        return sorted(rows, key=lambda row: (row["start"], row["press"]))
+
+    def load_minutes(self):
+        """Zauzetost po mašini u radnim minutima (od sada)."""
+        with self._lock: self._ensure(); return list(self._free_at)
+
+
+def board_from_db(settings=None, now=None):
+    """PressBoard iz press_jobs tabele i podešavanja kapaciteta (press_count, shift_start_hour, shift_hours_per_day).
+    Vraća None ako baza nije dostupna."""
+    settings = settings if settings is not None else (db.load_settings_from_db() or {}); jobs = db.load_press_jobs()
+    if jobs is None: return None
+    press_count, shift_start_hour, shift_hours = _capacity(settings)
+    return PressBoard(jobs, presses=int(press_count), calendar=WorkCalendar(now or datetime.datetime.now(), shift_start_hour=shift_start_hour, shift_hours=shift_hours))
+
+
+def _capacity(settings):
+    return tuple(float(settings.get(key, default)) for key, default in CAPACITY_SETTINGS.items())
+
+
+_boards = {}; _boards_lock = threading.Lock()
+
+def get_press_board(settings=None):
+    """Deljeni PressBoard za tekući db.DB_FILE (jedan po procesu i putanji baze). Gradi se ponovo (board_from_db) samo
+    kada se promeni db.load_press_board_version() ili kapacitet u settings, ili posle BOARD_MAX_AGE_S. None ako baza nije dostupna."""
+    settings = settings if settings is not None else (db.load_settings_from_db() or {}); version = db.load_press_board_version()
+    if version is None: return None
+    key = (version, _capacity(settings))
+    with _boards_lock:
+        cached = _boards.get(db.DB_FILE)
+        if cached is not None and cached[0] == key and time.monotonic() - cached[1] < BOARD_MAX_AGE_S: return cached[2]
+        board = board_from_db(settings) # Verzija je pročitana pre poslova: izmena u međuvremenu samo izaziva još jednu izgradnju
+        if board is not None: _boards[db.DB_FILE] = (key, time.monotonic(), board)
+        return board
+
+
+def add_job(board, client_name, product_name, quantity, duration_min, status="quoted", priority=0, press=None, on_error=None):
+    """db.add_press_job, pa isti posao u board (PressBoard.add, bez ponovnog učitavanja i simulacije). Ako je board deljeni
+    iz get_press_board i baza se u međuvremenu nije menjala, ostaje važeći za novu verziju. Vraća id posla ili None."""
+    with _boards_lock:
+        job_id = db.add_press_job(client_name, product_name, quantity, duration_min, status, priority, press, on_error=on_error)
+        if job_id is None: return None
+        board.add({"id": job_id, "created": datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%d %H:%M:%S"), "client_name": client_name, "product_name": product_name, "quantity": quantity, "status": status, "priority": int(priority), "duration_min": float(duration_min), "press": press})
+        cached = _boards.get(db.DB_FILE)
+        if cached is not None and cached[2] is board:
+            (data_version, jobs_version), capacity = cached[0]; version = db.load_press_board_version()
+            if version == (data_version, jobs_version + 1): _boards[db.DB_FILE] = ((version, capacity), cached[1], board)
+            else: del _boards[db.DB_FILE] # Bazu je menjao i neko drugi: sledeći get_press_board gradi ispočetka
+    return job_id
+
+
+def delivery_dates(board, durations_min):
+    """Datum isporuke (tekst DATE_FORMAT) za svaku od nezavisnih ponuda (npr. lestvica količina), redom; None bez board-a."""
+    if board is None: return [None] * len(durations_min)
+    return [board.quote(duration)["delivery_date"].strftime(DATE_FORMAT) for duration in durations_min]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Press capacity: show the job board or estimate delivery dates for new quotes.")
+    parser.add_argument("--db", default=None, help=f"SQLite database (default {db.DB_FILE})")
+    parser.add_argument("--quote", type=float, action="append", default=[], metavar="MINUTES", help="Estimate a new job of this many machine minutes (repeatable)")
+    parser.add_argument("--board", action="store_true", help="Print the simulated schedule of accepted and quoted jobs")
+    args = parser.parse_args(argv)
+    if args.db: db.DB_FILE = args.db
+    if not db.init_db(): parser.error(f"Could not open database: {db.DB_FILE}")
+    board = get_press_board()
+    if board is None: parser.error("Could not read press_jobs from the database")
+    print(f"{len(board.jobs)} jobs on {board.presses} press(es); load {', '.join(f'{minutes / 60:.1f} h' for minutes in board.load_minutes())}")
+    if args.board:
+        for row in board.schedule(): print(f"#{row['id']:<6} {row['status']:<8} press {row['press'] + 1}  {row['start']:%d.%m.%Y %H:%M} -> {row['end']:%d.%m.%Y %H:%M}  {row['client_name'] or ''} / {row['product_name'] or ''}")
+    for minutes in args.quote:
+        estimate = board.quote(minutes)
+        print(f"{minutes:.0f} min -> press {estimate['press'] + 1}, {estimate['start']:%d.%m.%Y %H:%M} -> {estimate['end']:%d.%m.%Y %H:%M}, delivery {estimate['delivery_date']:%d.%m.%Y}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
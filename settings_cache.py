@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""Keš podešavanja i cena materijala na nivou procesa, sa verzijom iz baze.
+
+Sve Streamlit sesije u procesu dele jedan SettingsCache. Baza se pita samo za
+data_version (jedan red), najviše jednom u CHECK_INTERVAL_S, a tabele se ponovo
+učitavaju tek kada se verzija promeni (triggeri u db.py je povećavaju pri svakoj
+izmeni). Izmene iz widget-a odmah menjaju keš, a u bazu se upisuju odloženo
+(DEBOUNCE_S posle poslednje izmene, ali najviše MAX_WAIT_S posle prve) i spojeno:
+više brzih izmena istog ključa postaje jedan upis, a sve izmene iz prozora jedna
+transakcija.
+"""
+import atexit
+import threading
+import time
+import db
+
+CHECK_INTERVAL_S = 1.0
+DEBOUNCE_S = 0.5
+MAX_WAIT_S = 5.0  # Neprekidan niz izmena ipak se upisuje najkasnije posle ovoliko sekundi
+
+
+class SettingsCache:
+    """Deljeni keš settings/materials tabela. version je (data_version iz baze, broj lokalnih izmena)."""
+
+    def __init__(self, check_interval_s=CHECK_INTERVAL_S, debounce_s=DEBOUNCE_S, max_wait_s=MAX_WAIT_S):
+        self.check_interval_s = check_interval_s; self.debounce_s = debounce_s; self.max_wait_s = max_wait_s
+        self._lock = threading.RLock(); self._timer = None; self._first_pending_at = 0.0
+        self.settings = None; self.materials = None; self.db_version = None; self.local_version = 0; self._checked_at = 0.0
+        self._pending_settings = {}; self._pending_materials = {}; self._in_flight_settings = {}; self._in_flight_materials = {}
+        self.last_error = None
+
+    @property
+    def version(self):
+        return (self.db_version, self.local_version)
+
+    def snapshot(self):
+        """Vraća (verzija, settings, materials). settings/materials su None ako baza nije dostupna."""
+        with self._lock:
+            if self.settings is None or time.monotonic() - self._checked_at >= self.check_interval_s: self._refresh()
+            return self.version, (dict(self.settings) if self.settings is not None else None), (dict(self.materials) if self.materials is not None else None)
+
+    def _refresh(self):
+        db_version = db.load_data_version(); self._checked_at = time.monotonic()
+        if db_version is not None and db_version == self.db_version and self.settings is not None: return
+        settings = db.load_settings_from_db(); materials = db.load_materials_from_db()
+        # Izmene koje još nisu upisane imaju prednost nad onim što je u bazi
+        if settings is not None: settings.update(self._in_flight_settings); settings.update(self._pending_settings); self.settings = settings
+        if materials is not None:
+            for overlay in (self._in_flight_materials, self._pending_materials): materials.update({name: price for name, price in overlay.items() if name in materials})
+            self.materials = materials
+        if settings is not None and materials is not None: self.db_version = db_version
+
+    def invalidate(self):
+        """Primorava ponovno učitavanje pri sledećem snapshot() (npr. posle dodavanja materijala)."""
+        with self._lock: self.db_version = None; self._checked_at = 0.0
+
+    def set_setting(self, key, value):
+        with self._lock:
+            if self.settings is not None: self.settings[key] = value
+            self._pending_settings[key] = value; self.local_version += 1; self._schedule_flush()
+
+    def set_material_price(self, name, price):
+        with self._lock:
+            if self.materials is not None: self.materials[name] = price
+            self._pending_materials[name] = price; self.local_version += 1; self._schedule_flush()
+
+    def _schedule_flush(self):
+        """Debounce: svaka izmena pomera upis na debounce_s od sebe, ali ne dalje od max_wait_s od prve izmene na čekanju."""
+        now = time.monotonic()
+        if self._timer is None: self._first_pending_at = now
+        else: self._timer.cancel()
+        delay = max(0.0, min(self.debounce_s, self._first_pending_at + self.max_wait_s - now))
+        self._timer = threading.Timer(delay, self.flush); self._timer.daemon = True; self._timer.start()
+
+    def flush(self):
+        """Upisuje sve izmene na čekanju u jednoj transakciji. Vraća True ako uspe (ili nema izmena)."""
+        with self._lock:
+            if self._timer is not None: self._timer.cancel(); self._timer = None
+            settings_items = self._in_flight_settings = dict(self._pending_settings); material_items = self._in_flight_materials = dict(self._pending_materials)
+            self._pending_settings.clear(); self._pending_materials.clear()
+        if not settings_items and not material_items: return True
+        errors = []
+        success = db.save_prices_batch(settings_items.items(), material_items.items(), on_error=errors.append)
+        with self._lock:
+            self._in_flight_settings = {}; self._in_flight_materials = {}
+            if success: self.last_error = None; self._checked_at = 0.0 # Sledeći snapshot preuzima novu data_version
+            else:
+                self.last_error = errors[0] if errors else "Unknown DB error"
+                # Vrati na čekanje ono što u međuvremenu nije zamenjeno novijom vrednošću
+                for key, value in settings_items.items(): self._pending_settings.setdefault(key, value)
+                for name, price in material_items.items(): self._pending_materials.setdefault(name, price)
+        return success
+
+    def has_pending(self):
+        with self._lock: return bool(self._pending_settings or self._pending_materials)
+
+
+_caches = {}; _caches_lock = threading.Lock()
+
+def get_settings_cache():
+    """Vraća keš za tekući db.DB_FILE (jedan po procesu i putanji baze)."""
+    with _caches_lock:
+        if db.DB_FILE not in _caches: _caches[db.DB_FILE] = SettingsCache()
+        return _caches[db.DB_FILE]
+
+@atexit.register
+def flush_all():
+    """Pri gašenju procesa upisuje sve izmene na čekanju."""
+    for cache in list(_caches.values()): cache.flush()
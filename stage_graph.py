@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""Inkrementalna kalkulacija: graf imenovanih faza sa deklarisanim ulazima.
+
+Svaka faza je čista funkcija svojih ulaza (ulazni parametri ili izlazi drugih
+faza). StageGraph pamti poslednje ulaze i izlaz svake faze i pri evaluate()
+ponovo računa samo fazu čiji se neki ulaz promenio. Ako ponovo izračunata faza
+da isti izlaz kao ranije, faze ispod nje se ne računaju (early cutoff). Tako
+izmena koeficijenta profita računa samo profit i rezultat, a izmena cene boje
+samo boju, zbir troškova, profit i rezultat.
+
+calculation_graph() je run_single_calculation razložen na faze (cilindar,
+trake, geometrija, potrošnja, vreme, boja/lak, ploče, materijal, rad, alat,
+trošak, profit, rezultat) i daje isti CalculationResult. Faze su iste funkcije
+engine.calculate_* koje sastavlja run_single_calculation, pa se formula menja samo
+u engine.py; `python benchmark.py --verify` proverava i povezivanje faza.
+"""
+import engine
+
+CALCULATION_INPUTS = ('quantity', 'template_width_W', 'template_height_H', 'is_blank', 'num_colors', 'is_uv_varnish', 'price_per_m2', 'machine_speed_m_min', 'selected_tool_key', 'profit_coefficient', 'ink_price_kg', 'varnish_price_kg', 'plate_price_color', 'labor_price_hour', 'tool_price_semi', 'tool_price_rot')
+
+
+class Stage:
+    __slots__ = ('name', 'inputs', 'func')
+
+    def __init__(self, name, inputs, func):
+        self.name = name; self.inputs = tuple(inputs); self.func = func
+
+
+def _same(old, new):
+    return old is new or (type(old) is type(new) and old == new)
+
+
+class StageGraph:
+    """Memoizovan graf faza. last_recomputed su faze izračunate u poslednjem evaluate(), a recompute_counts ukupno po fazi."""
+
+    def __init__(self, inputs, stages):
+        self.inputs = tuple(inputs); self.stages = []; known = set(self.inputs)
+        for stage in stages: # Faze moraju da budu navedene posle faza od kojih zavise (topološki redosled)
+            missing = [name for name in stage.inputs if name not in known]
+            if missing: raise ValueError(f"Stage {stage.name!r} depends on unknown or later inputs: {missing}")
+            if stage.name in known: raise ValueError(f"Duplicate stage or input name: {stage.name!r}")
+            self.stages.append(stage); known.add(stage.name)
+        self._memo = {}; self.last_recomputed = []; self.recompute_counts = {stage.name: 0 for stage in self.stages}
+
+    def evaluate(self, **values):
+        """Vraća rečnik {ime: vrednost} za sve ulaze i faze. Ulazi koji nedostaju podižu KeyError."""
+        values = {name: values[name] for name in self.inputs}; recomputed = []
+        for stage in self.stages:
+            args = tuple(values[name] for name in stage.inputs); memo = self._memo.get(stage.name)
+            if memo is not None and len(memo[0]) == len(args) and all(_same(old, new) for old, new in zip(memo[0], args)): values[stage.name] = memo[1]; continue
+            output = stage.func(*args)
+            if memo is not None and _same(memo[1], output): output = memo[1] # Isti izlaz: ista referenca, pa niže faze ostaju memoizovane
+            self._memo[stage.name] = (args, output); values[stage.name] = output; recomputed.append(stage.name); self.recompute_counts[stage.name] += 1
+        self.last_recomputed = recomputed
+        return values
+
+    def invalidate(self, stage_name=None):
+        """Briše zapamćeni izlaz jedne faze (ili svih), npr. posle promene konstanti engine-a."""
+        if stage_name is None: self._memo.clear()
+        else: self._memo.pop(stage_name, None)
+
+
+# --- run_single_calculation po fazama: iste engine.calculate_* funkcije, samo memoizovane pojedinačno ---
+def _geometry(cylinder, lanes, template_width_W, template_height_H, quantity):
+    return engine.calculate_geometry(cylinder[0], lanes, template_width_W, template_height_H, quantity)
+
+
+def calculation_graph():
+    """Novi graf za jednu sesiju/UI. evaluate(**ulazi iz CALCULATION_INPUTS) vraća između ostalog
+    'cylinder' (kao find_cylinder_specifications), 'lanes' i 'result' (kao run_single_calculation)."""
+    return StageGraph(CALCULATION_INPUTS, [
+        Stage("cylinder", ["template_width_W"], engine.find_cylinder_specifications),
+        Stage("lanes", ["template_height_H"], lambda height: engine.calculate_number_across_width(height, engine.WORKING_WIDTH, engine.WIDTH_GAP)),
+        Stage("geometry", ["cylinder", "lanes", "template_width_W", "template_height_H", "quantity"], _geometry),
+        Stage("consumption", ["geometry", "is_blank", "num_colors"], engine.calculate_consumption),
+        Stage("time", ["geometry", "is_blank", "num_colors", "machine_speed_m_min"], engine.calculate_time),
+        Stage("ink", ["geometry", "is_blank", "num_colors", "is_uv_varnish", "ink_price_kg", "varnish_price_kg"], engine.calculate_ink_varnish_cost),
+        Stage("plates", ["is_blank", "num_colors", "plate_price_color"], engine.calculate_plate_cost),
+        Stage("material_cost", ["consumption", "price_per_m2"], engine.calculate_material_cost),
+        Stage("labor", ["time", "labor_price_hour"], engine.calculate_labor_cost),
+        Stage("tool", ["selected_tool_key", "tool_price_semi", "tool_price_rot"], engine.calculate_tool_cost),
+        Stage("production_cost", ["ink", "plates", "material_cost", "labor", "tool"], engine.calculate_production_cost),
+        Stage("profit", ["material_cost", "production_cost", "profit_coefficient", "quantity"], engine.calculate_profit),
+        Stage("result", ["geometry", "consumption", "time", "ink", "plates", "material_cost", "labor", "tool", "production_cost", "profit"], engine.build_calculation_result),
+    ])
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""Odloženi (write-behind) upis sačuvanih kalkulacija u bazu.
+
+Kalkulacije se skupljaju u red i upisuju jednim executemany u jednoj
+transakciji (jedan commit) kada se skupi BATCH_SIZE zapisa ili kada prođe
+FLUSH_INTERVAL_S od prvog zapisa na čekanju. submit() odmah vraća Future koji
+dobija True/False kad blok bude upisan, a on_error(e) se poziva sa greškom iz
+baze. save() upisuje odmah i čeka (dugme u UI-ju). Pri gašenju procesa sve na
+čekanju se upisuje (atexit), kao kod settings_cache.py.
+
+Ako blok ne uspe zbog samog zapisa (ROW_ERRORS, npr. loš tip ili UNIQUE),
+odmah se upisuje red po red, pa jedan loš red ne odbacuje ceo blok. Ostale
+greške (npr. "database is locked" posle busy_timeout-a) važe za ceo blok: red
+po red bi samo ponovio istu grešku N puta, pa se zapisi iz submit() vraćaju na
+početak reda i tajmer ih ponovo upisuje posle RETRY_DELAY_S (RETRIES puta).
+save() se ne ponavlja: UI odmah dobija grešku, bez čekanja pod _flush_lock.
+Neupisani zapisi se sabiraju u failed (nikad se ne resetuje); drain() čeka i
+ponovne pokušaje (CLI, gašenje procesa).
+"""
+import atexit
+import concurrent.futures
+import sqlite3
+import threading
+import time
+import db
+
+BATCH_SIZE = 500
+FLUSH_INTERVAL_S = 1.0
+RETRY_DELAY_S = 0.5
+RETRIES = 1
+ROW_ERRORS = (TypeError, ValueError, AttributeError, sqlite3.IntegrityError, sqlite3.InterfaceError, sqlite3.DataError) # Greške jednog zapisa
+
+
+class CalculationWriter:
+    """Red kalkulacija za jednu bazu. failed je ukupan broj neupisanih zapisa, a last_error poslednja greška upisa (ili None)."""
+
+    def __init__(self, batch_size=BATCH_SIZE, flush_interval_s=FLUSH_INTERVAL_S):
+        self.batch_size = batch_size; self.flush_interval_s = flush_interval_s
+        self._lock = threading.Lock(); self._flush_lock = threading.Lock(); self._timer = None
+        self._pending = []; self.last_error = None; self.written = 0; self.batches = 0; self.failed = 0
+
+    def submit(self, calc_data, on_error=None, retries=RETRIES):
+        """Stavlja calculation_data_for_db u red. Vraća Future (True ako je upisano, False ako nije).
+        retries je broj ponovnih pokušaja (tajmerom) posle greške koja važi za ceo blok."""
+        future = concurrent.futures.Future()
+        with self._lock:
+            self._pending.append((dict(calc_data), future, on_error, retries)); full = len(self._pending) >= self.batch_size
+            if not full and self._timer is None:
+                self._timer = threading.Timer(self.flush_interval_s, self.flush); self._timer.daemon = True; self._timer.start()
+        if full: self.flush()
+        return future
+
+    def save(self, calc_data, on_error=None):
+        """Upisuje odmah (zajedno sa svim na čekanju) i vraća True ako uspe, False ako ne.
+        on_error se poziva u niti pozivaoca (blok može da upiše i nit tajmera), pa UI sme da prikaže grešku."""
+        errors = []; future = self.submit(calc_data, errors.append, retries=0); self.flush()
+        success = future.result()
+        if not success and on_error: on_error(errors[0] if errors else self.last_error)
+        return success
+
+    @staticmethod
+    def _save(save, data):
+        """(uspeh, greška) za jedan upis; i izuzetak van sqlite3 (npr. pri pretvaranju reda) je neuspeh, ne izgubljen Future."""
+        errors = []
+        try: success = save(data, on_error=errors.append)
+        except Exception as e: success = False; errors.append(e)
+        return success, None if success else (errors[0] if errors else "Unknown DB error")
+
+    def flush(self):
+        """Upisuje sve na čekanju u jednoj transakciji (ako ne uspe zbog zapisa, red po red). Vraća True ako je sve upisano."""
+        with self._flush_lock: # Blokovi se upisuju redom kojim su predati
+            with self._lock:
+                if self._timer is not None: self._timer.cancel(); self._timer = None
+                batch = self._pending; self._pending = []
+            if not batch: return True
+            success, error = self._save(db.save_calculations_batch, [entry[0] for entry in batch])
+            if success: results = [(True, None)] * len(batch); transactions = 1
+            elif isinstance(error, ROW_ERRORS): results = [self._save(db.save_calculation_to_db, entry[0]) for entry in batch]; transactions = len(batch)
+            else: results = [(False, error)] * len(batch); transactions = 0
+            # Prolazna greška: zapisi sa preostalim pokušajima se vraćaju u red (ispred novih), tajmer ih ponovo upisuje
+            retry = [not ok and entry[3] > 0 and not isinstance(row_error, ROW_ERRORS) for entry, (ok, row_error) in zip(batch, results)]
+            failed = sum(1 for (ok, _), again in zip(results, retry) if not ok and not again)
+            with self._lock:
+                self.written += sum(1 for ok, _ in results if ok); self.batches += transactions; self.failed += failed
+                if not all(ok for ok, _ in results): self.last_error = next(row_error for ok, row_error in results if not ok)
+                if any(retry):
+                    self._pending[:0] = [(calc_data, future, on_error, retries - 1) for (calc_data, future, on_error, retries), again in zip(batch, retry) if again]
+                    if self._timer is not None: self._timer.cancel()
+                    self._timer = threading.Timer(RETRY_DELAY_S, self.flush); self._timer.daemon = True; self._timer.start()
+        for (_, future, on_error, _), (ok, row_error), again in zip(batch, results, retry):
+            if again: continue
+            if not ok and on_error: on_error(row_error)
+            future.set_result(ok)
+        return failed == 0 and not any(retry)
+
+    def drain(self):
+        """flush() dok ništa ne ostane na čekanju, uključujući ponovne pokušaje (čeka van _flush_lock). Vraća True ako ništa nije izgubljeno."""
+        failed_before = self.failed
+        while True:
+            self.flush()
+            if not self.pending_count(): return self.failed == failed_before
+            time.sleep(RETRY_DELAY_S)
+
+    def pending_count(self):
+        with self._lock: return len(self._pending)
+
+
+_writers = {}; _writers_lock = threading.Lock()
+
+def get_calculation_writer():
+    """Vraća red za tekući db.DB_FILE (jedan po procesu i putanji baze)."""
+    with _writers_lock:
+        if db.DB_FILE not in _writers: _writers[db.DB_FILE] = CalculationWriter()
+        return _writers[db.DB_FILE]
+
+@atexit.register
+def flush_all():
+    """Pri gašenju procesa upisuje sve kalkulacije na čekanju."""
+    for writer in list(_writers.values()): writer.drain()